@@ -0,0 +1,491 @@
+"""
+效能微基準測試
+用法: python benchmark.py row_grouping [--lines 10000] [--repeat 5]
+      python benchmark.py normalize [--extra-rules 2000] [--repeat 5]
+      python benchmark.py keywords [--extra-keywords 500] [--repeat 5]
+      python benchmark.py contact [--segments 5000] [--repeat 5]
+      python benchmark.py memory [--pages 200] [--lines 400]
+      python benchmark.py output [--repeat 5]
+      python benchmark.py edit_distance [--chars 5000] [--repeat 3]
+      python benchmark.py preprocess [--assets assets] [--repeat 3]
+"""
+
+import argparse
+import glob
+import json
+import random
+import time
+import tracemalloc
+from difflib import SequenceMatcher
+from types import SimpleNamespace
+from typing import Callable, List, Tuple
+
+import ocr_processor
+import text_metrics
+from keyword_matcher import KeywordMatcher
+from ocr_processor import FileManager, OCRProcessor, OCRConfig, PageLines, TextLine, TextNormalizer, DEFAULT_TEXT_REPLACEMENTS
+
+
+def _timeit(fn: Callable, repeat: int) -> float:
+    """回傳 repeat 次中最快的一次耗時（秒）"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def synthetic_lines(total_lines: int, per_row: int, seed: int = 0) -> List[TextLine]:
+    """產生表格型頁面：每列 per_row 個儲存格，y 有小幅抖動，已依 (center_y, x1) 排序"""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(total_lines):
+        row, col = divmod(i, per_row)
+        y = row * 30 + rng.uniform(-4, 4)
+        x = col * 60 + rng.uniform(-5, 5)
+        lines.append(TextLine(f"cell{i}", [x, y, x + 50, y, x + 50, y + 12, x, y + 12]))
+    return sorted(lines, key=lambda l: (l.center_y, l.x1))
+
+
+def _group_lines_reference(lines: List[TextLine], tolerance: float) -> List[List[TextLine]]:
+    """舊版實作（每行重算群組平均），作為比較基準"""
+    if not lines:
+        return []
+    groups = []
+    current = [lines[0]]
+    for ln in lines[1:]:
+        avg_y = sum(l.center_y for l in current) / len(current)
+        if abs(ln.center_y - avg_y) <= tolerance:
+            current.append(ln)
+        else:
+            groups.append(sorted(current, key=lambda l: l.x1))
+            current = [ln]
+    if current:
+        groups.append(sorted(current, key=lambda l: l.x1))
+    return groups
+
+
+def bench_row_grouping(total_lines: int, repeat: int):
+    config = OCRConfig()
+    config.enable_cache = False
+    processor = OCRProcessor(config)
+    print(f"=== _group_lines_by_row（{total_lines} 行）===")
+    for per_row in (5, 50, 500):
+        lines = synthetic_lines(total_lines, per_row)
+        expected = _group_lines_reference(lines, config.y_tolerance)
+
+        page = PageLines.from_text_lines(lines)
+
+        def as_lines(groups):
+            return [[lines[i] for i in g] for g in groups]
+
+        config.row_grouping_numpy_threshold = 0
+        assert as_lines(processor._group_lines_by_row(page)) == expected
+        t_ref = _timeit(lambda: _group_lines_reference(lines, config.y_tolerance), repeat)
+        t_py = _timeit(lambda: processor._group_lines_by_row(page), repeat)
+        print(f"每列 {per_row:>4} 行: 舊版 {t_ref * 1000:9.2f} ms  累計和 {t_py * 1000:8.2f} ms", end="")
+
+        if ocr_processor.np is None:
+            print("  numpy 未安裝")
+            continue
+        config.row_grouping_numpy_threshold = 1
+        assert as_lines(processor._group_lines_by_row(page)) == expected
+        t_np = _timeit(lambda: processor._group_lines_by_row(page), repeat)
+        print(f"  numpy {t_np * 1000:8.2f} ms")
+
+
+def load_output_pages(pattern: str = "ocr_output_*.json") -> List[dict]:
+    pages = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.extend(json.load(f).get("pages", []))
+    return pages
+
+
+def _normalize_reference(lines: List[str], replacements: List[Tuple[str, str]]) -> List[str]:
+    """舊版實作（每條規則各做一次 str.replace），作為比較基準"""
+    def replace_all(text):
+        for old, new in replacements:
+            text = text.replace(old, new)
+        return text
+    return [replace_all(line) for line in lines]
+
+
+def bench_normalize(extra_rules: int, repeat: int):
+    pages = load_output_pages()
+    lines = []
+    for page in pages:
+        for key in ("reading_order_lines", "grouped_lines", "structured_lines"):
+            lines.extend(page.get(key) or [])
+        for key in ("page_text", "formatted_text"):
+            lines.extend((page.get(key) or "").split("\n"))
+    print(f"=== normalize_text_lines（{len(pages)} 頁，{len(lines)} 行）===")
+
+    rng = random.Random(0)
+    alphabet = "的一是在不了有和人這中大為上個國我以要他時來用們生到作地於出就分對成會可主發年動同工也能下過子說產種面而方後多定行學法所民得經十三之進著等部度家電力裡如水化高自二理起小物現實加量都兩體制機當使點從業本去把性好應開它合還因由其些然前外天政四日那社義事平形相全表間樣與關各重新線內數正心反你明看原又麼利比或但質氣第向道命此變條只沒結解問意建月公無系軍很情者最立代想已通並提直題黨程展五果料象員革位入常文總次品式活設及管特件長求老頭基資邊流路級少圖山統接知較將組見計別她手角期根論運農指幾九區強放決西被幹做必戰先回則任取據處理"
+    synthetic = [("".join(rng.choice(alphabet) for _ in range(rng.randint(2, 6))), "※") for _ in range(extra_rules)]
+    for label, rules in (("內建規則", list(DEFAULT_TEXT_REPLACEMENTS)),
+                         (f"內建 + {extra_rules} 條", list(DEFAULT_TEXT_REPLACEMENTS) + synthetic)):
+        normalizer = TextNormalizer(rules)
+        t_ref = _timeit(lambda: _normalize_reference(lines, rules), repeat)
+        t_new = _timeit(lambda: normalizer.normalize_lines(lines), repeat)
+        print(f"{label:>16}: 逐條 str.replace {t_ref * 1000:9.2f} ms  單次掃描 {t_new * 1000:8.2f} ms")
+
+
+def _first_keyword_reference(lines: List[str], keywords: List[str]) -> List[str]:
+    """舊版 _detect_kv_pairs 的關鍵字判斷（依序 kw in line），作為比較基準"""
+    found = []
+    for line in lines:
+        found.append(next((kw for kw in keywords if kw in line), None))
+    return found
+
+
+def _first_keyword_matcher(lines: List[str], matcher: KeywordMatcher) -> List[str]:
+    found = []
+    for line in lines:
+        best = None
+        for start, _, kw in matcher.iter_matches(line):
+            rank = (matcher.keywords[kw][0], start)
+            if best is None or rank < best[0]:
+                best = (rank, kw)
+        found.append(best[1] if best else None)
+    return found
+
+
+def bench_keywords(extra_keywords: int, repeat: int):
+    pages = load_output_pages()
+    lines = [line for page in pages for line in (page.get("grouped_lines") or [])]
+    print(f"=== 關鍵字比對（{len(pages)} 頁，{len(lines)} 行）===")
+    rng = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    base = list(OCRConfig().keywords)
+    synthetic = ["".join(rng.choice(letters) for _ in range(rng.randint(4, 9))) for _ in range(extra_keywords)]
+    for label, keywords in (("內建關鍵字", base), (f"內建 + {extra_keywords} 個", base + synthetic)):
+        matcher = KeywordMatcher((kw, rank) for rank, kw in enumerate(keywords))
+        assert _first_keyword_matcher(lines, matcher) == _first_keyword_reference(lines, keywords)
+        t_ref = _timeit(lambda: _first_keyword_reference(lines, keywords), repeat)
+        t_new = _timeit(lambda: _first_keyword_matcher(lines, matcher), repeat)
+        print(f"{label:>14}（{len(keywords):>4} 個）: 逐一 in {t_ref * 1000:8.2f} ms  trie {t_new * 1000:8.2f} ms")
+
+
+def _extract_contact_reference(processor: OCRProcessor, rows: List[dict]) -> dict:
+    """舊版 _extract_compact_contact（複製每個 segment，每次命中都掃描整頁），作為比較基準"""
+    email = phone = name = ""
+    segments = []
+    for r_idx, r in enumerate(rows):
+        for s in sorted(r.get("texts", []), key=lambda s: s.get("x1", 0)):
+            seg = s.copy()
+            seg["_row_idx"] = r_idx
+            seg["_center_x"] = (seg.get("x1", 0) + seg.get("x2", 0)) / 2
+            seg["_center_y"] = (seg.get("y1", 0) + seg.get("y2", 0)) / 2
+            segments.append(seg)
+    for seg in segments:
+        txt = seg.get("text", "")
+        if not email:
+            m = processor._re_email.search(txt)
+            if m:
+                email = m.group(0)
+        if not phone:
+            m2 = processor._re_phone.search(txt)
+            if m2:
+                phone = m2.group(0)
+        if email and phone:
+            break
+    name_kw = ['姓名', '中文姓名', 'name']
+    for seg in segments:
+        txt = seg.get("text", "")
+        for kw in name_kw:
+            if kw in txt:
+                row_idx = seg["_row_idx"]
+                candidates = [s for s in segments if s["_row_idx"] == row_idx and s["_center_x"] > seg["_center_x"]]
+                if candidates:
+                    name = candidates[0].get("text", "").strip()
+                    break
+                next_row_segs = [s for s in segments if s["_row_idx"] == row_idx + 1]
+                if next_row_segs:
+                    name = sorted(next_row_segs, key=lambda s: s["_center_x"])[0].get("text", "").strip()
+                    break
+        if name:
+            break
+    if not name:
+        for seg in segments:
+            txt = seg.get("text", "").strip()
+            if not txt or any(kw in txt for kw in name_kw):
+                continue
+            if processor._re_email.search(txt) or processor._re_phone.search(txt):
+                continue
+            if sum(ch.isdigit() for ch in txt) > 0:
+                continue
+            if 1 < len(txt) <= 30:
+                name = txt
+                break
+    return {"姓名": name or "", "手機": phone or "", "Email": email or ""}
+
+
+def synthetic_form(total_segments: int, per_row: int, label_every: int, seed: int = 0) -> List[TextLine]:
+    """
+    表單型頁面：每 label_every 個儲存格出現一個「姓名」標籤，其右側欄位空白（OCR 只讀到空白），
+    最後一列才有真正的姓名，舊版每個標籤都要掃描整頁
+    """
+    rng = random.Random(seed)
+    lines = []
+    for i in range(total_segments):
+        row, col = divmod(i, per_row)
+        x = col * 60 + rng.uniform(-3, 3)
+        y = row * 30
+        text = "姓名" if i % label_every == 0 else ("" if i % label_every == 1 else f"欄位{i}")
+        lines.append(TextLine(text, [x, y, 0, 0, x + rng.uniform(20, 80), y + 12]))
+    y = (total_segments // per_row + 1) * 30
+    lines.append(TextLine("中文姓名", [0, y, 0, 0, 50, y + 12]))
+    lines.append(TextLine("王小明", [60, y, 0, 0, 110, y + 12]))
+    return lines
+
+
+def _rows_reference(page: PageLines, groups: List[List[int]]) -> List[dict]:
+    """舊版 process_page 傳給 _extract_compact_contact 的 rows（每行一個 to_dict 副本）"""
+    return [{"texts": [page.line(i).to_dict() for i in g]} for g in groups]
+
+
+def bench_contact(total_segments: int, repeat: int):
+    config = OCRConfig()
+    config.enable_cache = False
+    config.enable_llm_cache = False
+    processor = OCRProcessor(config)
+    # 隨機小頁面先確認結果與舊版一致
+    rng = random.Random(1)
+    for _ in range(2000):
+        lines = synthetic_form(rng.randint(0, 40), rng.randint(1, 6), rng.randint(2, 7), seed=rng.random())
+        for ln in lines:
+            ln.text = rng.choice([ln.text, "", "name", "a@b.com", "0912345678", "Amy"])
+        page = PageLines.from_text_lines(lines)
+        groups = processor._group_lines_by_row(page)
+        rows = _rows_reference(page, groups)
+        assert processor._extract_compact_contact(page, groups) == _extract_contact_reference(processor, rows)
+
+    print(f"=== _extract_compact_contact（{total_segments} 個 segment）===")
+    for per_row, label_every in ((5, 10), (50, 10), (5, total_segments + 1)):
+        page = PageLines.from_text_lines(synthetic_form(total_segments, per_row, label_every))
+        groups = processor._group_lines_by_row(page)
+        rows = _rows_reference(page, groups)
+        assert processor._extract_compact_contact(page, groups) == _extract_contact_reference(processor, rows)
+        t_ref = _timeit(lambda: _extract_contact_reference(processor, rows), repeat)
+        t_new = _timeit(lambda: processor._extract_compact_contact(page, groups), repeat)
+        labels = "無姓名標籤" if label_every > total_segments else f"每 {label_every} 格一個姓名標籤"
+        print(f"每列 {per_row:>3} 格、{labels}: 舊版 {t_ref * 1000:9.2f} ms  索引 {t_new * 1000:8.2f} ms")
+
+
+class _DictTextLine:
+    """舊版 TextLine（一般 class，每個實例有 __dict__），用於記憶體比較"""
+    def __init__(self, text: str, bbox: List[float]):
+        self.text = (text or '').strip()
+        self.x1, self.y1, self.x2, self.y2 = float(bbox[0]), float(bbox[1]), float(bbox[4]), float(bbox[5])
+        self.center_x = (self.x1 + self.x2) / 2
+        self.center_y = (self.y1 + self.y2) / 2
+
+    def to_dict(self) -> dict:
+        return {"text": self.text, "x1": self.x1, "y1": self.y1, "x2": self.x2, "y2": self.y2}
+
+
+def synthetic_document(pages: int, lines_per_page: int, seed: int = 0) -> List[SimpleNamespace]:
+    """模擬 Azure read_results：每頁 lines_per_page 行，每行有文字與 8 點 bounding_box"""
+    rng = random.Random(seed)
+    doc = []
+    for _ in range(pages):
+        lines = []
+        for i in range(lines_per_page):
+            row, col = divmod(i, 6)
+            x = col * 90 + rng.uniform(-4, 4)
+            y = row * 24 + rng.uniform(-3, 3)
+            lines.append(SimpleNamespace(text=f"word{i} 內容", bounding_box=[x, y, x + 80, y, x + 80, y + 14, x, y + 14]))
+        doc.append(SimpleNamespace(lines=lines))
+    return doc
+
+
+def _peak_kib(fn: Callable) -> Tuple[float, object]:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024, result
+
+
+def bench_memory(pages: int, lines_per_page: int):
+    config = OCRConfig()
+    config.enable_cache = False
+    config.enable_llm_cache = False
+    processor = OCRProcessor(config)
+    doc = synthetic_document(pages, lines_per_page)
+    print(f"=== 行資料記憶體（{pages} 頁 x {lines_per_page} 行，tracemalloc 峰值）===")
+
+    def old_lines():
+        # 舊版：每行一個帶 __dict__ 的 TextLine，再為 rows 複製一份 to_dict()
+        kept = []
+        for page in doc:
+            lines = sorted((_DictTextLine(ln.text, ln.bounding_box) for ln in page.lines),
+                           key=lambda l: (l.center_y, l.x1))
+            kept.append((lines, [ln.to_dict() for ln in lines]))
+        return kept
+
+    def slot_lines():
+        return [sorted((TextLine(ln.text, ln.bounding_box) for ln in page.lines), key=lambda l: (l.center_y, l.x1))
+                for page in doc]
+
+    def columnar_lines():
+        return [PageLines.from_azure_lines(page.lines) for page in doc]
+
+    for label, fn in (("dict TextLine + rows", old_lines), ("__slots__ TextLine", slot_lines),
+                      ("PageLines（欄位陣列）", columnar_lines)):
+        peak, kept = _peak_kib(fn)
+        del kept
+        print(f"{label:>22}: {peak / 1024:8.2f} MiB")
+
+    peak, _ = _peak_kib(lambda: [processor.process_page(page, i + 1) for i, page in enumerate(doc)])
+    print(f"{'process_page 全部頁面':>22}: {peak / 1024:8.2f} MiB（含輸出）")
+
+
+def bench_output(repeat: int):
+    results = []
+    for path in sorted(glob.glob("ocr_output_*.json")):
+        with open(path, 'r', encoding='utf-8') as f:
+            results.append(json.load(f))
+    total_pages = sum(len(r.get("pages", [])) for r in results)
+    print(f"=== 輸出格式（{len(results)} 個檔案，{total_pages} 頁）===")
+    for profile in FileManager.PROFILE_SUFFIXES:
+        for compression in FileManager.COMPRESSION_SUFFIXES:
+            if (profile == "msgpack" and ocr_processor.msgpack is None) or \
+                    (compression == "zstd" and ocr_processor.zstandard is None):
+                print(f"{profile:>8} + {compression:<5}: 未安裝所需套件")
+                continue
+            blobs = [FileManager.encode_results(r, profile, compression) for r in results]
+            for r, blob in zip(results, blobs):
+                assert FileManager.decode_results(blob, profile, compression) == r
+            t_write = _timeit(lambda: [FileManager.encode_results(r, profile, compression) for r in results], repeat)
+            t_read = _timeit(lambda: [FileManager.decode_results(b, profile, compression) for b in blobs], repeat)
+            size = sum(len(b) for b in blobs)
+            print(f"{profile:>8} + {compression:<5}: 寫入 {t_write * 1000:7.2f} ms  讀取 {t_read * 1000:7.2f} ms  "
+                  f"{size / max(total_pages, 1):9.0f} bytes/頁")
+
+
+def _mutate(text: str, rate: float, rng: random.Random) -> str:
+    """模擬 OCR 錯誤：依 rate 隨機替換、刪除或插入字元"""
+    out = []
+    for ch in text:
+        r = rng.random()
+        if r < rate / 3:
+            out.append(rng.choice(text))
+        elif r < 2 * rate / 3:
+            continue
+        elif r < rate:
+            out.extend((ch, rng.choice(text)))
+        else:
+            out.append(ch)
+    return "".join(out)
+
+
+def bench_edit_distance(chars: int, repeat: int):
+    # 先與教科書 DP 比對：字元與 token 序列、含 max_distance 提早結束
+    rng = random.Random(0)
+    for _ in range(5000):
+        a = "".join(rng.choice("ab c") for _ in range(rng.randint(0, 30)))
+        b = "".join(rng.choice("ab c") for _ in range(rng.randint(0, 30)))
+        expected = text_metrics.reference_distance(a, b)
+        assert text_metrics.levenshtein(a, b) == expected, (a, b)
+        k = rng.randint(0, 10)
+        assert text_metrics.levenshtein(a, b, k) == min(expected, k + 1), (a, b, k)
+        assert text_metrics.levenshtein(a.split(), b.split()) == text_metrics.reference_distance(a.split(), b.split())
+
+    text = "\n".join(page.get("page_text", "") for page in load_output_pages())
+    while len(text) < chars:
+        text += "\n" + text
+    gt = text[:chars]
+    pred = _mutate(gt, 0.05, rng)
+    print(f"=== 編輯距離（{len(gt)} / {len(pred)} 字，約 5% 錯誤）===")
+
+    def seq_matcher():
+        matcher = SequenceMatcher(None, gt, pred)
+        return max(len(gt), len(pred)) - sum(t.size for t in matcher.get_matching_blocks())
+
+    exact = text_metrics.levenshtein(gt, pred)
+    t_myers = _timeit(lambda: text_metrics.levenshtein(gt, pred), repeat)
+    t_seq = _timeit(seq_matcher, repeat)
+    print(f"bit-parallel: {t_myers * 1000:9.2f} ms  距離 {exact}")
+    print(f"SequenceMatcher（舊版近似）: {t_seq * 1000:9.2f} ms  估計 {seq_matcher()}")
+    if len(gt) <= 5000:
+        t_dp = _timeit(lambda: text_metrics.reference_distance(gt, pred), 1)
+        assert text_metrics.reference_distance(gt, pred) == exact
+        print(f"動態規劃: {t_dp * 1000:9.2f} ms")
+
+
+def bench_preprocess(assets: str, repeat: int):
+    if ocr_processor.cv2 is None:
+        print("未安裝 opencv-python，略過")
+        return
+    paths = sorted(p for ext in ("jpg", "jpeg", "png", "bmp", "tif", "tiff")
+                   for p in glob.glob(f"{assets}/*.{ext}"))
+    base = OCRConfig().preprocess
+    print(f"=== 影像前處理（{len(paths)} 張，各 profile 的耗時與上傳大小）===")
+    variants = [("full", "fixed")] + [(profile, "auto") for profile in ocr_processor.PREPROCESS_PROFILES[1:]] + \
+               [("auto", "auto"), ("auto", "smallest")]
+    for path in paths:
+        original = len(open(path, 'rb').read())
+        print(f"{path}（原檔 {original} bytes）")
+        for profile, encode in variants:
+            settings = {**base, "profile": profile, "encode": encode}
+            data, info = ocr_processor.preprocess_image(path, settings)
+            seconds = _timeit(lambda: ocr_processor.preprocess_image(path, settings), repeat)
+            size = len(data) if data is not None else original
+            label = f"{profile}/{encode}"
+            chosen = f" -> {info['profile']}" if profile == "auto" else ""
+            print(f"  {label:<15}{seconds * 1000:8.1f} ms {size:9d} bytes {info.get('format', '原檔'):>5}{chosen}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR 效能微基準測試")
+    sub = parser.add_subparsers(dest="target", required=True)
+    p = sub.add_parser("row_grouping", help="列群組化")
+    p.add_argument("--lines", type=int, default=10000)
+    p.add_argument("--repeat", type=int, default=5)
+    p = sub.add_parser("normalize", help="錯字修正")
+    p.add_argument("--extra-rules", type=int, default=2000)
+    p.add_argument("--repeat", type=int, default=5)
+    p = sub.add_parser("keywords", help="關鍵字比對")
+    p.add_argument("--extra-keywords", type=int, default=500)
+    p.add_argument("--repeat", type=int, default=5)
+    p = sub.add_parser("contact", help="姓名/手機/Email 擷取")
+    p.add_argument("--segments", type=int, default=5000)
+    p.add_argument("--repeat", type=int, default=5)
+    p = sub.add_parser("memory", help="行資料記憶體用量")
+    p.add_argument("--pages", type=int, default=200)
+    p.add_argument("--lines", type=int, default=400)
+    p = sub.add_parser("output", help="輸出格式與壓縮")
+    p.add_argument("--repeat", type=int, default=5)
+    p = sub.add_parser("edit_distance", help="CER 用的編輯距離")
+    p.add_argument("--chars", type=int, default=5000)
+    p.add_argument("--repeat", type=int, default=3)
+    p = sub.add_parser("preprocess", help="影像前處理 profile 與編碼")
+    p.add_argument("--assets", default="assets")
+    p.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.target == "row_grouping":
+        bench_row_grouping(args.lines, args.repeat)
+    elif args.target == "normalize":
+        bench_normalize(args.extra_rules, args.repeat)
+    elif args.target == "keywords":
+        bench_keywords(args.extra_keywords, args.repeat)
+    elif args.target == "contact":
+        bench_contact(args.segments, args.repeat)
+    elif args.target == "memory":
+        bench_memory(args.pages, args.lines)
+    elif args.target == "output":
+        bench_output(args.repeat)
+    elif args.target == "edit_distance":
+        bench_edit_distance(args.chars, args.repeat)
+    elif args.target == "preprocess":
+        bench_preprocess(args.assets, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
 
 import pdfplumber
 import warnings
+import contextlib
 import json
 import os
-from difflib import SequenceMatcher
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
-import pytesseract
-from pdf2image import convert_from_path
+
+from text_metrics import document_metrics, levenshtein
+from ocr_backends import TesseractBackend
+from ocr_processor import FileManager
 
 import logging
 logging.getLogger("pdfminer").setLevel(logging.ERROR)
@@ -15,81 +21,239 @@ logging.getLogger("pdfminer").setLevel(logging.ERROR)
 # ====== 設定 TESSDATA_PREFIX 路徑（使用者自訂） ======
 os.environ['TESSDATA_PREFIX'] = r'D:\tesseract-5.5.2\tessdata'
 
-def extract_pdf_text(pdf_path):
-    text = []
+def extract_pdf_pages(pdf_path):
     with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            text.append(page.extract_text() or "")
-    return "\n".join(text)
+        return [page.extract_text() or "" for page in pdf.pages]
+
+def extract_pdf_text(pdf_path):
+    return "\n".join(extract_pdf_pages(pdf_path))
+
+def extract_ocr_pages(json_path):
+    # 支援 OCRProcessor 的各種輸出格式（compact / msgpack / gzip / zstd / .jsonl），精簡格式會先還原 page_text
+    data = FileManager.load_results(json_path)
+    return [page.get('page_text', '') for page in data['pages']]
 
 def extract_ocr_text(json_path):
-    with open(json_path, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    return "\n".join(page['page_text'] for page in data['pages'])
+    return "\n".join(extract_ocr_pages(json_path))
 
 def levenshtein_distance(s1, s2):
-    matcher = SequenceMatcher(None, s1, s2)
-    return int(max(len(s1), len(s2)) - sum(triple.size for triple in matcher.get_matching_blocks()))
+    return levenshtein(s1, s2)
 
 def cer(gt, pred):
     dist = levenshtein_distance(gt, pred)
     return dist / max(1, len(gt)), dist, len(gt)
 
+# ====== 逐頁對齊的 CER / WER，可用多個行程批次計算 ======
+def evaluate_pdf(pdf_path, ocr_json_path):
+    """以 PDF 文字層為正確答案，逐頁對齊後計算 CER 與 WER；文字層過少（圖片型 PDF）時回傳 skipped"""
+    gt_pages = extract_pdf_pages(pdf_path)
+    result = {'pdf': pdf_path, 'ocr_json': ocr_json_path}
+    if len("".join(gt_pages).strip()) < 10:
+        result['skipped'] = '原始PDF字數過少，可能為圖片型PDF'
+        return result
+    result.update(document_metrics(gt_pages, extract_ocr_pages(ocr_json_path)))
+    return result
+
+def evaluate_batch(pdf_dir='assets', workers=None):
+    """對 pdf_dir 下每個有對應 ocr_output_<name>（任一輸出格式）的 PDF 計算指標，回傳 (結果清單, 缺少 OCR 輸出的 PDF)"""
+    jobs, missing = [], []
+    for pdf_file in sorted(f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')):
+        base_name = os.path.splitext(pdf_file)[0]
+        ocr_json_path = FileManager.find_results(base_name)
+        if ocr_json_path:
+            jobs.append((os.path.join(pdf_dir, pdf_file), ocr_json_path))
+        else:
+            missing.append(pdf_file)
+    if not jobs:
+        return [], missing
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(evaluate_pdf, *zip(*jobs)))
+    return results, missing
+
 # ====== 新增：自動爬取台灣政府PDF ======
-def crawl_gov_pdfs(base_url, dest_folder='assets', max_files=5):
+SOURCES_FILE = 'pdf_sources.json'
+
+def make_session(pool_size=8, retries=3):
+    # 共用連線池（keep-alive），暫時性錯誤（429 / 5xx / 連線失敗）自動退避重試
+    session = requests.Session()
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=('GET', 'HEAD'))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def load_pdf_sources(dest_folder):
+    """pdf_sources.json -> {url: 紀錄}（含上次下載的 ETag / Last-Modified）"""
+    path = os.path.join(dest_folder, SOURCES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return {item['url']: item for item in json.load(f) if item.get('url')}
+
+class PdfSources:
+    """pdf_sources.json 的執行緒安全存取；每次更新都以暫存檔 + rename 整份寫回，中斷時不會留下半個 JSON"""
+    def __init__(self, dest_folder):
+        self.path = os.path.join(dest_folder, SOURCES_FILE)
+        self.records = load_pdf_sources(dest_folder)
+        self.lock = threading.Lock()
+
+    def get(self, url):
+        with self.lock:
+            return dict(self.records.get(url) or {})
+
+    def update(self, url, **fields):
+        with self.lock:
+            self.records.setdefault(url, {'url': url}).update(fields)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(list(self.records.values()), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+def download_pdf(session, pdf, sources, chunk_size=64 * 1024, timeout=30):
+    """
+    串流下載單一 PDF，回傳狀態：downloaded / resumed / not_modified / exists。
+    - 已下載且記錄了 ETag / Last-Modified：送條件式請求，304 時略過
+    - 只有檔案沒有驗證資訊（舊版爬蟲下載的）：沿用舊行為直接略過
+    - 有未完成的 .part：以 Range 續傳，並用 If-Range 確認伺服器上的檔案沒變（變了會回 200，改為重新下載）
+    - 內容分塊寫入 .part，完成後才 rename 成正式檔名
+    - 416（續傳範圍不合）時捨棄 .part 重新下載一次，仍失敗則拋出 HTTPError
+    """
+    url, filename = pdf['url'], pdf['filename']
+    part_path = filename + '.part'
+    # 416 代表 .part 與伺服器上的檔案對不上：捨棄 .part 後重新下載，只重試一次
+    for attempt in (1, 2):
+        record = sources.get(url)
+        validator = record.get('etag') or record.get('last_modified')
+        headers = {}
+        if os.path.exists(filename):
+            if not validator:
+                return 'exists'
+            if record.get('etag'):
+                headers['If-None-Match'] = record['etag']
+            if record.get('last_modified'):
+                headers['If-Modified-Since'] = record['last_modified']
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) and validator else 0
+        if offset and not os.path.exists(filename):
+            headers['Range'] = f'bytes={offset}-'
+            headers['If-Range'] = validator
+        with session.get(url, headers=headers, stream=True, timeout=timeout) as r:
+            if r.status_code == 304:
+                return 'not_modified'
+            if r.status_code == 416 and attempt == 1:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(part_path)
+                continue
+            r.raise_for_status()
+            resumed = r.status_code == 206
+            etag, last_modified = r.headers.get('ETag'), r.headers.get('Last-Modified')
+            # 先記下驗證資訊，下載中斷時下次才能安全地續傳
+            sources.update(url, filename=filename, source=pdf.get('source'),
+                           etag=etag, last_modified=last_modified, complete=False)
+            with open(part_path, 'ab' if resumed else 'wb') as f:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+        break
+    os.replace(part_path, filename)
+    sources.update(url, size=os.path.getsize(filename), complete=True)
+    return 'resumed' if resumed else 'downloaded'
+
+def _pdf_links(session, detail_url, dest_folder, timeout):
+    detail_resp = session.get(detail_url, timeout=timeout)
+    detail_soup = BeautifulSoup(detail_resp.text, 'html.parser')
+    links = []
+    for link in detail_soup.find_all('a', href=True):
+        pdf_href = link['href']
+        if pdf_href.lower().endswith('.pdf'):
+            pdf_url = pdf_href if pdf_href.startswith('http') else requests.compat.urljoin(detail_url, pdf_href)
+            filename = os.path.join(dest_folder, os.path.basename(pdf_url))
+            links.append({'url': pdf_url, 'filename': filename, 'source': detail_url})
+    return links
+
+def crawl_gov_pdfs(base_url, dest_folder='assets', max_files=5, workers=4, session=None, timeout=30):
+    """
+    爬取列表頁 -> 資料集詳細頁 -> PDF 並下載到 dest_folder。
+    共用一個連線池 session（可注入，例如測試用），詳細頁與下載最多同時 workers 個，
+    每找到一個 PDF 就排入下載，不必等所有詳細頁解析完；回傳 PDF 清單（依詳細頁順序）。
+    """
     os.makedirs(dest_folder, exist_ok=True)
-    resp = requests.get(base_url)
-    soup = BeautifulSoup(resp.text, 'html.parser')
-    # 1. 取得所有資料集詳細頁連結
-    dataset_links = []
-    for a in soup.find_all('a', href=True):
-        href = a['href']
-        # 只抓 dataset 詳細頁
-        if href.startswith('/dataset/') or href.startswith('https://data.gov.tw/dataset/'):
-            # 統一成完整網址
-            if not href.startswith('http'):
-                href = requests.compat.urljoin(base_url, href)
-            if href not in dataset_links:
-                dataset_links.append(href)
-        if len(dataset_links) >= max_files:
-            break
-    pdfs = []
-    # 2. 進入每個詳細頁抓 PDF 連結
-    for detail_url in dataset_links:
-        try:
-            detail_resp = requests.get(detail_url)
-            detail_soup = BeautifulSoup(detail_resp.text, 'html.parser')
-            for link in detail_soup.find_all('a', href=True):
-                pdf_href = link['href']
-                if pdf_href.lower().endswith('.pdf'):
-                    pdf_url = pdf_href if pdf_href.startswith('http') else requests.compat.urljoin(detail_url, pdf_href)
-                    filename = os.path.join(dest_folder, os.path.basename(pdf_url))
-                    pdfs.append({'url': pdf_url, 'filename': filename, 'source': detail_url})
+    own_session = session is None
+    if own_session:
+        session = make_session(pool_size=workers)
+    sources = PdfSources(dest_folder)
+    try:
+        resp = session.get(base_url, timeout=timeout)
+        soup = BeautifulSoup(resp.text, 'html.parser')
+        # 1. 取得所有資料集詳細頁連結
+        dataset_links = []
+        for a in soup.find_all('a', href=True):
+            href = a['href']
+            # 只抓 dataset 詳細頁
+            if href.startswith('/dataset/') or href.startswith('https://data.gov.tw/dataset/'):
+                # 統一成完整網址
+                if not href.startswith('http'):
+                    href = requests.compat.urljoin(base_url, href)
+                if href not in dataset_links:
+                    dataset_links.append(href)
+            if len(dataset_links) >= max_files:
+                break
+        pdfs = []
+        downloads = {}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # 2. 平行抓詳細頁，依原本順序取 PDF 連結並立即排入下載
+            detail_futures = [(url, pool.submit(_pdf_links, session, url, dest_folder, timeout)) for url in dataset_links]
+            for detail_url, future in detail_futures:
+                if len(pdfs) >= max_files:
+                    future.cancel()
+                    continue
+                try:
+                    links = future.result()
+                except Exception as e:
+                    print(f'錯誤: {detail_url} 解析失敗: {e}')
+                    continue
+                for pdf in links:
                     if len(pdfs) >= max_files:
                         break
-            if len(pdfs) >= max_files:
-                break
-        except Exception as e:
-            print(f'錯誤: {detail_url} 解析失敗: {e}')
-    # 3. 下載 PDF
-    for pdf in pdfs:
-        if not os.path.exists(pdf['filename']):
-            print(f'下載: {pdf["url"]}')
-            r = requests.get(pdf['url'])
-            with open(pdf['filename'], 'wb') as f:
-                f.write(r.content)
-    # 儲存來源對照
-    with open(os.path.join(dest_folder, 'pdf_sources.json'), 'w', encoding='utf-8') as f:
-        json.dump(pdfs, f, ensure_ascii=False, indent=2)
-    return pdfs
+                    if any(p['filename'] == pdf['filename'] for p in pdfs):
+                        continue
+                    pdfs.append(pdf)
+                    # 3. 下載 PDF（串流寫檔、可續傳、未變更則略過）
+                    downloads[pdf['url']] = pool.submit(download_pdf, session, pdf, sources, timeout=timeout)
+            for pdf in pdfs:
+                try:
+                    pdf['status'] = downloads[pdf['url']].result()
+                except Exception as e:
+                    pdf['status'] = 'failed'
+                    print(f'錯誤: {pdf["url"]} 下載失敗: {e}')
+                    continue
+                if pdf['status'] in ('downloaded', 'resumed'):
+                    print(f'下載: {pdf["url"]}')
+        # 儲存來源對照（沒有驗證資訊的檔案也要記錄來源）
+        for pdf in pdfs:
+            if pdf['status'] != 'failed':
+                sources.update(pdf['url'], filename=pdf['filename'], source=pdf['source'])
+        return [pdf for pdf in pdfs if pdf['status'] != 'failed']
+    finally:
+        if own_session:
+            session.close()
 
 # ====== 新增：OCR PDF 儲存為 JSON，支援繁中 ======
-def ocr_pdf_to_json(pdf_path, json_path, lang='chi_tra+eng'):
-    images = convert_from_path(pdf_path)
-    pages = []
-    for i, img in enumerate(images):
-        text = pytesseract.image_to_string(img, lang=lang)
-        pages.append({'page_num': i+1, 'page_text': text})
+def ocr_pdf_to_json(pdf_path, json_path, lang='chi_tra+eng', backend=None, dpi=300):
+    # 逐頁點陣化（first_page/last_page）並在行程池中辨識，不會一次把整份 PDF 轉成影像
+    own_backend = backend is None
+    if own_backend:
+        backend = TesseractBackend(lang=lang, dpi=dpi)
+    missing = backend.missing_dependency()
+    if missing:
+        raise ImportError(missing)
+    try:
+        pages = []
+        for page in backend.read_pdf_pages(pdf_path):
+            text = "\n".join(line['text'] for line in page['lines'])
+            pages.append({'page_num': page['page'], 'page_text': text})
+    finally:
+        if own_backend:
+            backend.close()
     with open(json_path, 'w', encoding='utf-8') as f:
         json.dump({'pages': pages}, f, ensure_ascii=False, indent=2)
 
@@ -120,41 +284,38 @@ def main():
     print('開始爬取政府PDF...')
     pdfs = crawl_gov_pdfs(base_url, dest_folder='assets', max_files=3)
 
-    # ====== OCR 處理並儲存 JSON ======
-    for pdf in pdfs:
-        pdf_path = pdf['filename']
-        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-        ocr_json_path = f'ocr_output_{base_name}.json'
-        if not os.path.exists(ocr_json_path):
-            print(f'OCR: {pdf_path}')
-            ocr_pdf_to_json(pdf_path, ocr_json_path, lang='chi_tra+eng')
+    # ====== OCR 處理並儲存 JSON（共用同一個行程池） ======
+    backend = TesseractBackend(lang='chi_tra+eng')
+    try:
+        for pdf in pdfs:
+            pdf_path = pdf['filename']
+            base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+            if not FileManager.find_results(base_name):
+                print(f'OCR: {pdf_path}')
+                ocr_pdf_to_json(pdf_path, f'ocr_output_{base_name}.json', backend=backend)
+    finally:
+        backend.close()
 
-    # ====== CER 批次測試 ======
+    # ====== CER / WER 批次測試 ======
     pdf_dir = 'assets'
-    pdf_files = [f for f in os.listdir(pdf_dir) if f.lower().endswith('.pdf')]
-    if not pdf_files:
+    if not any(f.lower().endswith('.pdf') for f in os.listdir(pdf_dir)):
         print('assets/ 沒有 PDF 檔案')
         return
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(pdf_dir, pdf_file)
+    results, missing = evaluate_batch(pdf_dir)
+    for pdf_file in missing:
         base_name = os.path.splitext(pdf_file)[0]
-        ocr_json_path = f'ocr_output_{base_name}.json'
-        if not os.path.exists(ocr_json_path):
-            print(f'找不到對應的 ocr_output 檔案: {ocr_json_path}，略過 {pdf_file}')
-            continue
-        gt_text = extract_pdf_text(pdf_path)
-        if len(gt_text.strip()) < 10:
-            print(f'--- {pdf_file} ---')
-            print('原始PDF字數過少，可能為圖片型PDF，略過此檔案。')
+        print(f'找不到對應的 ocr_output 檔案: ocr_output_{base_name}.json，略過 {pdf_file}')
+    for result in results:
+        print(f'--- {os.path.basename(result["pdf"])} ---')
+        if result.get('skipped'):
+            print(f'{result["skipped"]}，略過此檔案。')
             print()
             continue
-        ocr_text = extract_ocr_text(ocr_json_path)
-        error_rate, dist, total = cer(gt_text, ocr_text)
-        print(f'--- {pdf_file} ---')
-        print(f'原始PDF字數: {total}')
-        print(f'OCR字數: {len(ocr_text)}')
-        print(f'編輯距離: {dist}')
-        print(f'字錯率(CER): {error_rate*100:.2f}%')
+        print(f'原始PDF字數: {result["gt_chars"]}')
+        print(f'OCR字數: {result["ocr_chars"]}')
+        print(f'編輯距離: {result["char_distance"]}')
+        print(f'字錯率(CER): {result["cer"]*100:.2f}%')
+        print(f'詞錯率(WER): {result["wer"]*100:.2f}%')
         print()
 
 if __name__ == '__main__':
@@ -0,0 +1,301 @@
+"""
+增量匯入：以 SQLite manifest 記錄每個檔案的路徑、大小、mtime、inode、內容雜湊與處理狀態，
+每次執行只處理新增或變更的檔案；另提供監看資料夾用的 FolderWatcher（有 watchdog 時走 inotify 等事件，否則輪詢）。
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+try:
+    from watchdog.events import FileSystemEventHandler  # type: ignore
+    from watchdog.observers import Observer  # type: ignore
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    size INTEGER,
+    mtime_ns INTEGER,
+    inode INTEGER,
+    sha256 TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    output TEXT,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE INDEX IF NOT EXISTS files_status ON files(status);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IngestManifest:
+    """
+    匯入狀態資料庫。status：pending（待處理）、done（已處理）、failed（失敗，未達重試上限時會再處理）。
+    sha256 為最後一次成功處理時的內容雜湊：檔案只是被 touch 或複製回原內容時不會重新處理。
+
+    scan() 以資料夾 mtime 判斷是否需要重新列舉：資料夾內新增、刪除、改名都會改變它的 mtime，
+    未變更的資料夾只花一次 stat 與一次索引查詢（子資料夾清單取自 manifest），不列舉其中的檔案，
+    因此啟動成本與檔案總數無關，只與資料夾數量有關。列舉時每個檔案都會 stat（比對大小、mtime、inode）。
+    原地覆寫（同一 inode）不會改變資料夾 mtime，需靠 refresh()（監看事件）或 scan(full=True) 發現；
+    last_full_scan() 記錄上次完整掃描的時間，呼叫端可據此定期完整掃描。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+    @staticmethod
+    def _norm_exts(extensions: Iterable[str]) -> Set[str]:
+        return {e.lower() if e.startswith('.') else f".{e.lower()}" for e in extensions}
+
+    def _forget_dir(self, path: str) -> int:
+        """移除資料夾（含子資料夾）在 manifest 中的所有紀錄，回傳移除的檔案數"""
+        prefix = path.rstrip(os.sep) + os.sep
+        n = len(prefix)
+        removed = self._db.execute("DELETE FROM files WHERE dir = ? OR substr(dir, 1, ?) = ?",
+                                   (path, n, prefix)).rowcount
+        self._db.execute("DELETE FROM dirs WHERE path = ? OR substr(path, 1, ?) = ?", (path, n, prefix))
+        return removed
+
+    def _upsert_pending(self, path: str, directory: str, st: os.stat_result) -> None:
+        # 保留 sha256 / output，以便判斷內容是否真的改變
+        self._db.execute(
+            "INSERT INTO files (path, dir, size, mtime_ns, inode, status, attempts, updated) "
+            "VALUES (?, ?, ?, ?, ?, 'pending', 0, ?) "
+            "ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns, "
+            "inode = excluded.inode, status = 'pending', attempts = 0, error = NULL, updated = excluded.updated",
+            (path, directory, st.st_size, st.st_mtime_ns, st.st_ino, time.time()))
+
+    def scan(self, folder: str, extensions: Iterable[str], recursive: bool = True,
+             full: bool = False) -> Dict[str, int]:
+        """
+        同步資料夾與 manifest，新增或變更的檔案標為 pending，已不存在的檔案移除。
+        full=True 時忽略資料夾 mtime，列舉並 stat 所有檔案（可找出原地覆寫的檔案）。
+        回傳統計：listed / skipped（列舉 / 略過的資料夾數）、new、changed、removed。
+        """
+        exts = self._norm_exts(extensions)
+        root = os.path.abspath(folder)
+        started = time.time()
+        stats = {"listed": 0, "skipped": 0, "new": 0, "changed": 0, "removed": 0}
+        stack = [(root, None)]
+        db = self._db
+        while stack:
+            directory, parent = stack.pop()
+            try:
+                dir_mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                stats["removed"] += self._forget_dir(directory)
+                continue
+            row = db.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (directory,)).fetchone()
+            known_subdirs = [r[0] for r in db.execute("SELECT path FROM dirs WHERE parent = ?", (directory,))]
+            if row is not None and row[0] == dir_mtime and not full:
+                stats["skipped"] += 1
+                if recursive:
+                    stack.extend((sub, directory) for sub in known_subdirs)
+                continue
+
+            stats["listed"] += 1
+            known = {r[0]: (r[1], r[2], r[3]) for r in
+                     db.execute("SELECT path, size, mtime_ns, inode FROM files WHERE dir = ?", (directory,))}
+            seen: Set[str] = set()
+            subdirs: List[str] = []
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                stats["removed"] += self._forget_dir(directory)
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in exts or not entry.is_file():
+                    continue
+                path = entry.path
+                seen.add(path)
+                previous = known.get(path)
+                # 同 inode 也要 stat：資料夾因其他檔案變更而重新列舉時，此檔可能同時被原地覆寫
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                if previous is not None and (previous[0], previous[1], previous[2]) == (st.st_size, st.st_mtime_ns, st.st_ino):
+                    continue
+                self._upsert_pending(path, directory, st)
+                stats["new" if previous is None else "changed"] += 1
+            gone = [path for path in known if path not in seen]
+            if gone:
+                db.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in gone])
+                stats["removed"] += len(gone)
+            if recursive:
+                current = set(subdirs)
+                for sub in known_subdirs:
+                    if sub not in current:
+                        stats["removed"] += self._forget_dir(sub)
+                stack.extend((sub, directory) for sub in subdirs)
+            # 記錄列舉前取得的 mtime：列舉期間若又有變更，下次 scan 仍會重新列舉
+            db.execute("INSERT INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?) "
+                       "ON CONFLICT(path) DO UPDATE SET parent = excluded.parent, mtime_ns = excluded.mtime_ns",
+                       (directory, parent, dir_mtime))
+        if full:
+            db.execute("INSERT INTO meta (key, value) VALUES ('last_full_scan', ?) "
+                       "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (repr(started),))
+        db.commit()
+        return stats
+
+    def last_full_scan(self) -> float:
+        """上次 scan(full=True) 開始的時間（epoch 秒），從未完整掃描時為 0"""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'last_full_scan'").fetchone()
+        return float(row[0]) if row else 0.0
+
+    def full_scan_due(self, interval: float) -> bool:
+        """距上次完整掃描已超過 interval 秒（interval 為 0 時不定期完整掃描）"""
+        return interval > 0 and time.time() - self.last_full_scan() >= interval
+
+    def refresh(self, paths: Iterable[str], extensions: Iterable[str]) -> int:
+        """重新檢查指定的檔案（例如監看事件回報的路徑），回傳標為 pending 或移除的數量"""
+        exts = self._norm_exts(extensions)
+        touched = 0
+        for path in {os.path.abspath(p) for p in paths}:
+            if os.path.splitext(path)[1].lower() not in exts:
+                continue
+            row = self._db.execute("SELECT size, mtime_ns, inode FROM files WHERE path = ?", (path,)).fetchone()
+            try:
+                st = os.stat(path)
+            except OSError:
+                if row is not None:
+                    self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+                    touched += 1
+                continue
+            if row is None or tuple(row) != (st.st_size, st.st_mtime_ns, st.st_ino):
+                self._upsert_pending(path, os.path.dirname(path), st)
+                touched += 1
+        self._db.commit()
+        return touched
+
+    def pending(self, settle: float = 0.0, max_attempts: int = 1) -> List[str]:
+        """
+        待處理的檔案（pending，與嘗試次數未達 max_attempts 的 failed），依路徑排序。
+        mtime 在 settle 秒內的檔案可能仍在寫入，留到下一輪。
+        """
+        cutoff = int((time.time() - settle) * 1e9)
+        rows = self._db.execute(
+            "SELECT path FROM files WHERE (status = 'pending' OR (status = 'failed' AND attempts < ?)) "
+            "AND mtime_ns <= ? ORDER BY path", (max_attempts, cutoff))
+        return [r[0] for r in rows]
+
+    def claim(self, path: str) -> Optional[str]:
+        """
+        準備處理檔案：計算內容雜湊，與上次成功處理時相同則直接標回 done 並回傳 None；
+        否則回傳雜湊（處理完成後交給 mark_done）。檔案已不存在時移除紀錄並回傳 None。
+        """
+        try:
+            digest = file_sha256(path)
+        except OSError:
+            self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+            self._db.commit()
+            return None
+        row = self._db.execute("SELECT sha256 FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == digest:
+            self._db.execute("UPDATE files SET status = 'done', error = NULL, updated = ? WHERE path = ?",
+                             (time.time(), path))
+            self._db.commit()
+            return None
+        return digest
+
+    def mark_done(self, path: str, digest: str, output: Optional[str] = None) -> None:
+        self._db.execute("UPDATE files SET status = 'done', sha256 = ?, output = ?, error = NULL, updated = ? "
+                         "WHERE path = ?", (digest, output, time.time(), path))
+        self._db.commit()
+
+    def mark_failed(self, path: str, error: str) -> None:
+        self._db.execute("UPDATE files SET status = 'failed', attempts = attempts + 1, error = ?, updated = ? "
+                         "WHERE path = ?", (error, time.time(), path))
+        self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """各狀態的檔案數"""
+        return {status: n for status, n in self._db.execute("SELECT status, COUNT(*) FROM files GROUP BY status")}
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    def __init__(self, watcher: "FolderWatcher"):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if getattr(event, "is_directory", False):
+            self.watcher.notify(())
+        else:
+            self.watcher.notify([p for p in (getattr(event, "src_path", None), getattr(event, "dest_path", None)) if p])
+
+
+class FolderWatcher:
+    """
+    監看資料夾的變更。有 watchdog 時由作業系統事件（Linux 為 inotify）喚醒，並回報變更的檔案路徑；
+    沒有時 wait() 只是等待 interval 秒（輪詢，由 IngestManifest.scan 找出變更）。
+    """
+    def __init__(self, folder: str, recursive: bool = True):
+        self._changed: Set[str] = set()
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._observer = None
+        if Observer is not None:
+            self._observer = Observer()
+            self._observer.schedule(_ChangeHandler(self), folder, recursive=recursive)
+            self._observer.start()
+
+    @property
+    def uses_events(self) -> bool:
+        return self._observer is not None
+
+    def notify(self, paths: Iterable[str]) -> None:
+        with self._lock:
+            self._changed.update(os.fsdecode(p) for p in paths)
+        self._event.set()
+
+    def wait(self, timeout: float) -> List[str]:
+        """等到有變更或逾時，回傳期間回報的檔案路徑"""
+        self._event.wait(timeout)
+        self._event.clear()
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        return sorted(changed)
+
+    def close(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
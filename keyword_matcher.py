@@ -0,0 +1,110 @@
+"""
+多關鍵字比對
+把關鍵字編成 trie 形式的 regex，一次掃描文字即可找出所有出現位置與對應的標籤
+"""
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+# trie 節點中標記「此處為某關鍵字結尾」的 key（不會與單一字元衝突）
+_END = "\0end"
+
+
+def _is_ascii_word(ch: str) -> bool:
+    return ch.isascii() and (ch.isalnum() or ch == '_')
+
+
+class KeywordMatcher:
+    """
+    關鍵字 -> 標籤（例如欄位名稱）的比對器。建立一次後可重複使用。
+    trie 編成 regex 後由 re 引擎掃描：每個位置只沿 trie 走到不再符合為止，幾乎不受關鍵字數量影響。
+    regex 在每個位置找最長的關鍵字，同一位置較短的關鍵字必為其前綴，由預先算好的前綴表補齊，
+    因此可重疊的所有符合都不會遺漏。
+    word_boundary=True 時，以英數字開頭/結尾的關鍵字必須位於英文單字邊界（'age' 不會符合 'language'），
+    中文關鍵字不受影響。
+    """
+    def __init__(self, keywords: Iterable[Tuple[str, Any]] = (), word_boundary: bool = False):
+        self.word_boundary = word_boundary
+        self._root: Dict[str, Any] = {}
+        self.keywords: Dict[str, List[Any]] = {}
+        self._pattern = None
+        self._prefixes: Dict[str, List[str]] = {}
+        for keyword, tag in keywords:
+            self.add(keyword, tag)
+
+    @classmethod
+    def from_groups(cls, groups: Dict[Any, Iterable[str]], word_boundary: bool = False) -> "KeywordMatcher":
+        """{標籤: [關鍵字, ...]} -> KeywordMatcher"""
+        return cls(((kw, tag) for tag, kws in groups.items() for kw in kws), word_boundary=word_boundary)
+
+    def add(self, keyword: str, tag: Any = None) -> None:
+        if not keyword:
+            return
+        node = self._root
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[_END] = keyword
+        tags = self.keywords.setdefault(keyword, [])
+        if tag not in tags:
+            tags.append(tag)
+        self._pattern = None
+
+    @classmethod
+    def _trie_pattern(cls, node: Dict[str, Any]) -> str:
+        branches = [re.escape(ch) + cls._trie_pattern(child) for ch, child in sorted(node.items()) if ch != _END]
+        if not branches:
+            return ''
+        if len(branches) == 1 and _END not in node:
+            return branches[0]
+        body = '(?:' + '|'.join(branches) + ')'
+        if _END in node:
+            # 此節點本身也是關鍵字：先嘗試更長的分支，失敗才退回（貪婪的 ?）
+            body += '?'
+        return body
+
+    def _compile(self):
+        # 每個關鍵字 -> 同樣以它開頭比對成功的所有關鍵字（自己的前綴，由短到長）
+        self._prefixes = {kw: [kw[:i] for i in range(1, len(kw) + 1) if kw[:i] in self.keywords]
+                          for kw in self.keywords}
+        self._pattern = re.compile(self._trie_pattern(self._root))
+        return self._pattern
+
+    @staticmethod
+    def _at_word_boundary(text: str, start: int, end: int) -> bool:
+        """[start, end) 的兩端若為英數字，外側不可緊接英數字"""
+        if start > 0 and _is_ascii_word(text[start]) and _is_ascii_word(text[start - 1]):
+            return False
+        if end < len(text) and _is_ascii_word(text[end - 1]) and _is_ascii_word(text[end]):
+            return False
+        return True
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str]]:
+        """依起點順序產生所有（可重疊的）符合：(start, end, keyword)"""
+        if not text or not self.keywords:
+            return
+        search = (self._pattern or self._compile()).search
+        prefixes = self._prefixes
+        bounded = self.word_boundary
+        m = search(text)
+        while m is not None:
+            # 下一次從下一個字元重新找，讓符合可以彼此重疊
+            start = m.start()
+            for keyword in prefixes[m.group()]:
+                end = start + len(keyword)
+                if bounded and not self._at_word_boundary(text, start, end):
+                    continue
+                yield start, end, keyword
+            m = search(text, start + 1)
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        return list(self.iter_matches(text))
+
+    def found_keywords(self, text: str) -> Set[str]:
+        """文字中出現過的關鍵字"""
+        return {keyword for _, _, keyword in self.iter_matches(text)}
+
+    def tags(self, text: str) -> Set[Any]:
+        """文字中出現過的關鍵字所對應的所有標籤"""
+        found: Set[Any] = set()
+        for keyword in self.found_keywords(text):
+            found.update(self.keywords[keyword])
+        return found
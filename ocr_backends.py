@@ -0,0 +1,384 @@
+"""
+OCR 引擎介面
+每個 backend 都把檔案轉成與 Azure ReadResult 相容的 read_results（pages[].lines[].text / bounding_box），
+OCRProcessor.process_page 與 OCR 快取因此不需要知道結果來自哪個引擎。
+"""
+import io
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import pytesseract  # type: ignore
+except ImportError:
+    pytesseract = None
+
+try:
+    from pdf2image import convert_from_path, pdfinfo_from_path  # type: ignore
+except ImportError:
+    convert_from_path = None
+    pdfinfo_from_path = None
+
+try:
+    import pdfplumber  # type: ignore
+except ImportError:
+    pdfplumber = None
+
+try:
+    import pypdfium2  # type: ignore  # pdfplumber 的相依套件，用於快速計算各頁文字層字數
+except ImportError:
+    pypdfium2 = None
+
+try:
+    from PIL import Image, ImageSequence  # type: ignore
+except ImportError:
+    Image = None
+    ImageSequence = None
+
+
+# 文字層座標（pt）換算成 inch，與 Azure Read 回傳的 PDF 頁面一致（同一份 PDF 混用兩種來源時座標尺度相同）
+POINTS_PER_INCH = 72.0
+
+_CID_RE = re.compile(r"\(cid:\d+\)")
+
+
+class OCRBackend:
+    """
+    OCR 引擎的共同介面。
+    read() 回傳 (read_results, 中繼資料)；失敗時 read_results 為 None，中繼資料含 error。
+    data 為前處理後的影像位元組（沒有前處理時為 None，直接讀 file_path）。
+    """
+    name = "base"
+
+    def read(self, file_path: str, data: Optional[bytes] = None, timings: Dict[str, float] = None,
+             pages: Optional[List[int]] = None) -> Tuple[Optional[List[Any]], Dict[str, Any]]:
+        """pages 為只需辨識的 PDF 頁碼（1 起算）；None 代表全部"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """釋放 backend 持有的資源（連線、行程池等）"""
+
+
+class AzureReadBackend(OCRBackend):
+    """Azure Computer Vision Read API：上傳後依 PollingPolicy 輪詢結果"""
+    name = "azure"
+
+    def __init__(self, client: Any, polling: Any):
+        # client 需提供 read_in_stream / get_read_result（可注入測試用的假 client）
+        self.client = client
+        self.polling = polling
+
+    def wait_for_result(self, operation_id: str, payload_size: int) -> Tuple[Any, Dict[str, Any]]:
+        """
+        依 self.polling 輪詢 Azure Read 結果。
+        回傳 (result, 輪詢統計)；超過 timeout 時 result 為 None（timeout 為 0 時一直等到完成）。
+        """
+        policy = self.polling
+        started = time.monotonic()
+        # timeout 為 0 代表不限制
+        deadline = started + policy.timeout if policy.timeout > 0 else float("inf")
+        delay = policy.first_delay(payload_size)
+        polls = 0
+        waited = 0.0
+        result = None
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                result = None
+                break
+            sleep_for = min(delay, remaining)
+            time.sleep(sleep_for)
+            waited += sleep_for
+
+            raw = self.client.get_read_result(operation_id, raw=True)
+            polls += 1
+            # raw=True 時 SDK 回傳 ClientRawResponse（output + response）
+            result = getattr(raw, "output", raw)
+            if result.status not in ['notStarted', 'running']:
+                break
+            response = getattr(raw, "response", None)
+            headers = getattr(response, "headers", None) or {}
+            retry_after = policy.parse_retry_after(headers.get("Retry-After"))
+            delay = policy.next_delay(delay, retry_after)
+
+        stats = {
+            "polls": polls,
+            "wait_seconds": round(waited, 3),
+            "elapsed_seconds": round(time.monotonic() - started, 3),
+            "timed_out": result is None,
+            "payload_bytes": payload_size,
+        }
+        return result, stats
+
+    def read(self, file_path: str, data: Optional[bytes] = None, timings: Dict[str, float] = None,
+             pages: Optional[List[int]] = None) -> Tuple[Optional[List[Any]], Dict[str, Any]]:
+        timings = timings if timings is not None else {}
+        meta: Dict[str, Any] = {}
+        fs = io.BytesIO(data) if data is not None else open(file_path, "rb")
+        try:
+            started = time.perf_counter()
+            if pages:
+                read_response = self.client.read_in_stream(fs, pages=[str(n) for n in pages], raw=True)
+            else:
+                read_response = self.client.read_in_stream(fs, raw=True)
+            timings["upload"] = time.perf_counter() - started
+            operation_location = read_response.headers.get("Operation-Location")
+            if not operation_location:
+                meta["error"] = "無法取得 Operation-Location"
+                return None, meta
+            operation_id = operation_location.split("/")[-1]
+
+            # 等待結果完成
+            payload_size = len(data) if data is not None else os.path.getsize(file_path)
+            started = time.perf_counter()
+            result, polling = self.wait_for_result(operation_id, payload_size)
+            timings["poll"] = time.perf_counter() - started
+            meta["polling"] = polling
+            if result is None:
+                meta["error"] = f"OCR 逾時: 超過 {self.polling.timeout} 秒仍未完成"
+                return None, meta
+
+            # OperationStatusCodes 為 str 列舉，可直接與字串比較
+            if result.status != "succeeded":
+                meta["error"] = f"OCR 失敗: {result.status}"
+                return None, meta
+            return list(result.analyze_result.read_results), meta
+        finally:
+            try:
+                fs.close()
+            except Exception:
+                pass
+
+
+def _join_words(words: List[str]) -> str:
+    """Tesseract 會把每個中文字當成一個 word；中文字之間不補空白，其餘以空白分隔"""
+    text = ""
+    for word in words:
+        if text and not (ord(text[-1]) > 0x2E7F and ord(word[0]) > 0x2E7F):
+            text += " "
+        text += word
+    return text
+
+
+def tesseract_page(image: Any, lang: str, page_number: int = 1) -> Dict[str, Any]:
+    """
+    單頁影像 -> OCR 快取格式的 page dict（lines[].text / bounding_box 為 8 點像素座標）。
+    依 Tesseract 的 (block, paragraph, line) 把 word 合併成行，行框為各 word 框的聯集。
+    """
+    data = pytesseract.image_to_data(image, lang=lang, output_type=pytesseract.Output.DICT)
+    rows: Dict[Tuple[int, int, int], Dict[str, Any]] = {}
+    for i, word in enumerate(data["text"]):
+        word = (word or "").strip()
+        if not word:
+            continue
+        left, top = int(data["left"][i]), int(data["top"][i])
+        right, bottom = left + int(data["width"][i]), top + int(data["height"][i])
+        key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        row = rows.get(key)
+        if row is None:
+            rows[key] = {"words": [word], "box": [left, top, right, bottom]}
+        else:
+            row["words"].append(word)
+            box = row["box"]
+            box[0], box[1] = min(box[0], left), min(box[1], top)
+            box[2], box[3] = max(box[2], right), max(box[3], bottom)
+    lines = []
+    for row in rows.values():
+        x1, y1, x2, y2 = (float(v) for v in row["box"])
+        lines.append({"text": _join_words(row["words"]), "bounding_box": [x1, y1, x2, y1, x2, y2, x1, y2]})
+    width, height = image.size
+    return {"page": page_number, "width": float(width), "height": float(height), "unit": "pixel", "lines": lines}
+
+
+def _tesseract_pdf_page(pdf_path: str, page_number: int, dpi: int, lang: str,
+                        tesseract_cmd: Optional[str] = None) -> Dict[str, Any]:
+    """行程池工作：只點陣化指定的一頁（first_page = last_page），不會把整份 PDF 載入記憶體"""
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number)
+    if not images:
+        return {"page": page_number, "width": 0.0, "height": 0.0, "unit": "pixel", "lines": []}
+    try:
+        return tesseract_page(images[0], lang, page_number)
+    finally:
+        for image in images:
+            image.close()
+
+
+def pages_to_read_results(pages: List[Dict[str, Any]]) -> List[Any]:
+    """page dict -> 與 Azure ReadResult 相容的物件"""
+    return [SimpleNamespace(**{**page, "lines": [SimpleNamespace(text=l["text"], bounding_box=l["bounding_box"])
+                                                 for l in page["lines"]]})
+            for page in pages]
+
+
+class TesseractBackend(OCRBackend):
+    """
+    本機 Tesseract。PDF 先以 pdfinfo 取得頁數，每一頁交給行程池各自點陣化並辨識，
+    同時在記憶體中的只有 workers 張頁面影像；影像檔（或前處理後的位元組）直接在呼叫端執行緒辨識
+    （pytesseract 本身會啟動 tesseract 子行程，批次模式的多個執行緒仍可平行）。
+    """
+    name = "tesseract"
+
+    def __init__(self, lang: str = "chi_tra+eng", dpi: int = 300, workers: int = 0,
+                 tesseract_cmd: Optional[str] = None):
+        self.lang = lang
+        self.dpi = dpi
+        self.workers = workers or os.cpu_count() or 1
+        self.tesseract_cmd = tesseract_cmd
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # 批次模式的多個執行緒可能同時第一次讀 PDF，行程池只建立一次
+        self._pool_lock = threading.Lock()
+
+    @staticmethod
+    def missing_dependency() -> Optional[str]:
+        if pytesseract is None:
+            return "請先安裝 pytesseract 套件: pip install pytesseract"
+        if convert_from_path is None:
+            return "請先安裝 pdf2image 套件: pip install pdf2image"
+        if Image is None:
+            return "請先安裝 Pillow 套件: pip install Pillow"
+        return None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        pool = self._pool
+        if pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                pool = self._pool
+        return pool
+
+    def read_pdf_pages(self, pdf_path: str, first_page: int = 1, last_page: int = None,
+                       pages: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+        """
+        PDF 的 first_page..last_page 頁（1 起算，含頭尾）-> page dict 清單；
+        指定 pages 時只辨識這些頁碼。
+        """
+        if pages is None:
+            if last_page is None:
+                last_page = int(pdfinfo_from_path(pdf_path)["Pages"])
+            pages = list(range(first_page, last_page + 1))
+        pool = self._executor()
+        futures = [pool.submit(_tesseract_pdf_page, pdf_path, n, self.dpi, self.lang, self.tesseract_cmd)
+                   for n in pages]
+        return [future.result() for future in futures]
+
+    def read(self, file_path: str, data: Optional[bytes] = None, timings: Dict[str, float] = None,
+             pages: Optional[List[int]] = None) -> Tuple[Optional[List[Any]], Dict[str, Any]]:
+        timings = timings if timings is not None else {}
+        missing = self.missing_dependency()
+        if missing:
+            return None, {"error": missing}
+        if self.tesseract_cmd:
+            pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
+        started = time.perf_counter()
+        if data is None and file_path.lower().endswith(".pdf"):
+            results = self.read_pdf_pages(file_path, pages=pages)
+        else:
+            # 多頁 TIFF 逐頁（frame）辨識
+            with Image.open(io.BytesIO(data) if data is not None else file_path) as image:
+                results = [tesseract_page(frame, self.lang, n)
+                           for n, frame in enumerate(ImageSequence.Iterator(image), 1)]
+        timings["ocr"] = time.perf_counter() - started
+        return pages_to_read_results(results), {"polling": None}
+
+    def close(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _words_to_lines(words: List[Dict[str, Any]], scale: float) -> List[Dict[str, Any]]:
+    """
+    pdfplumber 的 words -> 行：top 相差不到半個字高的視為同一列，
+    同一列中間距超過一個字高的切成不同行（對應 Azure 把「欄位名稱」與遠處的值分成兩行的行為）。
+    """
+    rows: List[List[Dict[str, Any]]] = []
+    for word in sorted(words, key=lambda w: (w["top"], w["x0"])):
+        height = word["bottom"] - word["top"]
+        if rows and abs(word["top"] - rows[-1][0]["top"]) <= 0.5 * height:
+            rows[-1].append(word)
+        else:
+            rows.append([word])
+    lines = []
+    for row in rows:
+        row.sort(key=lambda w: w["x0"])
+        segment = [row[0]]
+        for word in row[1:] + [None]:
+            if word is not None and word["x0"] - segment[-1]["x1"] <= word["bottom"] - word["top"]:
+                segment.append(word)
+                continue
+            x1, y1 = min(w["x0"] for w in segment) * scale, min(w["top"] for w in segment) * scale
+            x2, y2 = max(w["x1"] for w in segment) * scale, max(w["bottom"] for w in segment) * scale
+            lines.append({"text": _join_words([w["text"] for w in segment]),
+                          "bounding_box": [x1, y1, x2, y1, x2, y2, x1, y2]})
+            segment = [word]
+    return lines
+
+
+def _count_text_chars(text: str) -> int:
+    """有效字數：不含空白、(cid:N) 與無法對應 Unicode 的替代字元"""
+    return len("".join(_CID_RE.sub("", text).replace("\ufffd", "").split()))
+
+
+def pdf_text_char_counts(pdf_path: str) -> List[int]:
+    """
+    各頁文字層的有效字數（分類用）。
+    有 pypdfium2 時用 PDFium 直接讀文字層，比 pdfplumber 逐頁解析版面快一到兩個數量級
+    （掃描頁常含大量向量路徑，pdfminer 解析一頁可能要數秒）；否則退回 pdfplumber。
+    """
+    if pypdfium2 is not None:
+        doc = pypdfium2.PdfDocument(pdf_path)
+        try:
+            counts = []
+            for i in range(len(doc)):
+                page = doc[i]
+                textpage = page.get_textpage()
+                counts.append(_count_text_chars(textpage.get_text_range()))
+                textpage.close()
+                page.close()
+            return counts
+        finally:
+            doc.close()
+    with pdfplumber.open(pdf_path) as pdf:
+        counts = []
+        for page in pdf.pages:
+            counts.append(_count_text_chars("".join(c["text"] for c in page.chars)))
+            page.close()
+        return counts
+
+
+def pdf_text_layer(pdf_path: str, min_chars: int = 20) -> List[Tuple[Optional[Dict[str, Any]], int]]:
+    """
+    先分類再抽取：逐頁計算文字層的有效字數，達 min_chars 的頁面才用 pdfplumber 取出 words 與座標並組成行，
+    不足的頁面（掃描影像）為 None，需交給 OCR。回傳每頁 (page dict 或 None, 有效字數)；座標單位為 inch。
+    """
+    if pdfplumber is None:
+        raise ImportError("請先安裝 pdfplumber 套件: pip install pdfplumber")
+    scale = 1.0 / POINTS_PER_INCH
+    counts = pdf_text_char_counts(pdf_path)
+    pages: List[Tuple[Optional[Dict[str, Any]], int]] = [(None, chars) for chars in counts]
+    if not any(chars >= min_chars for chars in counts):
+        return pages
+    with pdfplumber.open(pdf_path) as pdf:
+        for index, chars in enumerate(counts):
+            if chars < min_chars:
+                continue
+            page = pdf.pages[index]
+            try:
+                words = [{**w, "text": text} for w in page.extract_words()
+                         if (text := _CID_RE.sub("", w["text"]).replace("\ufffd", "").strip())]
+                if words:
+                    pages[index] = ({"page": index + 1, "width": float(page.width) * scale,
+                                     "height": float(page.height) * scale, "unit": "inch",
+                                     "lines": _words_to_lines(words, scale)}, chars)
+            finally:
+                # 逐頁釋放 pdfplumber 的解析快取，長文件不會累積
+                page.close()
+    return pages
@@ -1,41 +1,18 @@
-def normalize_text_lines(lines: list) -> list:
-    """
-    將 lines (list of str) 進行常見錯別字與不常用字修正，回傳修正後的新 list。
-    """
-    # 定義常見錯字與修正對應表（可依需求擴充）
-    replacements = [
-        ("有與趣", "有興趣"),
-        ("發照打工", "打工"),
-        ("取容消逝", "與顧客溝通"),
-        ("頭客服務態度", "良好的服務態度"),
-        ("餐飲然的工作環境", "餐飲業的工作環境"),
-        ("並苦於快速而對各", "並能快速應對各"),
-        ("絕心", "細心"),
-        ("閱爵", "閱讀"),
-        ("致與人溝通", "善於與人溝通"),
-        ("康納社", "康輔社"),
-        ("活動計班", "活動企劃"),
-        ("備案", "備案"),  # 若有誤可再調整
-        ("旦", ""),  # 若語意不通時移除
-        ("意度。", "意見。"),
-        ("技能: ,並苦於快速而對各", ""),
-        ("技能: 。", ""),
-        ("0", ""),  # 結尾孤立 0
-        ("10:00-18:0", "10:00-18:00"),
-    ]
-    def replace_all(text):
-        for old, new in replacements:
-            text = text.replace(old, new)
-        return text
-    return [replace_all(line) for line in lines]
 import io
 import os
 import time
 import json
 import re
+import hashlib
+import gzip
+import threading
+from array import array
+from bisect import bisect_right
+from itertools import accumulate, chain
+from types import SimpleNamespace
 
-import importlib.util
-from typing import List, Dict, Any, Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, FIRST_COMPLETED, wait
+from typing import List, Dict, Any, Tuple, Optional, Iterator
 
 from google import genai
 from google.genai import types
@@ -45,8 +22,31 @@ try:
 except ImportError:
     cv2 = None
 
+try:
+    import numpy as np  # type: ignore
+except ImportError:
+    np = None
+
+try:
+    import msgpack  # type: ignore
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None
+
+import text_metrics
+from keyword_matcher import KeywordMatcher
+from ocr_backends import OCRBackend, AzureReadBackend, TesseractBackend, pdf_text_layer, pages_to_read_results
+
+try:
+    import resume_structurer  # spaCy 於第一次結構化時才載入
+except ImportError:
+    resume_structurer = None
+
 from azure.cognitiveservices.vision.computervision import ComputerVisionClient
-from azure.cognitiveservices.vision.computervision.models import OperationStatusCodes
 from msrest.authentication import CognitiveServicesCredentials
 from dotenv import load_dotenv
 
@@ -62,6 +62,264 @@ def _env_flag(name: str, default: bool) -> bool:
         return default
     return raw.strip().lower() in {"1", "true", "yes", "on"}
 
+# 常見 OCR 錯字與修正對應表（可依需求擴充，或以 OCR_NORMALIZE_RULES 指定外部規則檔）
+DEFAULT_TEXT_REPLACEMENTS: List[Tuple[str, str]] = [
+    ("有與趣", "有興趣"),
+    ("發照打工", "打工"),
+    ("取容消逝", "與顧客溝通"),
+    ("頭客服務態度", "良好的服務態度"),
+    ("餐飲然的工作環境", "餐飲業的工作環境"),
+    ("並苦於快速而對各", "並能快速應對各"),
+    ("絕心", "細心"),
+    ("閱爵", "閱讀"),
+    ("致與人溝通", "善於與人溝通"),
+    ("康納社", "康輔社"),
+    ("活動計班", "活動企劃"),
+    ("備案", "備案"),  # 若有誤可再調整
+    ("旦", ""),  # 若語意不通時移除
+    ("意度。", "意見。"),
+    ("技能: ,並苦於快速而對各", ""),
+    ("技能: 。", ""),
+    ("0", ""),  # 結尾孤立 0
+    ("10:00-18:0", "10:00-18:00"),
+]
+
+class TextNormalizer:
+    """
+    把 (錯字, 修正) 規則編譯成單一 regex，一次掃描完成所有替換。
+    regex 以 trie 形式組成，同一位置只會沿著一條分支比對，成本與規則數量幾乎無關；
+    每個位置取最長的符合規則（leftmost-longest），替換後的文字不會再被其他規則處理。
+    """
+    def __init__(self, replacements: List[Tuple[str, str]]):
+        self.table: Dict[str, str] = {}
+        for old, new in replacements:
+            if old:
+                self.table[old] = new
+        self._pattern = re.compile(self._trie_pattern(self._build_trie(self.table))) if self.table else None
+
+    @staticmethod
+    def _build_trie(words) -> Dict[str, Any]:
+        trie: Dict[str, Any] = {}
+        for word in words:
+            node = trie
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[''] = True
+        return trie
+
+    @classmethod
+    def _trie_pattern(cls, node: Dict[str, Any]) -> str:
+        branches = [re.escape(ch) + cls._trie_pattern(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        if len(branches) == 1 and '' not in node:
+            return branches[0]
+        body = '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            # 此節點本身也是一條規則：先嘗試更長的分支，失敗才退回（貪婪的 ?）
+            body += '?'
+        return body
+
+    @staticmethod
+    def load_rules(path: str) -> List[Tuple[str, str]]:
+        """
+        讀取外部規則檔：.json 可為 [[錯字, 修正], ...] 或 {錯字: 修正}；
+        其他副檔名視為每行「錯字<TAB>修正」的文字檔，# 開頭為註解。
+        """
+        if path.lower().endswith('.json'):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            items = data.items() if isinstance(data, dict) else data
+            return [(str(old), str(new)) for old, new in items]
+        rules = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for raw in f:
+                line = raw.rstrip('\r\n')
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                old, _, new = line.partition('\t')
+                rules.append((old, new))
+        return rules
+
+    @classmethod
+    def from_file(cls, path: str = None, include_defaults: bool = True) -> "TextNormalizer":
+        rules = list(DEFAULT_TEXT_REPLACEMENTS) if include_defaults else []
+        if path:
+            rules.extend(cls.load_rules(path))
+        return cls(rules)
+
+    def normalize(self, text: str) -> str:
+        if not self._pattern or not text:
+            return text
+        table = self.table
+        return self._pattern.sub(lambda m: table[m.group(0)], text)
+
+    def normalize_lines(self, lines: list) -> list:
+        return [self.normalize(line) for line in lines]
+
+_default_normalizer: Optional[TextNormalizer] = None
+
+def normalize_text_lines(lines: list, normalizer: TextNormalizer = None) -> list:
+    """
+    將 lines (list of str) 進行常見錯別字與不常用字修正，回傳修正後的新 list。
+    未指定 normalizer 時使用預設規則（另載入 OCR_NORMALIZE_RULES 指定的規則檔），只編譯一次。
+    """
+    global _default_normalizer
+    if normalizer is None:
+        if _default_normalizer is None:
+            _default_normalizer = TextNormalizer.from_file(os.getenv("OCR_NORMALIZE_RULES") or None)
+        normalizer = _default_normalizer
+    return normalizer.normalize_lines(lines)
+
+class PollingPolicy:
+    """
+    Azure Read 結果輪詢策略：首次等待依上傳大小估計，之後指數退避並設有上限，
+    服務端回傳 Retry-After 時至少等待該秒數（但不會短於退避間隔，避免 Retry-After: 0 造成忙碌輪詢），
+    超過 timeout 秒即放棄（0 代表不限制，與快取、評分設定的 0 同義）。
+    """
+    def __init__(self, initial_delay: float = 0.5, delay_per_mb: float = 0.5, backoff: float = 1.5,
+                 max_delay: float = 5.0, timeout: float = 120.0, respect_retry_after: bool = True):
+        self.initial_delay = max(0.0, initial_delay)
+        self.delay_per_mb = max(0.0, delay_per_mb)
+        self.backoff = max(1.0, backoff)
+        self.max_delay = max(self.initial_delay, max_delay)
+        self.timeout = max(0.0, timeout)
+        self.respect_retry_after = respect_retry_after
+
+    def first_delay(self, payload_size: int) -> float:
+        """首次輪詢前的等待秒數：大檔（多頁 PDF）通常需要較久才會完成"""
+        size_mb = max(0, payload_size or 0) / (1024 * 1024)
+        return min(self.max_delay, self.initial_delay + self.delay_per_mb * size_mb)
+
+    def next_delay(self, previous: float, retry_after: Optional[float] = None) -> float:
+        delay = min(self.max_delay, max(previous, 0.05) * self.backoff)
+        if self.respect_retry_after and retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    @staticmethod
+    def parse_retry_after(value: Any) -> Optional[float]:
+        """Retry-After 可能是秒數或 HTTP 日期，無法解析時回傳 None"""
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            pass
+        try:
+            from email.utils import parsedate_to_datetime
+            return max(0.0, parsedate_to_datetime(str(value)).timestamp() - time.time())
+        except Exception:
+            return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "initial_delay": self.initial_delay,
+            "delay_per_mb": self.delay_per_mb,
+            "backoff": self.backoff,
+            "max_delay": self.max_delay,
+            "timeout": self.timeout,
+            "respect_retry_after": self.respect_retry_after,
+        }
+
+class TokenBucket:
+    """簡單 token bucket：每分鐘補充 per_minute 個、最多累積 capacity 個（執行緒安全）"""
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = max(per_minute, 1e-9) / 60.0
+        self.capacity = max(1.0, capacity if capacity is not None else per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """預扣 amount 個 token，回傳需等待的秒數（可能為 0）"""
+        amount = min(max(0.0, amount), self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= amount
+            wait = max(0.0, -self.tokens / self.rate, self.paused_until - now)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """暫停發放 token（例如收到 429），已在等待的呼叫也會延後"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + max(0.0, seconds))
+
+
+class GeminiRateLimiter:
+    """同時限制每分鐘請求數（RPM）與 token 數（TPM，0 代表不限制）"""
+    def __init__(self, rpm: float, tpm: float = 0):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    def acquire(self, estimated_tokens: int = 0) -> float:
+        wait = self.requests.reserve(1)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(estimated_tokens))
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        self.requests.pause(seconds)
+
+
+_gemini_limiters: Dict[Tuple[float, float], GeminiRateLimiter] = {}
+_gemini_limiters_lock = threading.Lock()
+
+# 一張圖片在 Gemini 約佔用的 token 數
+GEMINI_IMAGE_TOKENS = 258
+
+# Gemini 評分的取樣設定與 prompt 範本（變更任何一項都會讓 LLM 評分快取失效）
+GEMINI_SAMPLING = {
+    'temperature': 0.2,
+    'top_p': 0.95,
+    'top_k': 20,
+}
+GEMINI_TEXT_PROMPT = (
+    "請以專業人資角度，針對以下履歷內容給一個 0~100 分的分數，忽略排版與結構，只針對內容評分，並簡要說明理由：\n"
+    "{resume_text}\n"
+    "請回傳 JSON 格式，如：{\"score\": 85, \"reason\": \"內容完整，經歷豐富\"}"
+)
+GEMINI_BATCH_PROMPT = (
+    "以下有 {count} 份履歷，以「=== 履歷 id=... ===」分隔。"
+    "請以專業人資角度，分別針對每份履歷內容給一個 0~100 分的分數，忽略排版與結構，只針對內容評分，並簡要說明理由：\n"
+    "{sections}\n"
+    "請只回傳 JSON 陣列，每份一個物件，如：[{\"id\": \"r0\", \"score\": 85, \"reason\": \"內容完整，經歷豐富\"}]"
+)
+GEMINI_VISION_PROMPT = (
+    "這是一份履歷的掃描影像。請以專業人資角度，根據整個文件的視覺佈局、內容完整度與專業程度，"
+    "給一個 0~100 分的分數，並簡要說明理由。請特別注意：\n"
+    "- 佈局是否清晰有序\n"
+    "- 內容是否完整（聯絡資訊、工作經歷、學歷等）\n"
+    "- 排版與視覺專業度\n"
+    "- 文字清晰度與可讀性\n\n"
+    "請回傳 JSON 格式，如：{\"score\": 85, \"reason\": \"佈局清晰，內容完整，排版專業\"}"
+)
+
+
+def get_gemini_rate_limiter(rpm: float, tpm: float = 0) -> GeminiRateLimiter:
+    """同一行程內相同 RPM/TPM 設定共用同一個 limiter，多個 OCRProcessor 也不會超過配額"""
+    key = (float(rpm), float(tpm))
+    with _gemini_limiters_lock:
+        limiter = _gemini_limiters.get(key)
+        if limiter is None:
+            limiter = _gemini_limiters[key] = GeminiRateLimiter(rpm, tpm)
+        return limiter
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估 token 數：CJK 約一字一 token，其餘約四字元一 token"""
+    cjk = sum(1 for ch in text if '\u3000' <= ch <= '\u9fff' or '\uff00' <= ch <= '\uffef')
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
 class OCRConfig:
     """簡化的 OCR 配置，主要用於排序容差與支援副檔名"""
     def __init__(self):
@@ -69,11 +327,87 @@ class OCRConfig:
         self.endpoint = os.getenv("AZURE_ENDPOINT")
         # 不拋錯，讓呼叫端決定是否可用
         self.supported_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.pdf']
-        self.y_tolerance = 16  # 群組化時的垂直容差（像素或相對單位）
-        # 常用關鍵字（用於 heuristics）
+        self.y_tolerance = 16  # 群組化時的垂直容差（像素）
+        # y_tolerance 以此解析度的像素計；座標單位為 inch 的頁面（Azure 的 PDF 結果、PDF 文字層）容差為 y_tolerance / y_tolerance_dpi
+        self.y_tolerance_dpi = 300
+        # 行數達此門檻且有 numpy 時，列群組化改走向量化路徑（0 代表停用；僅對單列很長的表格頁有利）
+        self.row_grouping_numpy_threshold = max(0, int(os.getenv("OCR_ROW_GROUPING_NUMPY_THRESHOLD", "0")))
+        # 批次模式同時進行中的 Azure Read 數量上限（1 代表逐檔處理）
+        self.batch_workers = max(1, int(os.getenv("OCR_BATCH_WORKERS", "1")))
+        # 前處理行程池大小（0 代表在上傳執行緒內直接前處理）與可領先上傳的檔案數
+        self.preprocess_workers = max(0, int(os.getenv("OCR_PREPROCESS_WORKERS", "0")))
+        self.preprocess_prefetch = max(1, int(os.getenv("OCR_PREPROCESS_PREFETCH", "4")))
+        # Gemini 評分設定：模型、配額（每分鐘請求數 / token 數，TPM 為 0 代表不限制）、重試次數與評分執行緒數
+        self.gemini_model = os.getenv("GEMINI_MODEL", "gemini-3-pro-preview")
+        self.gemini_rpm = max(1.0, float(os.getenv("GEMINI_RPM", "5")))
+        self.gemini_tpm = max(0.0, float(os.getenv("GEMINI_TPM", "0")))
+        self.gemini_max_retries = max(1, int(os.getenv("GEMINI_MAX_RETRIES", "3")))
+        # 批次評分：每個請求最多放幾份履歷（1 代表不合併）與每批的 token 預算
+        self.gemini_batch_size = max(1, int(os.getenv("GEMINI_BATCH_SIZE", "1")))
+        self.gemini_batch_token_budget = max(1, int(os.getenv("GEMINI_BATCH_TOKEN_BUDGET", "24000")))
+        self.scoring_workers = max(1, int(os.getenv("OCR_SCORING_WORKERS", "2")))
+        # 評分模式：inline（OCR 後直接評分）、deferred（先存 OCR JSON，背景評分後寫回）、off（不評分）
+        self.scoring_mode = os.getenv("OCR_SCORING_MODE", "inline").strip().lower()
+        # deferred 模式的寫回位置：inplace（原 OCR JSON）或 sidecar（另存 resume_score_<name>.json）
+        self.scoring_output = os.getenv("OCR_SCORING_OUTPUT", "inplace").strip().lower()
+        # deferred 模式下排隊中的評分上限，超過時標記為 deferred，之後可用 score_ocr_json_file 補評分（0 代表不限）
+        self.scoring_max_pending = max(0, int(os.getenv("OCR_SCORING_MAX_PENDING", "0")))
+        # 輸出格式：full（縮排 JSON）、compact（無縮排並去除可還原的重複文字）、msgpack（compact 的二進位版）
+        self.output_profile = os.getenv("OCR_OUTPUT_PROFILE", "full").strip().lower()
+        # 輸出壓縮：none、gzip、zstd（需安裝 zstandard）
+        self.output_compression = os.getenv("OCR_OUTPUT_COMPRESSION", "none").strip().lower()
+        # 逐頁串流輸出（process_file_stream + JSON Lines），適合上百頁的掃描檔；單檔與批次（OCR_BATCH_WORKERS > 1）模式皆適用
+        self.stream_output = _env_flag("OCR_STREAM_OUTPUT", False)
+        # OCR 完成後直接在記憶體中做履歷結構化（resume_structurer），另存 resume_structured_<name>.json
+        self.structure_resume = _env_flag("OCR_STRUCTURE_RESUME", False)
+        # Gemini 評分快取（相同模型 / prompt / 取樣設定 / 履歷內容不再重複呼叫）
+        self.enable_llm_cache = _env_flag("OCR_LLM_CACHE_ENABLE", True)
+        self.llm_cache_dir = os.getenv("OCR_LLM_CACHE_DIR", ".llm_score_cache")
+        self.llm_cache_max_entries = max(0, int(os.getenv("OCR_LLM_CACHE_MAX_ENTRIES", "20000")))
+        self.llm_cache_max_age = max(0.0, float(os.getenv("OCR_LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))))
+        # OCR 引擎：azure（Azure Read API）或 tesseract（本機 Tesseract，需安裝 pytesseract / pdf2image）
+        self.ocr_backend = os.getenv("OCR_BACKEND", "azure").strip().lower()
+        self.tesseract_lang = os.getenv("OCR_TESSERACT_LANG", "chi_tra+eng")
+        self.tesseract_dpi = max(72, int(os.getenv("OCR_TESSERACT_DPI", "300")))
+        # PDF 逐頁點陣化 + 辨識的行程數（0 代表 CPU 核心數）
+        self.tesseract_workers = max(0, int(os.getenv("OCR_TESSERACT_WORKERS", "0")))
+        self.tesseract_cmd = os.getenv("TESSERACT_CMD") or None
+        # 匯入模式：full（每次掃描並處理 assets 全部檔案）、incremental（依 manifest 只處理新增或變更的檔案）、
+        # watch（incremental 加上持續監看資料夾）
+        self.ingest_mode = os.getenv("OCR_INGEST_MODE", "full").strip().lower()
+        self.ingest_manifest_path = os.getenv("OCR_INGEST_MANIFEST", ".ocr_manifest.sqlite3")
+        # 忽略資料夾 mtime 完整比對一次（找出原地覆寫的檔案）
+        self.ingest_full_rescan = _env_flag("OCR_INGEST_FULL_RESCAN", False)
+        # watch 模式下距上次完整比對超過此秒數時自動完整比對（原地覆寫不會改變資料夾 mtime；0 代表只在 OCR_INGEST_FULL_RESCAN 時）
+        # 一次性的 incremental 不受影響，啟動成本不隨封存檔案數增加
+        self.ingest_full_rescan_interval = max(0.0, float(os.getenv("OCR_INGEST_FULL_RESCAN_INTERVAL", "300")))
+        # mtime 在此秒數內的檔案視為仍在寫入，下一輪再處理
+        self.ingest_settle_seconds = max(0.0, float(os.getenv("OCR_INGEST_SETTLE_SECONDS", "2")))
+        # 失敗檔案的最多嘗試次數（檔案內容變更後重新計算）
+        self.ingest_max_attempts = max(1, int(os.getenv("OCR_INGEST_MAX_ATTEMPTS", "3")))
+        # watch 模式的輪詢間隔（有 watchdog 時為事件之間的最長等待）
+        self.watch_interval = max(0.1, float(os.getenv("OCR_WATCH_INTERVAL", "5")))
+        # 有文字層的 PDF 頁面直接取文字與座標，只有掃描影像頁才送 OCR（需安裝 pdfplumber）
+        self.pdf_text_layer = _env_flag("OCR_PDF_TEXT_LAYER", True)
+        # 文字層有效字數達此門檻才視為數位頁面
+        self.pdf_text_min_chars = max(1, int(os.getenv("OCR_PDF_TEXT_MIN_CHARS", "20")))
+        # Azure Read 結果輪詢策略（OCR_POLL_TIMEOUT 為 0 代表不限制）
+        self.polling = PollingPolicy(
+            initial_delay=float(os.getenv("OCR_POLL_INITIAL_DELAY", "0.5")),
+            delay_per_mb=float(os.getenv("OCR_POLL_DELAY_PER_MB", "0.5")),
+            backoff=float(os.getenv("OCR_POLL_BACKOFF", "1.5")),
+            max_delay=float(os.getenv("OCR_POLL_MAX_DELAY", "5")),
+            timeout=float(os.getenv("OCR_POLL_TIMEOUT", "120")),
+            respect_retry_after=_env_flag("OCR_POLL_RESPECT_RETRY_AFTER", True),
+        )
+        # 錯字修正規則檔（.json 或 TAB 分隔文字檔），會附加在內建規則之後
+        self.normalize_rules_path = os.getenv("OCR_NORMALIZE_RULES") or None
+        # 常用關鍵字（用於 heuristics；同一行命中多個時以排在前面的為準）
         self.keywords = ['姓名','中文姓名','name','手機','電話','phone','Email','E-mail','email',
                          '地址','通訊地址','居住地','學校','學歷','科系','性別','生日','出生日期',
                          '應徵職務','職稱','自傳','簡介','工作經歷','技能','證照','語言能力']
+        # 履歷評分的關鍵字，每命中一個加 5 分（上限 40）
+        self.score_keywords = ['工作經歷','工作技能','技能','學歷','專業證照','證照','語言能力','自傳','簡介','專長']
         # 影像前處理參數，可透過環境變數覆寫
         self.enable_preprocess = _env_flag("OCR_ENABLE_PREPROCESS", True)
         self.preprocess = {
@@ -90,11 +424,548 @@ class OCRConfig:
             "upscale_factor": float(os.getenv("OCR_PREPROCESS_UPSCALE_FACTOR", "1.5")),
             "save_image": _env_flag("OCR_PREPROCESS_SAVE_IMAGE", False),
             "save_dir": os.getenv("OCR_PREPROCESS_SAVE_DIR", os.path.join("assets", "processed_images")),
-            "filename_suffix": os.getenv("OCR_PREPROCESS_FILENAME_SUFFIX", "_processed") or "_processed"
+            "filename_suffix": os.getenv("OCR_PREPROCESS_FILENAME_SUFFIX", "_processed") or "_processed",
+            # 前處理流程：none / light / full / photo，或 auto（依縮圖的對比、雜訊、解析度逐張挑選）
+            # 預設 full 維持原本的行為；auto 需搭配 encode=auto 才能確保上傳量不增加
+            "profile": os.getenv("OCR_PREPROCESS_PROFILE", "full").strip().lower(),
+            # auto 的判斷門檻：紙張亮度（第 95 百分位）、雜訊標準差、對比（第 95 - 第 5 百分位）
+            "auto_paper_level": float(os.getenv("OCR_PREPROCESS_AUTO_PAPER_LEVEL", "200")),
+            "auto_noise": float(os.getenv("OCR_PREPROCESS_AUTO_NOISE", "1.5")),
+            "auto_contrast": float(os.getenv("OCR_PREPROCESS_AUTO_CONTRAST", "120")),
+            # auto 時短邊低於此像素數的影像放大（最多 2 倍；0 代表不自動放大）
+            "min_side": max(0, int(os.getenv("OCR_PREPROCESS_MIN_SIDE", "800"))),
+            # 編碼：fixed（使用 output_format）、auto（符合品質門檻的候選中取最小，不前處理時連同原檔比較）、
+            # smallest（所有候選格式都試，含二值影像存 JPEG）
+            "encode": os.getenv("OCR_PREPROCESS_ENCODE", "fixed").strip().lower(),
+            "jpeg_quality": min(100, max(1, int(os.getenv("OCR_PREPROCESS_JPEG_QUALITY", "90")))),
         }
+        # OCR 結果快取（以檔案內容 + 前處理設定為 key，保存 Azure 原始 read_results）
+        self.enable_cache = _env_flag("OCR_CACHE_ENABLE", True)
+        self.cache_dir = os.getenv("OCR_CACHE_DIR", ".ocr_cache")
+        self.cache_max_entries = max(0, int(os.getenv("OCR_CACHE_MAX_ENTRIES", "5000")))
+        self.cache_max_bytes = max(0, int(os.getenv("OCR_CACHE_MAX_BYTES", str(512 * 1024 * 1024))))
+        self.cache_max_age = max(0.0, float(os.getenv("OCR_CACHE_MAX_AGE_SECONDS", str(30 * 24 * 3600))))
+
+class DiskCache:
+    """
+    以「一個 key 一個 JSON 檔」存放的磁碟快取。
+    依筆數、總大小與存活時間（TTL，以項目的 created 欄位計）淘汰舊資料（0 代表不限制）；
+    讀取時更新 mtime，超出上限時由最久未使用者開始刪除（LRU）。
+    寫入時只累計筆數與大小，超出上限（或距上次淘汰超過 EVICT_INTERVAL 秒且有設 TTL）才掃描目錄，
+    並刪到上限的 EVICT_TARGET 比例，避免每次寫入都列出整個目錄。
+    """
+    EVICT_INTERVAL = 60.0
+    EVICT_TARGET = 0.9
+    # put 把 created 寫在 JSON 最前面，淘汰時只需讀檔頭
+    _RE_CREATED = re.compile(rb'\{"created":\s*(-?[0-9][0-9.eE+-]*)')
+
+    def __init__(self, cache_dir: str, max_entries: int = 0, max_bytes: int = 0, max_age: float = 0):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 目錄內的筆數與大小估計，None 代表尚未掃描（第一次寫入時掃描）
+        self._entry_count: Optional[int] = None
+        self._entry_bytes = 0
+        self._last_evict = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def contains(self, key: str) -> bool:
+        """只檢查是否存在，不計入命中統計"""
+        return os.path.exists(self._entry_path(key))
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._entry_path(key)
+        entry = None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            created = entry.get("created") if isinstance(entry, dict) else None
+            if created is None:
+                created = os.path.getmtime(path)
+            if self.max_age and time.time() - created > self.max_age:
+                # 超過 TTL 視為未命中
+                self._remove(path)
+                entry = None
+            else:
+                # 更新 mtime，淘汰時以最近使用時間排序
+                os.utime(path, None)
+        except (OSError, ValueError):
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        entry = {"created": time.time(), **entry}
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False)
+        size = os.path.getsize(tmp_path)
+        try:
+            previous = os.path.getsize(path)
+        except OSError:
+            previous = None
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._entry_count is not None:
+                self._entry_count += 1 if previous is None else 0
+                self._entry_bytes += size - (previous or 0)
+        if self._evict_due():
+            self.evict()
+
+    def _evict_due(self) -> bool:
+        with self._lock:
+            if self._entry_count is None:
+                return True
+            if self.max_entries and self._entry_count > self.max_entries:
+                return True
+            if self.max_bytes and self._entry_bytes > self.max_bytes:
+                return True
+            return bool(self.max_age) and time.monotonic() - self._last_evict >= min(self.max_age, self.EVICT_INTERVAL)
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self.evictions += 1
+
+    def _entries(self) -> List[Tuple[float, int, str]]:
+        entries = []
+        for fn in os.listdir(self.cache_dir):
+            if not fn.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, fn)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _created(self, path: str, mtime: float) -> float:
+        """項目的 created 欄位；舊格式（created 不在最前面）整檔解析，沒有 created 時以 mtime 計"""
+        try:
+            with open(path, 'rb') as f:
+                m = self._RE_CREATED.match(f.read(64))
+                if m:
+                    return float(m.group(1))
+                f.seek(0)
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return mtime
+        created = entry.get("created") if isinstance(entry, dict) else None
+        return float(created) if isinstance(created, (int, float)) else mtime
+
+    def evict(self) -> None:
+        """
+        刪除過期項目（TTL 以 created 計，讀取會更新 mtime，常被讀取的項目仍會到期）；
+        超出筆數或大小上限時由最久未使用（mtime 最舊）者開始刪除，直到上限的 EVICT_TARGET 比例
+        （留下空間，接下來的寫入不必馬上再掃描目錄）。
+        """
+        entries = sorted(self._entries())
+        if self.max_age:
+            cutoff = time.time() - self.max_age
+            # created 不晚於最後寫入 / 讀取時間，mtime 已早於 cutoff 者不必讀檔即可判定過期
+            expired = [e for e in entries if e[0] < cutoff or self._created(e[2], e[0]) < cutoff]
+            for entry in expired:
+                self._remove(entry[2])
+            expired_paths = {e[2] for e in expired}
+            entries = [e for e in entries if e[2] not in expired_paths]
+        total_bytes = sum(e[1] for e in entries)
+        max_entries = int(self.max_entries * self.EVICT_TARGET) if len(entries) > self.max_entries else self.max_entries
+        max_bytes = int(self.max_bytes * self.EVICT_TARGET) if total_bytes > self.max_bytes else self.max_bytes
+        while entries and ((self.max_entries and len(entries) > max_entries)
+                           or (self.max_bytes and total_bytes > max_bytes)):
+            _, size, path = entries.pop(0)
+            self._remove(path)
+            total_bytes -= size
+        with self._lock:
+            self._entry_count = len(entries)
+            self._entry_bytes = total_bytes
+            self._last_evict = time.monotonic()
+
+    def counters(self) -> Dict[str, Any]:
+        """只回傳命中統計（不掃描目錄）"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._entries()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(entries),
+                "bytes": sum(e[1] for e in entries),
+            }
+
+class OCRResultCache(DiskCache):
+    """
+    OCR 原始結果的磁碟快取。
+    key = SHA-256(輸入檔案位元組) + 前處理設定（與 OCR 引擎）指紋；value 為 read_results（僅保留 process_page 需要的欄位），
+    因此調整 heuristics 後可離線重跑 process_page。
+    """
+    # 只影響輸出副本、不影響上傳內容的設定不列入指紋
+    _FINGERPRINT_EXCLUDE = {"save_image", "save_dir", "filename_suffix"}
+    # 設定為這些值時等同加入前處理 profile 之前的行為，不列入指紋（既有快取仍可命中）
+    _FINGERPRINT_LEGACY = {"profile": "full", "encode": "fixed"}
+
+    @classmethod
+    def preprocess_fingerprint(cls, config: "OCRConfig") -> str:
+        settings = {k: v for k, v in config.preprocess.items() if k not in cls._FINGERPRINT_EXCLUDE}
+        for key, legacy in cls._FINGERPRINT_LEGACY.items():
+            if settings.get(key, legacy) == legacy:
+                settings.pop(key, None)
+        # 沒用到的參數不影響上傳內容
+        if settings.get("profile") != "auto":
+            for key in ("auto_paper_level", "auto_noise", "auto_contrast", "min_side"):
+                settings.pop(key, None)
+        if "encode" not in settings:
+            settings.pop("jpeg_quality", None)
+        fingerprint = {
+            "enable_preprocess": config.enable_preprocess,
+            "cv2": cv2 is not None,
+            "preprocess": settings,
+        }
+        # 非 Azure 的引擎另外列入指紋（Azure 維持原本的 key，既有快取仍可命中）
+        if config.ocr_backend == "tesseract":
+            fingerprint["backend"] = {"name": "tesseract", "lang": config.tesseract_lang, "dpi": config.tesseract_dpi}
+        payload = json.dumps(fingerprint, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    @staticmethod
+    def file_digest(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def make_key(self, file_path: str, config: "OCRConfig") -> str:
+        key = f"{self.file_digest(file_path)}-{self.preprocess_fingerprint(config)}"
+        # 使用文字層的 PDF 結果與整份 OCR 不同，另外區分（影像檔的 key 不變）
+        if config.pdf_text_layer and file_path.lower().endswith(".pdf"):
+            key += f"-text{config.pdf_text_min_chars}"
+        return key
+
+    @staticmethod
+    def serialize_read_results(read_results: List[Any]) -> List[Dict[str, Any]]:
+        """Azure ReadResult -> 可存成 JSON 的 dict（僅保留 process_page 用到的欄位）"""
+        pages = []
+        for page in read_results or []:
+            lines = []
+            for line in getattr(page, 'lines', None) or []:
+                bbox = getattr(line, 'bounding_box', None)
+                lines.append({
+                    "text": getattr(line, 'text', ''),
+                    "bounding_box": [float(v) for v in bbox] if bbox else None,
+                })
+            pages.append({
+                "page": getattr(page, 'page', None),
+                "angle": getattr(page, 'angle', None),
+                "width": getattr(page, 'width', None),
+                "height": getattr(page, 'height', None),
+                "unit": str(getattr(page, 'unit', '') or ''),
+                "lines": lines,
+            })
+        return pages
+
+    @staticmethod
+    def deserialize_read_results(pages: List[Dict[str, Any]]) -> List[Any]:
+        """dict -> 與 Azure ReadResult 相容的物件（提供 lines[].text / bounding_box）"""
+        restored = []
+        for page in pages or []:
+            lines = [SimpleNamespace(text=l.get("text", ""), bounding_box=l.get("bounding_box"))
+                     for l in page.get("lines", [])]
+            restored.append(SimpleNamespace(**{**page, "lines": lines}))
+        return restored
+
+class LLMScoreCache(DiskCache):
+    """
+    Gemini 評分結果的磁碟快取，相同履歷（或同一張影像）不再重複呼叫 LLM。
+    key = SHA-256(模型名稱 + prompt 範本 + 取樣設定 + 正規化後的履歷文字或影像位元組)。
+    """
+    @staticmethod
+    def normalize_text(text: str) -> str:
+        """只用於計算 key：忽略空白與換行差異"""
+        return " ".join((text or "").split())
+
+    def make_key(self, model: str, prompt_template: str, sampling: Dict[str, Any], content: Any) -> str:
+        digest = hashlib.sha256()
+        header = json.dumps({"model": model, "prompt": prompt_template, "sampling": sampling},
+                            sort_keys=True, ensure_ascii=False)
+        digest.update(header.encode('utf-8'))
+        digest.update(b"\0")
+        if isinstance(content, bytes):
+            digest.update(content)
+        else:
+            digest.update(self.normalize_text(content).encode('utf-8'))
+        return digest.hexdigest()
+
+
+PREPROCESS_PROFILES = ("none", "light", "full", "photo")
+
+
+def image_stats(gray: Any, max_side: int = 512) -> Dict[str, float]:
+    """
+    在縮圖（長邊 max_side）上計算選擇 profile 用的統計值，成本約數毫秒：
+    paper（第 95 百分位亮度，約為紙張底色）、contrast（第 95 - 第 5 百分位）、
+    noise（Immerkær 雜訊核的 MAD 估計；文字筆畫只佔少數像素，中位數主要反映底色雜訊）、
+    midtones（介於 60~195 的像素比例；翻拍照片的灰底會很高）、width / height（原圖尺寸）。
+    """
+    height, width = gray.shape[:2]
+    scale = max_side / max(height, width)
+    thumb = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1 else gray
+    p5, p95 = np.percentile(thumb, (5, 95))
+    kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+    response = np.abs(cv2.filter2D(thumb, cv2.CV_32F, kernel)[1:-1, 1:-1])
+    noise = 1.4826 * float(np.median(response)) / 6.0
+    midtones = np.count_nonzero((thumb > 60) & (thumb < 195)) / thumb.size
+    return {
+        "width": int(width),
+        "height": int(height),
+        "paper": round(float(p95), 1),
+        "contrast": round(float(p95 - p5), 1),
+        "noise": round(noise, 2),
+        "midtones": round(float(midtones), 3),
+    }
+
+
+def select_profile(stats: Dict[str, float], settings: Dict[str, Any]) -> str:
+    """
+    依縮圖統計挑選 profile：
+    灰底或大量中間調（翻拍照片、光線不均）-> photo；白底但雜訊高（掃描雜點、JPEG 壓縮痕跡）-> full；
+    白底乾淨但對比低（淡色文字）-> light；白底乾淨且對比足夠（截圖、數位檔）-> none（上傳原檔）。
+    """
+    if stats["paper"] < settings.get("auto_paper_level", 200) or stats["midtones"] > 0.5:
+        return "photo"
+    if stats["noise"] >= settings.get("auto_noise", 1.5):
+        return "full"
+    if stats["contrast"] < settings.get("auto_contrast", 120):
+        return "light"
+    return "none"
+
+
+def _apply_profile(image: Any, profile: str, settings: Dict[str, Any]) -> Any:
+    """
+    灰階影像套用指定 profile（皆為 OpenCV 的整張影像運算）：
+    light = 去雜點 + CLAHE（輸出灰階）；full = light + 銳利化 + 自適應二值化；
+    photo = 除以估計的背景亮度（去除翻拍的光線不均）+ 去雜點 + 自適應二值化。
+    photo 不做 CLAHE / 銳利化：背景已被拉平，再增強只會放大紙張紋理。
+    """
+    if profile == "photo":
+        # 以大範圍模糊估計背景亮度再相除；背景在 1/4 縮圖上估計以節省時間
+        small = cv2.resize(image, None, fx=0.25, fy=0.25, interpolation=cv2.INTER_AREA)
+        background = cv2.GaussianBlur(small, (0, 0), max(small.shape) / 30.0)
+        background = cv2.resize(background, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_LINEAR)
+        flattened = cv2.divide(image, background, scale=255)
+        return cv2.adaptiveThreshold(
+            cv2.medianBlur(flattened, settings["median_kernel"]),
+            255,
+            cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+            cv2.THRESH_BINARY,
+            settings["adaptive_block"],
+            settings["adaptive_c"],
+        )
+    denoised = cv2.medianBlur(image, settings["median_kernel"])
+    clahe = cv2.createCLAHE(
+        clipLimit=settings["clahe_clip"],
+        tileGridSize=(settings["clahe_grid"], settings["clahe_grid"])
+    ).apply(denoised)
+    if profile == "light":
+        return clahe
+    blur = cv2.GaussianBlur(clahe, (0, 0), settings["gaussian_sigma"])
+    sharpen = cv2.addWeighted(
+        clahe,
+        settings["unsharp_amount"],
+        blur,
+        -settings["unsharp_subtract"],
+        0
+    )
+    return cv2.adaptiveThreshold(
+        sharpen,
+        255,
+        cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+        cv2.THRESH_BINARY,
+        settings["adaptive_block"],
+        settings["adaptive_c"],
+    )
+
+
+def _encode_image(image: Any, binary: bool, settings: Dict[str, Any]) -> Tuple[Optional[bytes], str]:
+    """
+    依 settings["encode"] 編碼，回傳 (位元組, 副檔名)：
+    fixed 使用 output_format；auto 只比較不損及辨識的候選：二值影像存 1-bit PNG
+    （比 8-bit PNG 小數倍且編碼較快，JPEG 會在筆畫邊緣產生雜點）、灰階比較 JPEG 與 PNG；
+    smallest 把候選格式都編碼一次，取最小者。
+    """
+    mode = settings.get("encode", "fixed")
+    png = [cv2.IMWRITE_PNG_BILEVEL, 1] if binary else [cv2.IMWRITE_PNG_COMPRESSION, 3]
+    jpeg = [cv2.IMWRITE_JPEG_QUALITY, int(settings.get("jpeg_quality", 90))]
+    if mode == "auto":
+        candidates = [(".png", png)] if binary else [(".jpg", jpeg), (".png", png)]
+    elif mode == "smallest":
+        candidates = [(".png", png), (".jpg", jpeg)]
+    else:
+        fmt = (settings["output_format"] or ".png").lower()
+        if fmt not in {'.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif'}:
+            fmt = '.png'
+        candidates = [(fmt, [])]
+    best: Tuple[Optional[bytes], str] = (None, candidates[0][0])
+    for ext, params in candidates:
+        success, buffer = cv2.imencode(ext, image, params)
+        if success and (best[0] is None or buffer.size < len(best[0])):
+            best = (buffer.tobytes(), ext)
+    return best
+
+
+def preprocess_image(file_path: str, settings: Dict[str, Any]) -> Tuple[Optional[bytes], Dict[str, Any]]:
+    """
+    依 settings["profile"]（auto 時依影像統計挑選）前處理影像並編碼，回傳 (位元組, 紀錄)。
+    位元組為 None 代表不前處理（profile 為 none 或失敗），上傳原檔。
+    紀錄包含 profile、auto 的統計值、放大倍率、編碼格式與大小，會寫入輸出 JSON 的 preprocess；
+    profile 為 gray 代表未前處理、只轉成灰階重新編碼（比原檔小時）。
+    不依賴 OCRProcessor 狀態，可直接交給 process pool 執行。
+    """
+    requested = settings.get("profile", "full")
+    info: Dict[str, Any] = {"profile": requested}
+    try:
+        image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            info["profile"] = "none"
+            return None, info
+        factor = 1.0
+        if settings.get("upscale"):
+            factor = max(1.0, float(settings.get("upscale_factor", 1.5)))
+        if requested == "auto":
+            stats = image_stats(image)
+            info["auto"] = stats
+            info["profile"] = profile = select_profile(stats, settings)
+            short_side = min(stats["width"], stats["height"])
+            min_side = settings.get("min_side", 0)
+            if profile != "none" and min_side and short_side < min_side:
+                factor = max(factor, min(2.0, min_side / max(1, short_side)))
+        else:
+            profile = requested if requested in PREPROCESS_PROFILES else "full"
+            info["profile"] = profile
+        if profile == "none":
+            if settings.get("encode") in ("auto", "smallest"):
+                # 候選：原檔（none）、灰階重新編碼（gray）；auto 挑到 none 時再加上 full（原本的預設流程），取最小者上傳
+                original = os.path.getsize(file_path)
+                best: Tuple[Optional[bytes], str, str] = (None, "", "none")
+                candidates = [("gray", image, False)]
+                if requested == "auto":
+                    candidates.append(("full", _apply_profile(image, "full", settings), True))
+                for name, candidate, binary in candidates:
+                    data, fmt_ext = _encode_image(candidate, binary, settings)
+                    if data is not None and len(data) < (len(best[0]) if best[0] is not None else original):
+                        best = (data, fmt_ext, name)
+                data, fmt_ext, chosen = best
+                if data is not None:
+                    info.update({"profile": chosen, "format": fmt_ext, "bytes": len(data), "original_bytes": original})
+                    return data, info
+            return None, info
+        if factor > 1.0001:
+            image = cv2.resize(image, None, fx=factor, fy=factor, interpolation=cv2.INTER_CUBIC)
+            info["upscale"] = round(factor, 2)
+        processed = _apply_profile(image, profile, settings)
+        data, fmt_ext = _encode_image(processed, profile != "light", settings)
+        if data is None:
+            return None, info
+        info["format"] = fmt_ext
+        info["bytes"] = len(data)
+        info["original_bytes"] = os.path.getsize(file_path)
+        if settings.get("save_image"):
+            # Save a copy of the processed image using configured path/suffix for reference
+            rel_dir = settings.get("save_dir") or os.path.join("assets", "processed_images")
+            if os.path.isabs(rel_dir):
+                processed_dir = rel_dir
+            else:
+                processed_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), rel_dir)
+            os.makedirs(processed_dir, exist_ok=True)
+            base_name = os.path.splitext(os.path.basename(file_path))[0]
+            suffix = settings.get("filename_suffix") or "_processed"
+            processed_path = os.path.join(processed_dir, f"{base_name}{suffix}{fmt_ext}")
+            print(f"[OCR] saving processed image to {processed_path}")
+            try:
+                with open(processed_path, 'wb') as f:
+                    f.write(data)
+            except Exception:
+                pass
+        return data, info
+    except Exception:
+        return None, info
+
+
+def preprocess_image_file(file_path: str, settings: Dict[str, Any]) -> Optional[bytes]:
+    """
+    前處理影像後輸出為位元組串，不前處理或失敗時回傳 None（見 preprocess_image）。
+    """
+    return preprocess_image(file_path, settings)[0]
+
+
+def _init_preprocess_worker():
+    # 每個子行程只用單執行緒，避免 OpenCV 內部執行緒與行程池互搶 CPU
+    if cv2 is not None:
+        try:
+            cv2.setNumThreads(1)
+        except Exception:
+            pass
+
+
+def _timed_preprocess(file_path: str, settings: Dict[str, Any]) -> Tuple[Optional[bytes], Dict[str, Any], float]:
+    started = time.perf_counter()
+    data, info = preprocess_image(file_path, settings)
+    return data, info, time.perf_counter() - started
+
+
+def format_page_text(compact_contact: Dict[str, str], structured_lines: List[str],
+                     grouped_lines: List[str], reading_order_lines: List[str]) -> str:
+    """組出頁面的 formatted_text（process_page 與精簡輸出還原共用）"""
+    # 若有至少一項資訊，建立一行格式化字串放在最前面（不包含座標或原始行/rows）
+    contact_line_parts = []
+    if compact_contact.get("姓名"):
+        contact_line_parts.append(f"姓名: {compact_contact['姓名']}")
+    if compact_contact.get("手機"):
+        contact_line_parts.append(f"手機: {compact_contact['手機']}")
+    if compact_contact.get("Email"):
+        contact_line_parts.append(f"Email: {compact_contact['Email']}")
+    contact_line = "    ".join(contact_line_parts) if contact_line_parts else ""
+
+    # formatted_text 盡量採用結構化或群組化的行，讓相關內容同列顯示
+    prioritized_lines = structured_lines or grouped_lines or reading_order_lines
+    formatted_page_text = "\n".join(prioritized_lines)
+    if contact_line:
+        return contact_line + "\n\n" + formatted_page_text
+    return formatted_page_text
+
 
 class TextLine:
-    """簡單行資料結構（從 bounding_box 推算 x1,y1,x2,y2）"""
+    """簡單行資料結構（從 bounding_box 推算 x1,y1,x2,y2）；__slots__ 免去每個實例的 __dict__"""
+    __slots__ = ("text", "x1", "y1", "x2", "y2", "center_x", "center_y")
+
     def __init__(self, text: str, bbox: List[float]):
         self.text = (text or '').strip()
         # Azure read boundingBox 通常為 8 floats: [x0,y0,x1,y1,x2,y2,x3,y3]
@@ -111,28 +982,94 @@ class TextLine:
     def to_dict(self) -> Dict[str, Any]:
         return {"text": self.text, "x1": self.x1, "y1": self.y1, "x2": self.x2, "y2": self.y2}
 
+
+class PageLines:
+    """
+    一頁的行資料，以欄位為單位存放：座標與中心點為 array('d')，
+    所有文字串接成一個字串並以 offsets 切分，每行不再各自配置 Python 物件。
+    行已依 (center_y, x1) 排序；需要單行物件時以 line(i) 取得 TextLine。
+    """
+    __slots__ = ("_text", "_offsets", "x1", "y1", "x2", "y2", "center_x", "center_y")
+
+    def __init__(self, items: Iterator[Tuple[str, Any]] = ()):
+        texts: List[str] = []
+        columns = [array('d') for _ in range(4)]
+        for text, bbox in items:
+            texts.append((text or '').strip())
+            # 與 TextLine 相同的 bounding box 解讀方式
+            if bbox and len(bbox) >= 6:
+                coords = (float(bbox[0]), float(bbox[1]), float(bbox[4]), float(bbox[5]))
+            else:
+                coords = (0.0, 0.0, 0.0, 0.0)
+            for column, value in zip(columns, coords):
+                column.append(value)
+        x1, y1, x2, y2 = columns
+        center_x = array('d', ((a + b) / 2 for a, b in zip(x1, x2)))
+        center_y = array('d', ((a + b) / 2 for a, b in zip(y1, y2)))
+        order = sorted(range(len(texts)), key=lambda i: (center_y[i], x1[i]))
+        self._text = ''.join(texts[i] for i in order)
+        self._offsets = array('l', [0])
+        for i in order:
+            self._offsets.append(self._offsets[-1] + len(texts[i]))
+        self.x1 = array('d', (x1[i] for i in order))
+        self.y1 = array('d', (y1[i] for i in order))
+        self.x2 = array('d', (x2[i] for i in order))
+        self.y2 = array('d', (y2[i] for i in order))
+        self.center_x = array('d', (center_x[i] for i in order))
+        self.center_y = array('d', (center_y[i] for i in order))
+
+    @classmethod
+    def from_azure_lines(cls, lines) -> "PageLines":
+        return cls((getattr(line, 'text', ''), getattr(line, 'bounding_box', None)) for line in lines)
+
+    @classmethod
+    def from_text_lines(cls, lines: List[TextLine]) -> "PageLines":
+        return cls((ln.text, [ln.x1, ln.y1, 0, 0, ln.x2, ln.y2]) for ln in lines)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def text(self, i: int) -> str:
+        return self._text[self._offsets[i]:self._offsets[i + 1]]
+
+    def texts(self, indices: List[int] = None) -> List[str]:
+        offsets, text = self._offsets, self._text
+        if indices is None:
+            indices = range(len(self))
+        return [text[offsets[i]:offsets[i + 1]] for i in indices]
+
+    def line(self, i: int) -> TextLine:
+        ln = TextLine.__new__(TextLine)
+        ln.text = self.text(i)
+        ln.x1, ln.y1, ln.x2, ln.y2 = self.x1[i], self.y1[i], self.x2[i], self.y2[i]
+        ln.center_x, ln.center_y = self.center_x[i], self.center_y[i]
+        return ln
+
+    def __iter__(self) -> Iterator[TextLine]:
+        return (self.line(i) for i in range(len(self)))
+
+
 class OCRProcessor:
     def normalize_page_text_fields(self, page: dict) -> dict:
         """
         對 page dict 內的主要文字欄位（reading_order_lines, grouped_lines, structured_lines, page_text, formatted_text）進行常用字/錯字修正。
         回傳修正後的新 dict（不會修改原 dict）。"""
         new_page = dict(page)
+        normalizer = self.normalizer
         for key in ["reading_order_lines", "grouped_lines", "structured_lines"]:
             if key in new_page and isinstance(new_page[key], list):
-                new_page[key] = normalize_text_lines(new_page[key])
-        # page_text 與 formatted_text 是 str，需分行處理
+                new_page[key] = normalizer.normalize_lines(new_page[key])
+        # page_text 與 formatted_text 是 str；規則不跨行，可整段一次替換
         for key in ["page_text", "formatted_text"]:
             if key in new_page and isinstance(new_page[key], str):
-                lines = new_page[key].split("\n")
-                new_page[key] = "\n".join(normalize_text_lines(lines))
+                new_page[key] = normalizer.normalize(new_page[key])
         return new_page
 
     def normalize_ocr_json_file(self, ocr_json_path: str, output_path: str = None) -> str:
         """
         讀取 OCR JSON 檔，將每頁主要文字欄位進行常用字/錯字修正，並存回新檔案。
         """
-        with open(ocr_json_path, 'r', encoding='utf-8') as f:
-            ocr_json = json.load(f)
+        ocr_json = FileManager.load_results(ocr_json_path)
         new_pages = []
         for page in ocr_json.get("pages", []):
             new_pages.append(self.normalize_page_text_fields(page))
@@ -140,49 +1077,83 @@ class OCRProcessor:
         # 重新計算 resume_score
         ocr_json["resume_score"] = self._score_resume(new_pages)
         if not output_path:
-            base = os.path.basename(ocr_json_path)
-            name, _ = os.path.splitext(base)
+            name = os.path.basename(FileManager.output_format(ocr_json_path)[0])
             output_path = f"normalized_{name}.json"
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(ocr_json, f, ensure_ascii=False, indent=2)
         return output_path
 
-    # 字錯率（CER）與詞錯率（WER）計算工具
+    def score_ocr_json_file(self, ocr_json_path: str, output: str = "inplace") -> str:
+        """
+        讀取已存檔的 OCR JSON 並補上 resume_score（例如先前被延後或略過評分的檔案）。
+        output 為 inplace 時寫回原檔，sidecar 時另存 resume_score_<name>.json；回傳寫入的路徑。
+        """
+        ocr_json = FileManager.load_results(ocr_json_path)
+        self._attach_score(ocr_json)
+        return FileManager.write_resume_score(ocr_json_path, ocr_json, output)
+
+    # 字錯率（CER）與詞錯率（WER）計算工具（精確編輯距離，見 text_metrics）
+    @staticmethod
     def calculate_cer(ocr_text: str, ground_truth: str) -> float:
         """
         計算字錯率（Character Error Rate, CER）
         """
-        try:
-            import Levenshtein
-        except ImportError:
-            raise ImportError("請先安裝 python-Levenshtein 套件: pip install python-Levenshtein")
-        distance = Levenshtein.distance(ocr_text, ground_truth)
-        return distance / max(len(ground_truth), 1)
+        return text_metrics.cer(ground_truth, ocr_text)[0]
 
+    @staticmethod
     def calculate_wer(ocr_text: str, ground_truth: str) -> float:
         """
-        計算詞錯率（Word Error Rate, WER）
+        計算詞錯率（Word Error Rate, WER），以空白切分的 token 計算編輯距離
         """
-        try:
-            import Levenshtein
-        except ImportError:
-            raise ImportError("請先安裝 python-Levenshtein 套件: pip install python-Levenshtein")
-        ocr_words = ocr_text.split()
-        gt_words = ground_truth.split()
-        distance = Levenshtein.distance(" ".join(ocr_words), " ".join(gt_words))
-        return distance / max(len(gt_words), 1)
-    
+        return text_metrics.wer(ground_truth, ocr_text)[0]
+
     """簡化的 OCR 處理器：重點是按順序抓行並做 key/value 偵測"""
-    def __init__(self, config: OCRConfig = None):
+    def __init__(self, config: OCRConfig = None, client: Any = None, genai_client: Any = None,
+                 backend: OCRBackend = None):
         self.config = config or OCRConfig()
+        # Gemini client 可注入（例如模擬 429/503 的假 client），否則第一次評分時建立並共用
+        self._genai_client = genai_client
+        self._genai_lock = threading.Lock()
+        # 可注入自訂 client（例如測試用的假 ComputerVisionClient），需提供 read_in_stream / get_read_result
+        if client is not None:
+            self.client = client
         # 若環境變數沒設定，不要立即拋錯，部分功能仍可用（例如把現有 OCR JSON 轉結構化）
-        if self.config.subscription_key and self.config.endpoint:
+        elif self.config.subscription_key and self.config.endpoint:
             self.client = ComputerVisionClient(
                 self.config.endpoint,
                 CognitiveServicesCredentials(self.config.subscription_key)
             )
         else:
             self.client = None
+        # OCR 引擎可注入（需實作 OCRBackend.read），否則依 config.ocr_backend 建立
+        if backend is not None:
+            self.backend: Optional[OCRBackend] = backend
+        elif self.config.ocr_backend == "tesseract":
+            self.backend = TesseractBackend(self.config.tesseract_lang, self.config.tesseract_dpi,
+                                            self.config.tesseract_workers, self.config.tesseract_cmd)
+        elif self.client is not None:
+            self.backend = AzureReadBackend(self.client, self.config.polling)
+        else:
+            self.backend = None
+        self.normalizer = TextNormalizer.from_file(self.config.normalize_rules_path)
+        # 關鍵字編成 trie，每行 / 每份履歷只掃描一次，成本不隨關鍵字數量增加
+        self.kv_matcher = KeywordMatcher((kw, rank) for rank, kw in enumerate(self.config.keywords))
+        self.score_matcher = KeywordMatcher((kw, kw) for kw in self.config.score_keywords)
+        self.cache: Optional[OCRResultCache] = None
+        if self.config.enable_cache:
+            self.cache = OCRResultCache(
+                self.config.cache_dir,
+                max_entries=self.config.cache_max_entries,
+                max_bytes=self.config.cache_max_bytes,
+                max_age=self.config.cache_max_age,
+            )
+        self.llm_cache: Optional[LLMScoreCache] = None
+        if self.config.enable_llm_cache:
+            self.llm_cache = LLMScoreCache(
+                self.config.llm_cache_dir,
+                max_entries=self.config.llm_cache_max_entries,
+                max_age=self.config.llm_cache_max_age,
+            )
 
     def is_supported_file(self, file_path: str) -> bool:
         if not os.path.exists(file_path):
@@ -190,30 +1161,91 @@ class OCRProcessor:
         ext = os.path.splitext(file_path)[1].lower()
         return ext in self.config.supported_extensions
 
-    def _lines_from_page(self, page) -> List[TextLine]:
-        lines = []
-        for line in getattr(page, 'lines', []):
-            bbox = getattr(line, 'bounding_box', None)
-            # line.text 為 Azure read SDK 的文字
-            lines.append(TextLine(getattr(line, 'text', ''), bbox))
+    def _lines_from_page(self, page) -> PageLines:
         # 依 center_y (top->down) 與 x1 (left->right) 排序，保證閱讀順序
-        return sorted(lines, key=lambda l: (l.center_y, l.x1))
+        return PageLines.from_azure_lines(getattr(page, 'lines', []))
 
-    def _group_lines_by_row(self, lines: List[TextLine]) -> List[List[TextLine]]:
-        """把同一水平帶的行群組在一起（容差 self.config.y_tolerance）"""
-        if not lines:
+    @staticmethod
+    def _page_unit(page) -> str:
+        """頁面座標單位（pixel / inch）；Azure SDK 的列舉與快取還原的字串都可"""
+        unit = getattr(page, 'unit', None)
+        unit = getattr(unit, 'value', unit)
+        return str(unit or '').rsplit('.', 1)[-1].lower()
+
+    def _row_tolerance(self, page) -> float:
+        """依頁面座標單位換算的列群組容差（預設值以像素計）"""
+        tolerance = self.config.y_tolerance
+        if self._page_unit(page) == 'inch':
+            return tolerance / self.config.y_tolerance_dpi
+        return tolerance
+
+    def _group_lines_by_row(self, lines: PageLines, tolerance: float = None) -> List[List[int]]:
+        """
+        把同一水平帶的行群組在一起（容差 tolerance，預設 self.config.y_tolerance），回傳每列的行索引（依 x1 排序）。
+        lines 需已依 (center_y, x1) 排序；以累計和維護目前群組的平均 center_y，整體為線性時間。
+        """
+        if not isinstance(lines, PageLines):
+            lines = PageLines.from_text_lines(lines)
+        n = len(lines)
+        if not n:
             return []
+        threshold = self.config.row_grouping_numpy_threshold
+        if tolerance is None:
+            tolerance = self.config.y_tolerance
+        if np is not None and threshold and n >= threshold:
+            return self._group_lines_by_row_numpy(lines, tolerance)
+        ys = lines.center_y
+        x1 = lines.x1.__getitem__
         groups = []
-        current = [lines[0]]
-        for ln in lines[1:]:
-            avg_y = sum(l.center_y for l in current) / len(current)
-            if abs(ln.center_y - avg_y) <= self.config.y_tolerance:
-                current.append(ln)
+        current = [0]
+        total_y = ys[0]
+        for i in range(1, n):
+            y = ys[i]
+            if abs(y - total_y / len(current)) <= tolerance:
+                current.append(i)
+                total_y += y
             else:
-                groups.append(sorted(current, key=lambda l: l.x1))
-                current = [ln]
-        if current:
-            groups.append(sorted(current, key=lambda l: l.x1))
+                groups.append(sorted(current, key=x1))
+                current = [i]
+                total_y = y
+        groups.append(sorted(current, key=x1))
+        return groups
+
+    def _group_lines_by_row_numpy(self, lines: PageLines, tolerance: float = None) -> List[List[int]]:
+        """
+        _group_lines_by_row 的 numpy 版本，結果完全相同。
+        每個群組從起點取一段視窗，以 cumsum 一次算出所有前綴平均並找第一個超出容差的位置；
+        視窗不足時加倍重算（cumsum 皆從群組起點開始，浮點累加順序與純 Python 版一致）。
+        每列只有少數行時 numpy 呼叫成本反而較高，適合表格密集、單列很長的頁面。
+        """
+        if tolerance is None:
+            tolerance = self.config.y_tolerance
+        # array('d') 直接共用記憶體，不需逐行轉換
+        ys = np.frombuffer(lines.center_y, dtype=np.float64)
+        xs = np.frombuffer(lines.x1, dtype=np.float64)
+        n = len(lines)
+        groups = []
+        start = 0
+        window = 8
+        while start < n:
+            end = None
+            while end is None:
+                stop = min(n, start + window)
+                seg = ys[start:stop]
+                # means[k] = 群組為 seg[0..k] 時的平均，用來判斷 seg[k + 1] 是否屬於同一列
+                means = np.cumsum(seg[:-1]) / np.arange(1, len(seg))
+                outside = np.abs(seg[1:] - means) > tolerance
+                if outside.any():
+                    end = start + 1 + int(outside.argmax())
+                elif stop == n:
+                    end = n
+                else:
+                    window *= 2
+            order = np.argsort(xs[start:end], kind='stable')
+            groups.append((order + start).tolist())
+            # 相鄰列長度通常相近，下一個視窗以本列長度估計
+            window = max(4, 2 * (end - start))
+            start = end
         return groups
 
     def _can_preprocess(self, file_path: str) -> bool:
@@ -224,79 +1256,22 @@ class OCRProcessor:
             return False
         return os.path.exists(file_path)
 
-    def _preprocess_image(self, file_path: str) -> Optional[bytes]:
-        """銳利化+二值化影像後輸出為位元組串，如果流程不可用則回傳 None"""
+    def _preprocess_image(self, file_path: str) -> Tuple[Optional[bytes], Optional[Dict[str, Any]]]:
+        """依設定的 profile 前處理影像，回傳 (位元組, 紀錄)；流程不可用時回傳 (None, None)"""
         if not self._can_preprocess(file_path):
-            return None
-        settings = self.config.preprocess
-        try:
-            image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
-            if image is None:
-                return None
-            if settings.get("upscale"):
-                factor = max(1.0, float(settings.get("upscale_factor", 1.5)))
-                if factor > 1.0001:
-                    image = cv2.resize(image, None, fx=factor, fy=factor, interpolation=cv2.INTER_CUBIC)
-            denoised = cv2.medianBlur(image, settings["median_kernel"])
-            clahe = cv2.createCLAHE(
-                clipLimit=settings["clahe_clip"],
-                tileGridSize=(settings["clahe_grid"], settings["clahe_grid"])
-            ).apply(denoised)
-            blur = cv2.GaussianBlur(clahe, (0, 0), settings["gaussian_sigma"])
-            sharpen = cv2.addWeighted(
-                clahe,
-                settings["unsharp_amount"],
-                blur,
-                -settings["unsharp_subtract"],
-                0
-            )
-            binary = cv2.adaptiveThreshold(
-                sharpen,
-                255,
-                cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                cv2.THRESH_BINARY,
-                settings["adaptive_block"],
-                settings["adaptive_c"],
-            )
-            if settings.get("save_image"):
-                # Save a copy of the processed image using configured path/suffix for reference
-                rel_dir = settings.get("save_dir") or os.path.join("assets", "processed_images")
-                if os.path.isabs(rel_dir):
-                    processed_dir = rel_dir
-                else:
-                    processed_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), rel_dir)
-                os.makedirs(processed_dir, exist_ok=True)
-                base_name = os.path.splitext(os.path.basename(file_path))[0]
-                suffix = settings.get("filename_suffix") or "_processed"
-                fmt_ext = (settings.get("output_format") or ".png").lower()
-                if not fmt_ext.startswith('.'):
-                    fmt_ext = f".{fmt_ext}"
-                processed_path = os.path.join(processed_dir, f"{base_name}{suffix}{fmt_ext}")
-                print(f"[OCR] saving processed image to {processed_path}")
-                try:
-                    cv2.imwrite(processed_path, binary)
-                except Exception:
-                    pass
-            fmt = (settings["output_format"] or ".png").lower()
-            if fmt not in {'.png', '.jpg', '.jpeg', '.bmp', '.tiff', '.tif'}:
-                fmt = '.png'
-            success, buffer = cv2.imencode(fmt, binary)
-            if not success:
-                return None
-            return buffer.tobytes()
-        except Exception:
-            return None
+            return None, None
+        return preprocess_image(file_path, self.config.preprocess)
 
     # 簡單正則：email, phone
     _re_email = re.compile(r'[\w\.-]+@[\w\.-]+\.\w+')
     _re_phone = re.compile(r'(\+?\d[\d\-\s]{5,}\d)')
 
-    def _detect_kv_pairs(self, groups: List[List[TextLine]]) -> List[Dict[str,str]]:
+    def _detect_kv_pairs(self, lines: PageLines, groups: List[List[int]]) -> List[Dict[str,str]]:
         """把每個群組轉成 一行文字，然後用 heuristics 偵測 key/value"""
         pairs = []
         pending_key = None  # 若上一行被判為 key 但沒有 value，可用下一行當 value
         for group in groups:
-            line_text = ' '.join([ln.text for ln in group]).strip()
+            line_text = ' '.join(lines.texts(group)).strip()
             if not line_text:
                 continue
 
@@ -322,15 +1297,15 @@ class OCRProcessor:
                 continue
 
             # 3) 若行包含明顯關鍵字（如「姓名」「手機」「地址」等），將關鍵字當 key，剩餘當 value（若沒有剩餘，標記為 pending）
-            matched_kw = None
-            for kw in self.config.keywords:
-                if kw in line_text:
-                    matched_kw = kw
-                    break
-            if matched_kw:
+            best = None
+            for start, end, kw in self.kv_matcher.iter_matches(line_text):
+                rank = (self.kv_matcher.keywords[kw][0], start)
+                if best is None or rank < best[0]:
+                    best = (rank, end, kw)
+            if best:
                 # remove first occurrence of keyword
-                idx = line_text.find(matched_kw)
-                after = line_text[idx + len(matched_kw):].strip()
+                _, end, matched_kw = best
+                after = line_text[end:].strip()
                 if after:
                     pairs.append({"key": matched_kw, "value": after})
                     pending_key = None
@@ -352,26 +1327,30 @@ class OCRProcessor:
             pairs.append({"key": pending_key, "value": ""})
         return pairs
 
-    def _extract_compact_contact(self, rows: List[Dict[str, Any]]) -> Dict[str, str]:
-        """從 rows 嘗試擷取並把姓名/手機/Email 盡量排在一起回傳（不含座標）"""
+    def _extract_compact_contact(self, lines: PageLines, groups: List[List[int]]) -> Dict[str, str]:
+        """從各列（_group_lines_by_row 的結果）嘗試擷取並把姓名/手機/Email 盡量排在一起回傳（不含座標）"""
         email = ""
         phone = ""
         name = ""
 
-        # 展平所有 segments（保持 top->down, left->right）
-        segments = []
-        for r_idx, r in enumerate(rows):
-            segs = sorted(r.get("texts", []), key=lambda s: s.get("x1", 0))
-            for s in segs:
-                seg = s.copy()
-                seg["_row_idx"] = r_idx
-                seg["_center_x"] = (seg.get("x1", 0) + seg.get("x2", 0)) / 2
-                seg["_center_y"] = (seg.get("y1", 0) + seg.get("y2", 0)) / 2
-                segments.append(seg)
-
-        # 1) 先找 email / phone（全頁第一個符合）
-        for seg in segments:
-            txt = seg.get("text", "")
+        # 每列一組平行陣列（群組已依 x1 排序）：文字與 x 中心、
+        # x 中心的前綴最大值（遞增，可二分搜尋「右側第一個」），以及 x 中心最小者的位置
+        row_texts: List[List[str]] = []
+        row_centers: List[List[float]] = []
+        row_prefix_max: List[List[float]] = []
+        row_leftmost: List[int] = []
+        center_x = lines.center_x
+        for group in groups:
+            texts = lines.texts(group)
+            centers = [center_x[i] for i in group]
+            prefix_max = list(accumulate(centers, max))
+            row_texts.append(texts)
+            row_centers.append(centers)
+            row_prefix_max.append(prefix_max)
+            row_leftmost.append(min(range(len(centers)), key=centers.__getitem__) if centers else -1)
+
+        # 1) 先找 email / phone（全頁第一個符合，順序為 top->down, left->right）
+        for txt in (t for texts in row_texts for t in texts):
             if not email:
                 m = self._re_email.search(txt)
                 if m:
@@ -385,28 +1364,29 @@ class OCRProcessor:
 
         # 2) 嘗試用「姓名」標籤附近找姓名（同一 row、或下一 row）
         name_kw = ['姓名', '中文姓名', 'name']
-        for i, seg in enumerate(segments):
-            txt = seg.get("text", "")
-            for kw in name_kw:
-                if kw in txt:
-                    row_idx = seg["_row_idx"]
-                    candidates = [s for s in segments if s["_row_idx"] == row_idx and s["_center_x"] > seg["_center_x"]]
-                    if candidates:
-                        name = candidates[0].get("text", "").strip()
-                        break
-                    next_row_idx = row_idx + 1
-                    next_row_segs = [s for s in segments if s["_row_idx"] == next_row_idx]
-                    if next_row_segs:
-                        next_row_segs = sorted(next_row_segs, key=lambda s: s["_center_x"])
-                        name = next_row_segs[0].get("text", "").strip()
-                        break
+        for row_idx, texts in enumerate(row_texts):
+            for col, txt in enumerate(texts):
+                for kw in name_kw:
+                    if kw in txt:
+                        # 同一 row 中（依 x1 順序）第一個 x 中心在右側的 segment
+                        prefix_max = row_prefix_max[row_idx]
+                        j = bisect_right(prefix_max, row_centers[row_idx][col])
+                        if j < len(texts):
+                            name = texts[j].strip()
+                            break
+                        next_row_idx = row_idx + 1
+                        if next_row_idx < len(row_texts) and row_texts[next_row_idx]:
+                            name = row_texts[next_row_idx][row_leftmost[next_row_idx]].strip()
+                            break
+                if name:
+                    break
             if name:
                 break
 
         # 3) fallback：若仍找不到 name，挑第一個看起來像名字的 segment（無數字、長度合理）
         if not name:
-            for seg in segments:
-                txt = seg.get("text", "").strip()
+            for txt in (t for texts in row_texts for t in texts):
+                txt = txt.strip()
                 if not txt:
                     continue
                 if any(kw in txt for kw in name_kw):
@@ -429,194 +1409,241 @@ class OCRProcessor:
             return []
         return [text[i:i+width] for i in range(0, len(text), width)]
 
-    def _gemini_score_resume(self, resume_text: str) -> dict:
-        """呼叫 Gemini API 以 AI 給分"""
-        import json as _json
-        import time as _time
-        if genai is None:
-            return {"score": 0, "reason": "google-genai 套件未安裝"}
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            return {"score": 0, "reason": "未設定 GEMINI_API_KEY"}
-        max_retries = 3
-        min_wait_sec = 13  # 5 RPM = 12秒/次，保守設13秒
+    def _get_genai_client(self) -> Any:
+        """每個 OCRProcessor 共用一個 Gemini client（延遲建立，執行緒安全）"""
+        if self._genai_client is None:
+            with self._genai_lock:
+                if self._genai_client is None:
+                    api_key = os.getenv("GEMINI_API_KEY")
+                    if genai is None or not api_key:
+                        return None
+                    self._genai_client = genai.Client(api_key=api_key)
+        return self._genai_client
+
+    def close(self) -> None:
+        """釋放共用的 Gemini client 與 OCR 引擎的資源"""
+        if self.backend is not None:
+            self.backend.close()
+        client, self._genai_client = self._genai_client, None
+        if client is not None and hasattr(client, 'close'):
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _is_transient_gemini_error(err_msg: str) -> bool:
+        return "429" in err_msg or "RESOURCE_EXHAUSTED" in err_msg or "503" in err_msg or "UNAVAILABLE" in err_msg
+
+    def _call_gemini(self, contents: Any, estimated_tokens: int, error_label: str) -> dict:
+        """
+        透過共用 client 呼叫 Gemini，並以行程共用的 token bucket 控制 RPM/TPM。
+        遇到 429/503 時讓整個 limiter 暫停（所有執行緒一起等），而不是各自 sleep 後重打。
+        """
+        client = self._get_genai_client()
+        if client is None:
+            if genai is None:
+                return {"score": 0, "reason": "google-genai 套件未安裝", "error": True}
+            return {"score": 0, "reason": "未設定 GEMINI_API_KEY", "error": True}
+        limiter = get_gemini_rate_limiter(self.config.gemini_rpm, self.config.gemini_tpm)
+        max_retries = self.config.gemini_max_retries
         for attempt in range(1, max_retries + 1):
             try:
-                client = genai.Client(api_key=api_key)
-                prompt = (
-                    "請以專業人資角度，針對以下履歷內容給一個 0~100 分的分數，忽略排版與結構，只針對內容評分，並簡要說明理由：\n"
-                    f"{resume_text}\n"
-                    "請回傳 JSON 格式，如：{\"score\": 85, \"reason\": \"內容完整，經歷豐富\"}"
-                )
+                limiter.acquire(estimated_tokens)
                 response = client.models.generate_content(
-                    model='gemini-3-pro-preview',
-                    contents=prompt,
-                    config={
-                        'temperature': 0.2,
-                        'top_p': 0.95,
-                        'top_k': 20,
-                    },
+                    model=self.config.gemini_model,
+                    contents=contents,
+                    config=dict(GEMINI_SAMPLING),
                 )
                 content = response.text if hasattr(response, 'text') else response.candidates[0].content.parts[0].text
                 content = content.strip().lstrip("```json").rstrip("```")
-                ai_result = _json.loads(content)
-                if "reason" in ai_result and isinstance(ai_result["reason"], str):
-                    ai_result["reason"] = self._wrap_text(ai_result["reason"], 50)
-                client.close()
+                ai_result = json.loads(content)
+                for entry in (ai_result if isinstance(ai_result, list) else [ai_result]):
+                    if isinstance(entry, dict) and isinstance(entry.get("reason"), str):
+                        entry["reason"] = self._wrap_text(entry["reason"], 50)
                 return ai_result
             except Exception as e:
                 err_msg = str(e)
                 # 檢查是否為 429/503 或暫時性錯誤
-                if ("429" in err_msg or "RESOURCE_EXHAUSTED" in err_msg or "503" in err_msg or "UNAVAILABLE" in err_msg) and attempt < max_retries:
-                    wait_sec = min_wait_sec * attempt
-                    # 若有建議等待秒數則取用
-                    try:
-                        import re as _re
-                        m = _re.search(r'retry in (\d+)', err_msg)
-                        if m:
-                            wait_sec = max(wait_sec, int(m.group(1)))
-                    except Exception:
-                        pass
-                    # print(f"[Gemini] 第{attempt}次遇到暫時性錯誤，{wait_sec}秒後重試...\n{err_msg}")
-                    _time.sleep(wait_sec)
+                if self._is_transient_gemini_error(err_msg) and attempt < max_retries:
+                    # 預設暫停一個請求間隔；若有建議等待秒數則取用
+                    wait_sec = 60.0 / max(1, self.config.gemini_rpm) * attempt
+                    m = re.search(r'retry in (\d+(?:\.\d+)?)', err_msg)
+                    if m:
+                        wait_sec = max(wait_sec, float(m.group(1)))
+                    limiter.pause(wait_sec)
                     continue
-                else:
-                    ai_result = {"score": 0, "reason": f"Gemini 回傳錯誤: {e}"}
-                    return ai_result
+                return {"score": 0, "reason": f"{error_label}: {e}", "error": True}
         # 若重試後仍失敗
-        return {"score": 0, "reason": "Gemini 多次暫時性錯誤，請稍後再試"}
+        return {"score": 0, "reason": f"{error_label}: 多次暫時性錯誤，請稍後再試", "error": True}
+
+    def _llm_cache_key(self, template: str, content: Any) -> Optional[str]:
+        if self.llm_cache is None:
+            return None
+        return self.llm_cache.make_key(self.config.gemini_model, template, GEMINI_SAMPLING, content)
+
+    def _llm_cache_get(self, key: Optional[str]) -> Optional[dict]:
+        if key is None:
+            return None
+        entry = self.llm_cache.get(key)
+        if entry is None:
+            return None
+        return {**entry["result"], "cached": True}
+
+    def _llm_cache_status(self, text_score: Optional[dict], vision_score: Optional[dict]) -> Dict[str, Any]:
+        """
+        這一份履歷的 LLM 快取狀態：text / vision 為 "hit" 或 "miss"，沒有評分（或未啟用快取）時為 None。
+        整個執行期間的累計命中數見 llm_cache.counters()。
+        """
+        def status(result: Optional[dict]) -> Optional[str]:
+            if self.llm_cache is None or result is None:
+                return None
+            return "hit" if result.get("cached") else "miss"
+        return {"enabled": self.llm_cache is not None, "text": status(text_score), "vision": status(vision_score)}
+
+    def _llm_cache_put(self, key: Optional[str], result: Any) -> None:
+        # 錯誤結果不快取，下次仍會重新呼叫
+        if key is not None and isinstance(result, dict) and not result.get("error"):
+            self.llm_cache.put(key, {"created": time.time(), "result": result})
+
+    # 文字評分的快取 key 同時涵蓋單筆與批次 prompt：兩者問的是同一件事，結果可互用
+    _TEXT_SCORE_TEMPLATE = GEMINI_TEXT_PROMPT + "\0" + GEMINI_BATCH_PROMPT
+
+    def _gemini_score_resume(self, resume_text: str) -> dict:
+        """呼叫 Gemini API 以 AI 給分（相同文字命中快取時不再呼叫）"""
+        key = self._llm_cache_key(self._TEXT_SCORE_TEMPLATE, resume_text)
+        cached = self._llm_cache_get(key)
+        if cached is not None:
+            return cached
+        prompt = GEMINI_TEXT_PROMPT.replace("{resume_text}", resume_text)
+        result = self._call_gemini(prompt, estimate_tokens(prompt), "Gemini 回傳錯誤")
+        self._llm_cache_put(key, result)
+        return result
+
+    def _pack_resume_batches(self, texts: List[str]) -> List[List[int]]:
+        """依 token 預算與每批上限把履歷分批（單份超過預算者自成一批），回傳索引清單"""
+        budget = self.config.gemini_batch_token_budget
+        limit = max(1, self.config.gemini_batch_size)
+        batches: List[List[int]] = []
+        current: List[int] = []
+        used = 0
+        for i, text in enumerate(texts):
+            cost = estimate_tokens(text) + 16  # 每份的分隔標記
+            if current and (len(current) >= limit or used + cost > budget):
+                batches.append(current)
+                current, used = [], 0
+            current.append(i)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    def _gemini_score_resumes_batch(self, texts: List[str]) -> List[dict]:
+        """
+        把多份履歷放進同一個 prompt 評分，要求回傳 [{id, score, reason}, ...] 並依 id 對回；
+        批次請求失敗或缺少某份的結果時，該份改用單筆 _gemini_score_resume。
+        """
+        keys = [self._llm_cache_key(self._TEXT_SCORE_TEMPLATE, text) for text in texts]
+        results: List[Optional[dict]] = [self._llm_cache_get(key) for key in keys]
+        misses = [i for i, res in enumerate(results) if res is None]
+        if self.config.gemini_batch_size > 1:
+            for packed in self._pack_resume_batches([texts[i] for i in misses]):
+                batch = [misses[j] for j in packed]
+                if len(batch) == 1:
+                    continue
+                sections = [f"=== 履歷 id=r{i} ===\n{texts[i]}" for i in batch]
+                prompt = (GEMINI_BATCH_PROMPT.replace("{count}", str(len(batch)))
+                          .replace("{sections}", "\n".join(sections)))
+                reply = self._call_gemini(prompt, estimate_tokens(prompt), "Gemini 回傳錯誤")
+                if not isinstance(reply, list):
+                    continue
+                for entry in reply:
+                    if not isinstance(entry, dict) or not isinstance(entry.get("score"), (int, float)):
+                        continue
+                    idx = str(entry.get("id", "")).lstrip("r")
+                    if idx.isdigit() and int(idx) in batch and results[int(idx)] is None:
+                        results[int(idx)] = {"score": entry["score"], "reason": entry.get("reason", ""), "batched": True}
+                        self._llm_cache_put(keys[int(idx)], results[int(idx)])
+        return [res if res is not None else self._gemini_score_resume(texts[i]) for i, res in enumerate(results)]
 
     def _gemini_score_original_file(self, file_path: str) -> dict:
         """呼叫 Gemini Vision API 針對原始檔案進行評分（支援圖像格式）"""
-        import json as _json
-        import time as _time
-        import base64
-        
         # 檢查檔案是否為支援的圖像格式
         ext = os.path.splitext(file_path)[1].lower()
         if ext not in {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif'}:
             return {"score": 0, "reason": f"原始檔案格式 {ext} 不支援視覺 API"}
-        
+
         if not os.path.exists(file_path):
             return {"score": 0, "reason": "原始檔案不存在"}
-        
-        if genai is None:
-            return {"score": 0, "reason": "google-genai 套件未安裝"}
-        
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            return {"score": 0, "reason": "未設定 GEMINI_API_KEY"}
-        
-        max_retries = 3
-        min_wait_sec = 13
-        
-        for attempt in range(1, max_retries + 1):
-            try:
-                client = genai.Client(api_key=api_key)
-                
-                # 讀取圖像並編碼為 base64
-                with open(file_path, 'rb') as f:
-                    image_data = base64.standard_b64encode(f.read()).decode('utf-8')
-                
-                # 根據副檔名判斷 MIME 類型
-                mime_type_map = {
-                    '.jpg': 'image/jpeg',
-                    '.jpeg': 'image/jpeg',
-                    '.png': 'image/png',
-                    '.bmp': 'image/bmp',
-                    '.tiff': 'image/tiff',
-                    '.tif': 'image/tiff'
-                }
-                mime_type = mime_type_map.get(ext, 'image/jpeg')
-                
-                prompt = (
-                    "這是一份履歷的掃描影像。請以專業人資角度，根據整個文件的視覺佈局、內容完整度與專業程度，"
-                    "給一個 0~100 分的分數，並簡要說明理由。請特別注意：\n"
-                    "- 佈局是否清晰有序\n"
-                    "- 內容是否完整（聯絡資訊、工作經歷、學歷等）\n"
-                    "- 排版與視覺專業度\n"
-                    "- 文字清晰度與可讀性\n\n"
-                    "請回傳 JSON 格式，如：{\"score\": 85, \"reason\": \"佈局清晰，內容完整，排版專業\"}"
-                )
-                
-                response = client.models.generate_content(
-                    model='gemini-3-pro-preview',
-                    contents=[
-                        types.Part.from_data(data=image_data, mime_type=mime_type),
-                        prompt
-                    ],
-                    config={
-                        'temperature': 0.2,
-                        'top_p': 0.95,
-                        'top_k': 20,
-                    },
-                )
-                
-                content = response.text if hasattr(response, 'text') else response.candidates[0].content.parts[0].text
-                content = content.strip().lstrip("```json").rstrip("```")
-                ai_result = _json.loads(content)
-                if "reason" in ai_result and isinstance(ai_result["reason"], str):
-                    ai_result["reason"] = self._wrap_text(ai_result["reason"], 50)
-                client.close()
-                return ai_result
-            except Exception as e:
-                err_msg = str(e)
-                if ("429" in err_msg or "RESOURCE_EXHAUSTED" in err_msg or "503" in err_msg or "UNAVAILABLE" in err_msg) and attempt < max_retries:
-                    wait_sec = min_wait_sec * attempt
-                    try:
-                        import re as _re
-                        m = _re.search(r'retry in (\d+)', err_msg)
-                        if m:
-                            wait_sec = max(wait_sec, int(m.group(1)))
-                    except Exception:
-                        pass
-                    _time.sleep(wait_sec)
-                    continue
-                else:
-                    ai_result = {"score": 0, "reason": f"Gemini 視覺 API 錯誤: {e}"}
-                    return ai_result
-        
-        return {"score": 0, "reason": "Gemini 視覺 API 多次暫時性錯誤，請稍後再試"}
 
-    def _score_resume(self, pages: List[Dict[str, Any]], file_path: str = None) -> Dict[str, Any]:
-        """根據聯絡資訊、關鍵字與行數給予簡易評分，並可引入 Gemini AI 評分（OCR 文本 + 原始檔案）"""
+        with open(file_path, 'rb') as f:
+            image_data = f.read()
+
+        key = self._llm_cache_key(GEMINI_VISION_PROMPT, image_data)
+        cached = self._llm_cache_get(key)
+        if cached is not None:
+            return cached
+
+        # 根據副檔名判斷 MIME 類型
+        mime_type_map = {
+            '.jpg': 'image/jpeg',
+            '.jpeg': 'image/jpeg',
+            '.png': 'image/png',
+            '.bmp': 'image/bmp',
+            '.tiff': 'image/tiff',
+            '.tif': 'image/tiff'
+        }
+        mime_type = mime_type_map.get(ext, 'image/jpeg')
+
+        prompt = GEMINI_VISION_PROMPT
+        contents = [types.Part.from_bytes(data=image_data, mime_type=mime_type), prompt]
+        result = self._call_gemini(contents, estimate_tokens(prompt) + GEMINI_IMAGE_TOKENS, "Gemini 視覺 API 錯誤")
+        self._llm_cache_put(key, result)
+        return result
+
+    @staticmethod
+    def _resume_text(pages: List[Dict[str, Any]]) -> str:
+        """評分用的全文：每頁優先取 formatted_text"""
+        return "\n".join(page.get("formatted_text") or page.get("page_text") or "" for page in pages)
+
+    def _score_resumes(self, items: List[Tuple[List[Dict[str, Any]], Optional[str]]]) -> List[Dict[str, Any]]:
+        """
+        多份履歷一起評分：文字部分以 _gemini_score_resumes_batch 合併請求，
+        其餘（關鍵字、聯絡資訊、視覺評分）與 _score_resume 相同。items 為 (pages, file_path)。
+        """
+        texts = [self._resume_text(pages) if pages else "" for pages, _ in items]
+        with_text = [i for i, (pages, _) in enumerate(items) if pages]
+        batch_scores = self._gemini_score_resumes_batch([texts[i] for i in with_text])
+        gemini_scores: Dict[int, dict] = dict(zip(with_text, batch_scores))
+        return [self._score_resume(pages, file_path, gemini_score=gemini_scores.get(i))
+                for i, (pages, file_path) in enumerate(items)]
+
+    def _score_resume(self, pages: List[Dict[str, Any]], file_path: str = None,
+                      gemini_score: dict = None) -> Dict[str, Any]:
+        """
+        根據聯絡資訊、關鍵字與行數給予簡易評分，並可引入 Gemini AI 評分（OCR 文本 + 原始檔案）。
+        gemini_score 已由批次請求取得時直接使用，不再另外呼叫。
+        """
         if not pages:
-            return {"score": 0, "components": {}, "keywords_found": [], "gemini_score": {}, "original_file_score": {}}
+            return {"score": 0, "components": {}, "keywords_found": [], "gemini_score": {}, "original_file_score": {},
+                    "llm_cache": self._llm_cache_status(None, None)}
 
-        combined_texts: List[str] = []
         total_lines = 0
         contact_presence = {"姓名": False, "手機": False, "Email": False}
         for page in pages:
             total_lines += int(page.get("total_lines", 0))
-            combined_texts.append(page.get("formatted_text") or page.get("page_text") or "")
             compact = page.get("compact_contact") or {}
             for key in contact_presence:
                 if compact.get(key):
                     contact_presence[key] = True
 
-        full_text = "\n".join(combined_texts)
+        full_text = self._resume_text(pages)
 
         contact_score = sum(10 for present in contact_presence.values() if present)
 
-        keyword_pool = [
-            "工作經歷",
-            "工作技能",
-            "技能",
-            "學歷",
-            "專業證照",
-            "證照",
-            "語言能力",
-            "自傳",
-            "簡介",
-            "專長"
-        ]
-        keywords_found: List[str] = []
-        keyword_score = 0
-        for kw in keyword_pool:
-            if kw and kw in full_text:
-                keywords_found.append(kw)
-                keyword_score += 5
-        keyword_score = min(40, keyword_score)
+        found = self.score_matcher.found_keywords(full_text)
+        keywords_found: List[str] = [kw for kw in self.config.score_keywords if kw in found]
+        keyword_score = min(40, 5 * len(keywords_found))
 
         if total_lines >= 150:
             length_score = 20
@@ -638,8 +1665,9 @@ class OCRProcessor:
         total_score = min(100, contact_score + keyword_score + length_score + extra_signal)
 
         # Gemini AI 評分（OCR 文本）
-        gemini_score = self._gemini_score_resume(full_text)
-        
+        if gemini_score is None:
+            gemini_score = self._gemini_score_resume(full_text)
+
         # Gemini Vision API 評分（原始檔案）
         original_file_score = {}
         if file_path:
@@ -657,34 +1685,27 @@ class OCRProcessor:
             "total_lines": total_lines,
             "contact_presence": contact_presence,
             "gemini_score": gemini_score,
-            "original_file_score": original_file_score
+            "original_file_score": original_file_score,
+            "llm_cache": self._llm_cache_status(gemini_score, original_file_score if file_path else None),
         }
 
     def process_page(self, page, page_number: int) -> Dict[str, Any]:
         lines = self._lines_from_page(page)
-        groups = self._group_lines_by_row(lines)
+        groups = self._group_lines_by_row(lines, self._row_tolerance(page))
 
         # 單純依據 bounding box 由上到下、由左至右排序的行文字
-        ordered_line_texts = [ln.text for ln in lines if ln.text]
+        ordered_line_texts = [text for text in lines.texts() if text]
         ordered_text = "\n".join(ordered_line_texts)
 
-        # 建立 rows 僅供內部處理（但不會回傳座標）
-        rows = []
-        for g in groups:
-            rows.append({
-                "y": sum(l.center_y for l in g) / len(g),
-                "texts": [ln.to_dict() for ln in g]
-            })
-
         # 群組化後的一行一行字串，讓同一列的語句聚在一起
         grouped_lines = []
         for g in groups:
-            group_text = " ".join([ln.text for ln in g if ln.text]).strip()
+            group_text = " ".join([text for text in lines.texts(g) if text]).strip()
             if group_text:
                 grouped_lines.append(group_text)
 
         # 根據 heuristics 產生 key/value 的結構化結果
-        kv_pairs = self._detect_kv_pairs(groups)
+        kv_pairs = self._detect_kv_pairs(lines, groups)
         structured_lines: List[str] = []
         for pair in kv_pairs:
             key = (pair.get("key") or "").strip()
@@ -700,25 +1721,9 @@ class OCRProcessor:
         page_text = ordered_text
 
         # 嘗試組合姓名/手機/Email（供顯示用）
-        compact_contact = self._extract_compact_contact(rows)
-
-        # 若有至少一項資訊，建立一行格式化字串放在最前面（不包含座標或原始行/rows）
-        contact_line_parts = []
-        if compact_contact.get("姓名"):
-            contact_line_parts.append(f"姓名: {compact_contact['姓名']}")
-        if compact_contact.get("手機"):
-            contact_line_parts.append(f"手機: {compact_contact['手機']}")
-        if compact_contact.get("Email"):
-            contact_line_parts.append(f"Email: {compact_contact['Email']}")
-        contact_line = "    ".join(contact_line_parts) if contact_line_parts else ""
-
-        # formatted_text 盡量採用結構化或群組化的行，讓相關內容同列顯示
-        prioritized_lines = structured_lines or grouped_lines or ordered_line_texts
-        formatted_page_text = "\n".join(prioritized_lines)
-        if contact_line:
-            formatted_text = contact_line + "\n\n" + formatted_page_text
-        else:
-            formatted_text = formatted_page_text
+        compact_contact = self._extract_compact_contact(lines, groups)
+
+        formatted_text = format_page_text(compact_contact, structured_lines, grouped_lines, ordered_line_texts)
 
         return {
             "page_number": page_number,
@@ -731,72 +1736,555 @@ class OCRProcessor:
             "total_lines": len(lines)
         }
 
-    def process_file(self, file_path: str, ground_truth_text: str = None) -> Tuple[bool, Dict[str, Any]]:
-        """使用 Azure Read API 處理檔案並回傳簡化 JSON（若未配置 Azure，回傳錯誤）"""
+    def _read_pdf_text_layer(self, file_path: str, timings: Dict[str, float]) -> Optional[list]:
+        """PDF 逐頁的 (文字層 page dict 或 None, 有效字數)；未啟用、缺少 pdfplumber 或無法解析時回傳 None"""
+        if not (self.config.pdf_text_layer and file_path.lower().endswith(".pdf")):
+            return None
+        started = time.perf_counter()
+        try:
+            return pdf_text_layer(file_path, self.config.pdf_text_min_chars)
+        except Exception:
+            # 加密或損毀的 PDF 交給 OCR 引擎處理
+            return None
+        finally:
+            timings["text_layer"] = time.perf_counter() - started
+
+    def _read_with_backend(self, file_path: str, preprocess_future: Optional[Future] = None,
+                           timings: Dict[str, float] = None) -> Tuple[Optional[List[Any]], Dict[str, Any]]:
+        """
+        前處理後交給 OCR 引擎（Azure 上傳並輪詢，或本機 Tesseract）。
+        PDF 會先檢查各頁文字層：有文字的頁面直接轉成行，只有影像頁送 OCR，meta["routing"] 記錄每頁的來源。
+        preprocess_future 為行程池中的前處理工作（管線模式）；未提供時於本執行緒直接前處理。
+        回傳 (read_results, 中繼資料)；失敗時 read_results 為 None，中繼資料含 error。
+        """
+        timings = timings if timings is not None else {}
+        layer = self._read_pdf_text_layer(file_path, timings)
+        routing = None
+        ocr_pages = None
+        if layer is not None:
+            routing = [{"page": n, "source": "text_layer" if page is not None else "ocr", "chars": chars}
+                       for n, (page, chars) in enumerate(layer, 1)]
+            ocr_pages = [n for n, (page, _) in enumerate(layer, 1) if page is None]
+            if not ocr_pages:
+                if preprocess_future is not None:
+                    preprocess_future.cancel()
+                read_results = pages_to_read_results([page for page, _ in layer])
+                return read_results, {"preprocess_applied": False, "polling": None, "routing": routing}
+        if self.backend is None:
+            return None, {"error": "Azure Computer Vision client 未配置，請設定 AZURE_SUBSCRIPTION_KEY / AZURE_ENDPOINT"
+                                   "（或設定 OCR_BACKEND=tesseract 使用本機 Tesseract）"}
+
+        started = time.perf_counter()
+        if preprocess_future is not None:
+            preprocessed_bytes, preprocess_info, timings["preprocess"] = preprocess_future.result()
+            # 等待時間 ≈ 前處理尚未完成時上傳端閒置的時間
+            timings["preprocess_wait"] = time.perf_counter() - started
+        else:
+            preprocessed_bytes, preprocess_info = self._preprocess_image(file_path)
+            timings["preprocess"] = time.perf_counter() - started
+        # 全部頁面都需要 OCR 時不指定頁碼（與未使用文字層時的請求相同）
+        pages = ocr_pages if layer is not None and len(ocr_pages) < len(layer) else None
+        preprocess_seconds = timings["preprocess"]
+        read_results, meta = self.backend.read(file_path, preprocessed_bytes, timings, pages=pages)
+        meta["preprocess_applied"] = bool(preprocessed_bytes) and cv2 is not None
+        if preprocess_info is not None:
+            meta["preprocess_info"] = preprocess_info
+            meta["preprocess_seconds"] = round(preprocess_seconds, 4)
+        meta["routing"] = routing
+        if read_results is not None and pages:
+            # 依頁碼把 OCR 結果放回文字層缺少的位置（結果沒有頁碼時依請求順序對應）
+            by_page = {}
+            for n, page in zip(pages, read_results):
+                by_page[getattr(page, "page", None) or n] = page
+            merged = []
+            for n, (page, _) in enumerate(layer, 1):
+                if page is not None:
+                    merged.extend(pages_to_read_results([page]))
+                elif n in by_page:
+                    merged.append(by_page[n])
+            read_results = merged
+        return read_results, meta
+
+    def process_file(self, file_path: str, ground_truth_text: str = None, score: bool = None) -> Tuple[bool, Dict[str, Any]]:
+        """
+        以設定的 OCR 引擎（預設 Azure Read API）處理檔案並回傳簡化 JSON（未配置時回傳錯誤；快取命中時可離線處理）。
+        score 未指定時依 config.scoring_mode，只有 inline 會在此直接評分。
+        提供 ground_truth_text 時另外附上 accuracy（CER / WER）。
+        """
+        success, out = self._process_file(file_path, score=self._should_score_inline(score))
+        if success and ground_truth_text is not None:
+            ocr_text = "\n".join(page.get("page_text", "") for page in out["pages"])
+            out["accuracy"] = {
+                "cer": self.calculate_cer(ocr_text, ground_truth_text),
+                "wer": self.calculate_wer(ocr_text, ground_truth_text),
+            }
+        return success, out
+
+    def _should_score_inline(self, score: Optional[bool]) -> bool:
+        return self.config.scoring_mode == "inline" if score is None else bool(score)
+
+    def _load_read_results(self, file_path: str, cache_key: Optional[str], preprocess_future: Optional[Future],
+                           timings: Dict[str, float]) -> Tuple[Optional[list], Dict[str, Any]]:
+        """
+        取得 read_results（快取命中時直接讀快取，否則交給 OCR 引擎辨識後寫入快取）。
+        回傳 (read_results, meta)；失敗時 read_results 為 None，meta["error"] 為錯誤訊息。
+        """
+        if self.cache and cache_key is None:
+            started = time.perf_counter()
+            cache_key = self.cache.make_key(file_path, self.config)
+            timings["hash"] = time.perf_counter() - started
+        cached = self.cache.get(cache_key) if self.cache and cache_key else None
+        if cached is not None:
+            if preprocess_future is not None:
+                preprocess_future.cancel()
+            read_results = self.cache.deserialize_read_results(cached.get("read_results"))
+            meta = {"preprocess_applied": cached.get("preprocess_applied", False), "polling": None,
+                    "preprocess_info": cached.get("preprocess_info"), "routing": cached.get("routing")}
+        else:
+            read_results, meta = self._read_with_backend(file_path, preprocess_future, timings)
+            if read_results is None:
+                return None, meta
+            if cache_key:
+                self.cache.put(cache_key, {
+                    "key": cache_key,
+                    "file_path": file_path,
+                    "created": int(time.time()),
+                    "preprocess_applied": meta["preprocess_applied"],
+                    "preprocess_info": meta.get("preprocess_info"),
+                    "routing": meta.get("routing"),
+                    "read_results": self.cache.serialize_read_results(read_results),
+                })
+        meta["cache"] = {"enabled": bool(self.cache), "hit": cached is not None, "key": cache_key}
+        return read_results, meta
+
+    def _result_header(self, file_path: str, read_results: list, meta: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "file_path": file_path,
+            "timestamp": int(time.time()),
+            "total_pages": len(read_results),
+            "pages": [],
+            "preprocess": {
+                "enabled": self.config.enable_preprocess,
+                "applied": meta["preprocess_applied"],
+                # 選用的 profile、auto 的影像統計、編碼格式與大小，以及本次前處理耗時（快取命中時沒有）
+                **(meta.get("preprocess_info") or {}),
+                **({"seconds": meta["preprocess_seconds"]} if "preprocess_seconds" in meta else {}),
+            },
+            "polling": meta.get("polling"),
+            "cache": meta["cache"],
+            # PDF 每頁的來源（text_layer 或 ocr）與文字層字數；影像檔為 None
+            "routing": meta.get("routing")
+        }
+
+    def _process_file(self, file_path: str, cache_key: str = None, preprocess_future: Optional[Future] = None,
+                      score: bool = True) -> Tuple[bool, Dict[str, Any]]:
         if not self.is_supported_file(file_path):
             return False, {"error": f"不支援的檔案或不存在: {file_path}"}
-        if not self.client:
-            return False, {"error": "Azure Computer Vision client 未配置，請設定 AZURE_SUBSCRIPTION_KEY / AZURE_ENDPOINT"}
 
-        preprocessed_bytes: Optional[bytes] = self._preprocess_image(file_path)
-        fs = None
+        timings: Dict[str, float] = {}
+        started_total = time.perf_counter()
         try:
-            if preprocessed_bytes is not None:
-                fs = io.BytesIO(preprocessed_bytes)
-            else:
-                fs = open(file_path, "rb")
-            read_response = self.client.read_in_stream(fs, raw=True)
-            operation_location = read_response.headers.get("Operation-Location")
-            if not operation_location:
-                return False, {"error": "無法取得 Operation-Location"}
-            operation_id = operation_location.split("/")[-1]
-
-            # 等待結果完成
-            while True:
-                result = self.client.get_read_result(operation_id)
-                if result.status not in ['notStarted', 'running']:
-                    break
-                time.sleep(0.5)
-
-            if result.status != OperationStatusCodes.succeeded:
-                return False, {"error": f"OCR 失敗: {result.status}"}
-
-            out = {
-                "file_path": file_path,
-                "timestamp": int(time.time()),
-                "total_pages": len(result.analyze_result.read_results),
-                "pages": [],
-                "preprocess": {
-                    "enabled": self.config.enable_preprocess,
-                    "applied": bool(preprocessed_bytes) and cv2 is not None
-                }
-            }
-            for idx, page in enumerate(result.analyze_result.read_results):
+            read_results, meta = self._load_read_results(file_path, cache_key, preprocess_future, timings)
+            if read_results is None:
+                error = {"error": meta["error"]}
+                if meta.get("polling"):
+                    error["polling"] = meta["polling"]
+                return False, error
+
+            out = self._result_header(file_path, read_results, meta)
+            started = time.perf_counter()
+            for idx, page in enumerate(read_results):
                 page_payload = self.process_page(page, idx + 1)
                 out["pages"].append(page_payload)
+            timings["pages"] = time.perf_counter() - started
 
-            out["resume_score"] = self._score_resume(out["pages"], file_path)
-
+            timings["total"] = time.perf_counter() - started_total
+            out["timings"] = {stage: round(sec, 4) for stage, sec in timings.items()}
+            if score:
+                self._attach_score(out)
             return True, out
         except Exception as e:
             return False, {"error": str(e)}
+
+    # 評分（_score_resume）只需要每頁的這些欄位；串流模式只保留它們，不保留完整頁面
+    SCORE_PAGE_KEYS = ("formatted_text", "page_text", "total_lines", "compact_contact")
+
+    def process_file_stream(self, file_path: str, score: bool = None) -> Iterator[Dict[str, Any]]:
+        """
+        串流版 process_file：每處理完一頁就產生一筆紀錄，下游可在後續頁面處理時先處理第 1 頁。
+        依序產生 {"type": "header", ...檔案資訊}、每頁 {"type": "page", ...process_page 結果}、
+        最後 {"type": "footer", "timings", "resume_score"}；失敗時產生 {"type": "error", "error"} 後結束。
+        已處理的頁面不會保留在記憶體中（評分只保留每頁所需的文字與統計）。
+        FileManager.write_results_jsonl 可把紀錄逐行寫出，load_results 可還原成 process_file 的格式。
+        """
+        score = self._should_score_inline(score)
+        if not self.is_supported_file(file_path):
+            yield {"type": "error", "error": f"不支援的檔案或不存在: {file_path}"}
+            return
+        timings: Dict[str, float] = {}
+        started_total = time.perf_counter()
+        try:
+            read_results, meta = self._load_read_results(file_path, None, None, timings)
+        except Exception as e:
+            yield {"type": "error", "error": str(e)}
+            return
+        if read_results is None:
+            yield {"type": "error", "error": meta["error"], "polling": meta.get("polling")}
+            return
+
+        header = self._result_header(file_path, read_results, meta)
+        del header["pages"]
+        yield {"type": "header", **header}
+
+        score_pages: List[Dict[str, Any]] = []
+        pages_elapsed = 0.0
+        for idx in range(len(read_results)):
+            started = time.perf_counter()
+            try:
+                page_payload = self.process_page(read_results[idx], idx + 1)
+            except Exception as e:
+                yield {"type": "error", "error": str(e)}
+                return
+            # Azure 頁面資料處理完即釋放
+            read_results[idx] = None
+            pages_elapsed += time.perf_counter() - started
+            if score:
+                score_pages.append({key: page_payload[key] for key in self.SCORE_PAGE_KEYS})
+            yield {"type": "page", **page_payload}
+        timings["pages"] = pages_elapsed
+
+        timings["total"] = time.perf_counter() - started_total
+        footer: Dict[str, Any] = {"type": "footer", "timings": {stage: round(sec, 4) for stage, sec in timings.items()}}
+        if score:
+            started = time.perf_counter()
+            footer["resume_score"] = self._score_resume(score_pages, file_path)
+            elapsed = time.perf_counter() - started
+            footer["timings"]["scoring"] = round(elapsed, 4)
+            footer["timings"]["total"] = round(footer["timings"]["total"] + elapsed, 4)
+        yield footer
+
+    def _attach_scores(self, outs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """批次版 _attach_score：文字評分合併成較少的 Gemini 請求，評分耗時為整批共用"""
+        started = time.perf_counter()
+        scores = self._score_resumes([(out["pages"], out.get("file_path")) for out in outs])
+        elapsed = time.perf_counter() - started
+        for out, score in zip(outs, scores):
+            out["resume_score"] = score
+            timings = out.setdefault("timings", {})
+            timings["scoring"] = round(elapsed, 4)
+            timings["total"] = round(timings.get("total", 0.0) + elapsed, 4)
+        return outs
+
+    def _attach_score(self, out: Dict[str, Any]) -> Dict[str, Any]:
+        """計算 resume_score 並記錄評分耗時（計入 total）"""
+        started = time.perf_counter()
+        out["resume_score"] = self._score_resume(out["pages"], out.get("file_path"))
+        elapsed = time.perf_counter() - started
+        timings = out.setdefault("timings", {})
+        timings["scoring"] = round(elapsed, 4)
+        timings["total"] = round(timings.get("total", 0.0) + elapsed, 4)
+        return out
+
+    def structure_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """OCR 結果（記憶體中的 dict）-> resume_structurer 的結構化履歷，涵蓋所有頁面，不經過檔案"""
+        if resume_structurer is None:
+            raise RuntimeError("找不到 resume_structurer 模組")
+        started = time.perf_counter()
+        structured = resume_structurer.structure_resume_from_ocr_json(result)
+        timings = result.setdefault("timings", {})
+        timings["structuring"] = round(time.perf_counter() - started, 4)
+        return structured
+
+    def process_files(self, file_paths: List[str], max_workers: int = None,
+                      score: bool = None) -> Iterator[Tuple[str, bool, Dict[str, Any]]]:
+        """
+        批次處理多個檔案，依完成先後逐一回傳 (file_path, success, result)。
+        score 未指定時依 config.scoring_mode；不評分時 OCR 完成即回傳（可交給 ResumeScoringStage 背景評分）。
+        - 上傳＋輪詢：執行緒池，同時進行中的 Azure Read 數量上限為 max_workers（預設 config.batch_workers）
+        - 前處理：config.preprocess_workers > 0 時交給行程池，與網路等待重疊；否則在上傳執行緒內直接執行
+        - 評分：OCR 完成後排入獨立的評分執行緒池（config.scoring_workers），受 Gemini 配額限制時不會佔住上傳名額
+        已送出但 OCR 未完成的檔案最多 max_workers + config.preprocess_prefetch 個，
+        即前處理領先上傳的數量有上限，記憶體中的影像位元組不會無限累積。
+        """
+        workers = max(1, int(max_workers or self.config.batch_workers))
+        score = self._should_score_inline(score)
+        pre_workers = self.config.preprocess_workers
+        window = workers + max(1, self.config.preprocess_prefetch)
+        pre_pool = None
+        if pre_workers > 0 and self.config.enable_preprocess and cv2 is not None:
+            pre_pool = ProcessPoolExecutor(max_workers=pre_workers, initializer=_init_preprocess_worker)
+        io_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-batch")
+        score_pool = ThreadPoolExecutor(max_workers=self.config.scoring_workers, thread_name_prefix="ocr-score")
+        ocr_pending: Dict[Future, str] = {}
+        score_pending: Dict[Future, str] = {}
+        paths = iter(file_paths)
+
+        def submit_next() -> bool:
+            path = next(paths, None)
+            if path is None:
+                return False
+            cache_key = None
+            pre_future = None
+            if self.is_supported_file(path):
+                if self.cache:
+                    try:
+                        cache_key = self.cache.make_key(path, self.config)
+                    except OSError:
+                        cache_key = None
+                # 快取命中時不必前處理
+                if pre_pool and self._can_preprocess(path) and not (cache_key and self.cache.contains(cache_key)):
+                    pre_future = pre_pool.submit(_timed_preprocess, path, self.config.preprocess)
+            ocr_pending[io_pool.submit(self._process_file, path, cache_key, pre_future, False)] = path
+            return True
+
+        try:
+            while len(ocr_pending) < window and submit_next():
+                pass
+            while ocr_pending or score_pending:
+                done, _ = wait(list(ocr_pending) + list(score_pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in ocr_pending:
+                        path = ocr_pending.pop(future)
+                        try:
+                            success, result = future.result()
+                        except Exception as e:
+                            success, result = False, {"error": str(e)}
+                        submit_next()
+                        if success and score:
+                            score_pending[score_pool.submit(self._attach_score, result)] = path
+                            continue
+                    else:
+                        path = score_pending.pop(future)
+                        try:
+                            success, result = True, future.result()
+                        except Exception as e:
+                            success, result = False, {"error": str(e)}
+                    yield path, success, result
         finally:
-            if fs:
-                try:
-                    fs.close()
-                except Exception:
-                    pass
+            # 呼叫端提前中止時，取消尚未開始的檔案
+            io_pool.shutdown(wait=True, cancel_futures=True)
+            score_pool.shutdown(wait=True, cancel_futures=True)
+            if pre_pool:
+                pre_pool.shutdown(wait=True, cancel_futures=True)
 
 class FileManager:
     """儲存與簡單轉換功能"""
+    # 輸出格式 -> 副檔名；壓縮方式 -> 附加副檔名
+    PROFILE_SUFFIXES = {"full": ".json", "compact": ".compact.json", "msgpack": ".msgpack"}
+    COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+    # process_page 輸出的欄位順序（精簡格式還原時依此排列）
+    PAGE_KEYS = ("page_number", "reading_order_lines", "grouped_lines", "structured_lines",
+                 "page_text", "formatted_text", "compact_contact", "total_lines")
+
+    @classmethod
+    def output_format(cls, filename: str) -> Tuple[str, str, str]:
+        """由檔名判斷 (不含副檔名的名稱, profile, compression)"""
+        stem, compression = filename, "none"
+        for name, suffix in cls.COMPRESSION_SUFFIXES.items():
+            if suffix and stem.endswith(suffix):
+                stem, compression = stem[:-len(suffix)], name
+                break
+        # 先比對較長的副檔名（.compact.json 也以 .json 結尾）
+        for name, suffix in sorted(cls.PROFILE_SUFFIXES.items(), key=lambda item: -len(item[1])):
+            if stem.endswith(suffix):
+                return stem[:-len(suffix)], name, compression
+        return os.path.splitext(stem)[0], "full", compression
+
     @staticmethod
-    def save_results(ocr_result: Dict[str, Any], filename: str = None) -> str:
+    def compact_page(page: Dict[str, Any]) -> Dict[str, Any]:
+        """去除可由其他欄位還原的文字欄位（僅在還原結果完全相同時才省略）"""
+        out = dict(page)
+        reading = page.get("reading_order_lines")
+        grouped = page.get("grouped_lines")
+        structured = page.get("structured_lines")
+        if reading is not None and page.get("page_text") == "\n".join(reading):
+            del out["page_text"]
+        if (None not in (reading, grouped, structured) and isinstance(page.get("compact_contact"), dict)
+                and page.get("formatted_text") == format_page_text(page["compact_contact"], structured, grouped, reading)):
+            del out["formatted_text"]
+        if structured is not None and structured == grouped:
+            del out["structured_lines"]
+        if grouped is not None and grouped == reading:
+            del out["grouped_lines"]
+        return out
+
+    @classmethod
+    def expand_page(cls, page: Dict[str, Any]) -> Dict[str, Any]:
+        """compact_page 的反向操作，還原完整欄位與順序"""
+        full = dict(page)
+        reading = full.get("reading_order_lines")
+        if reading is not None:
+            full.setdefault("grouped_lines", list(reading))
+            full.setdefault("structured_lines", list(full["grouped_lines"]))
+            full.setdefault("page_text", "\n".join(reading))
+            if "formatted_text" not in full and isinstance(full.get("compact_contact"), dict):
+                full["formatted_text"] = format_page_text(
+                    full["compact_contact"], full["structured_lines"], full["grouped_lines"], reading)
+        ordered = {key: full[key] for key in cls.PAGE_KEYS if key in full}
+        ordered.update((key, value) for key, value in full.items() if key not in ordered)
+        return ordered
+
+    @classmethod
+    def encode_results(cls, ocr_result: Dict[str, Any], profile: str = "full", compression: str = "none") -> bytes:
+        if profile == "full":
+            data = json.dumps(ocr_result, ensure_ascii=False, indent=2).encode('utf-8')
+        elif profile in ("compact", "msgpack"):
+            compact = {"_format": "compact", **ocr_result}
+            compact["pages"] = [cls.compact_page(page) for page in ocr_result.get("pages", [])]
+            if profile == "compact":
+                data = json.dumps(compact, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            else:
+                if msgpack is None:
+                    raise ImportError("請先安裝 msgpack 套件: pip install msgpack")
+                data = msgpack.packb(compact, use_bin_type=True)
+        else:
+            raise ValueError(f"不支援的輸出格式: {profile}")
+        if compression == "gzip":
+            return gzip.compress(data, compresslevel=6)
+        if compression == "zstd":
+            if zstandard is None:
+                raise ImportError("請先安裝 zstandard 套件: pip install zstandard")
+            return zstandard.ZstdCompressor(level=3).compress(data)
+        if compression != "none":
+            raise ValueError(f"不支援的壓縮方式: {compression}")
+        return data
+
+    @classmethod
+    def decode_results(cls, data: bytes, profile: str = "full", compression: str = "none") -> Dict[str, Any]:
+        if compression == "gzip":
+            data = gzip.decompress(data)
+        elif compression == "zstd":
+            if zstandard is None:
+                raise ImportError("請先安裝 zstandard 套件: pip install zstandard")
+            data = zstandard.ZstdDecompressor().decompress(data)
+        if profile == "msgpack":
+            if msgpack is None:
+                raise ImportError("請先安裝 msgpack 套件: pip install msgpack")
+            result = msgpack.unpackb(data, raw=False)
+        else:
+            result = json.loads(data.decode('utf-8'))
+        if isinstance(result, dict) and result.pop("_format", None) == "compact":
+            result["pages"] = [cls.expand_page(page) for page in result.get("pages", [])]
+        return result
+
+    @classmethod
+    def save_results(cls, ocr_result: Dict[str, Any], filename: str = None, profile: str = None,
+                     compression: str = None, atomic: bool = False) -> str:
+        """
+        依 profile / compression 寫出 OCR 結果（預設 full、不壓縮，與過去相同）。
+        未指定檔名時存成 ocr_output_<name> 加上對應副檔名；指定檔名但未指定格式時由副檔名判斷。
+        """
+        if filename and profile is None and compression is None:
+            _, profile, compression = cls.output_format(filename)
+        profile = profile or "full"
+        compression = compression or "none"
         if not filename:
             src = ocr_result.get("file_path", "ocr_output")
             base = os.path.splitext(os.path.basename(src))[0]
-            filename = f"ocr_output_{base}.json"
+            filename = f"ocr_output_{base}{cls.PROFILE_SUFFIXES[profile]}{cls.COMPRESSION_SUFFIXES[compression]}"
+        data = cls.encode_results(ocr_result, profile, compression)
+        tmp_path = f"{filename}.{threading.get_ident()}.tmp" if atomic else filename
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        if atomic:
+            os.replace(tmp_path, filename)
+        return filename
+
+    @staticmethod
+    def write_results_jsonl(records: Iterator[Dict[str, Any]], filename: str = None) -> str:
+        """
+        逐筆寫出 process_file_stream 的紀錄（JSON Lines，每筆一行並立即 flush），
+        讀取端可在後續頁面仍在處理時先讀到前面的頁面。未指定檔名時依 header 的 file_path 命名。
+        """
+        records = iter(records)
+        first = next(records, None)
+        if first is None:
+            raise ValueError("沒有任何紀錄可寫出")
+        if not filename:
+            src = first.get("file_path", "ocr_output")
+            base = os.path.splitext(os.path.basename(src))[0]
+            filename = f"ocr_output_{base}.jsonl"
         with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(ocr_result, f, ensure_ascii=False, indent=2)
+            for record in chain((first,), records):
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write("\n")
+                f.flush()
+        return filename
+
+    @classmethod
+    def find_results(cls, name: str, folder: str = ".") -> Optional[str]:
+        """找出 ocr_output_<name> 任一格式（各 profile / 壓縮與 .jsonl）的已存檔結果，依 full、compact、msgpack、jsonl 的順序"""
+        candidates = [f"ocr_output_{name}{suffix}{comp}"
+                      for suffix in cls.PROFILE_SUFFIXES.values() for comp in cls.COMPRESSION_SUFFIXES.values()]
+        candidates.append(f"ocr_output_{name}.jsonl")
+        for candidate in candidates:
+            path = os.path.join(folder, candidate)
+            if os.path.exists(path):
+                return path
+        return None
+
+    @classmethod
+    def load_results(cls, filename: str) -> Dict[str, Any]:
+        """讀回 save_results（任一格式與壓縮）或 write_results_jsonl（.jsonl）的輸出，皆還原成 process_file 的結果格式"""
+        if not filename.endswith('.jsonl'):
+            _, profile, compression = cls.output_format(filename)
+            with open(filename, 'rb') as f:
+                return cls.decode_results(f.read(), profile, compression)
+        header: Dict[str, Any] = {}
+        footer: Dict[str, Any] = {}
+        pages: List[Dict[str, Any]] = []
+        with open(filename, 'r', encoding='utf-8') as f:
+            for raw in f:
+                if not raw.strip():
+                    continue
+                record = json.loads(raw)
+                kind = record.pop("type", None)
+                if kind == "page":
+                    pages.append(cls.expand_page(record))
+                elif kind == "header":
+                    header = record
+                elif kind == "footer":
+                    # 背景評分會再追加 footer（resume_score），後面的覆蓋前面的同名欄位
+                    footer.update(record)
+                elif kind == "error":
+                    header["error"] = record.get("error")
+        out = {key: header[key] for key in ("file_path", "timestamp", "total_pages") if key in header}
+        out["pages"] = pages
+        out.update((key, value) for key, value in header.items() if key not in out)
+        out.update(footer)
+        return out
+
+    @staticmethod
+    def write_json_atomic(data: Any, filename: str) -> str:
+        """先寫暫存檔再取代，讀取端不會讀到寫到一半的檔案"""
+        tmp_path = f"{filename}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, filename)
+        return filename
+
+    @staticmethod
+    def write_resume_score(ocr_json_path: str, ocr_json: Dict[str, Any], output: str = "inplace") -> str:
+        """把含 resume_score 的結果寫回 OCR JSON（inplace）或只另存 resume_score_<name>.json（sidecar），回傳寫入路徑"""
+        if output == "sidecar":
+            name = os.path.basename(FileManager.output_format(ocr_json_path)[0])
+            if name.startswith("ocr_output_"):
+                name = name[len("ocr_output_"):]
+            sidecar = os.path.join(os.path.dirname(ocr_json_path), f"resume_score_{name}.json")
+            return FileManager.write_json_atomic({"ocr_json": ocr_json_path, "resume_score": ocr_json.get("resume_score")}, sidecar)
+        if ocr_json_path.endswith('.jsonl'):
+            # 串流輸出不重寫整個檔案，只追加一筆 footer（load_results 會合併）
+            return FileManager.append_jsonl_record(
+                {"type": "footer", "resume_score": ocr_json.get("resume_score")}, ocr_json_path)
+        # 依原檔的副檔名沿用相同的輸出格式與壓縮
+        return FileManager.save_results(ocr_json, ocr_json_path, atomic=True)
+
+    @staticmethod
+    def append_jsonl_record(record: Dict[str, Any], filename: str) -> str:
+        """在 write_results_jsonl 的輸出後面追加一筆紀錄"""
+        with open(filename, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
         return filename
 
     @staticmethod
@@ -821,21 +2309,122 @@ class FileManager:
         return matches
 
     @staticmethod
-    def convert_to_structured_with_resume_structurer(ocr_json_path: str, output_path: str = None) -> str:
-        """若專案有 resume_structurer.py，可呼叫其 structure 函式做更進階結構化"""
-        structurer_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resume_structurer.py')
-        if not os.path.exists(structurer_path):
-            raise FileNotFoundError("找不到 resume_structurer.py")
-        spec = importlib.util.spec_from_file_location('resume_structurer', structurer_path)
-        mod = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(mod)
-        with open(ocr_json_path, 'r', encoding='utf-8') as f:
-            ocr_json = json.load(f)
-        structured = mod.structure_resume_from_ocr_json(ocr_json)
+    def save_structured_resume(structured: Dict[str, Any], source_path: str, output_path: str = None) -> str:
+        """儲存結構化履歷；未指定 output_path 時依來源檔名存成 resume_structured_<name>.json"""
         if not output_path:
-            base = os.path.basename(ocr_json_path)
-            name, _ = os.path.splitext(base)
+            name = os.path.splitext(os.path.basename(source_path))[0]
             output_path = f"resume_structured_{name}.json"
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(structured, f, ensure_ascii=False, indent=2)
-        return output_path
\ No newline at end of file
+        return output_path
+
+    @staticmethod
+    def convert_to_structured_with_resume_structurer(ocr_json_path: str, output_path: str = None) -> str:
+        """讀取已存檔的 OCR 結果（任一格式）做結構化（處理中的結果請改用 OCRProcessor.structure_result，免去存檔再讀回）"""
+        if resume_structurer is None:
+            raise FileNotFoundError("找不到 resume_structurer.py")
+        # 任一輸出格式（compact / msgpack / 壓縮 / .jsonl）都先還原成完整欄位（含 structured_lines）
+        ocr_json = FileManager.load_results(ocr_json_path)
+        structured = resume_structurer.structure_resume_from_ocr_json(ocr_json)
+        return FileManager.save_structured_resume(structured, ocr_json_path, output_path)
+
+
+class ResumeScoringStage:
+    """
+    與 OCR 分離的背景評分階段：OCR JSON 先存檔（resume_score 標記為 pending），
+    評分在獨立執行緒池完成後再寫回原檔或 sidecar，OCR 吞吐量不再受 LLM 速度限制。
+    config.gemini_batch_size > 1 時先累積到一批（或達 token 預算）再合併成一個 Gemini 請求。
+    排隊數超過 max_pending 時不再排入，改標記為 deferred，之後可用 OCRProcessor.score_ocr_json_file 補評分。
+    """
+    def __init__(self, processor: OCRProcessor, workers: int = None, output: str = None, max_pending: int = None):
+        config = processor.config
+        self.processor = processor
+        self.output = output or config.scoring_output
+        self.max_pending = config.scoring_max_pending if max_pending is None else max_pending
+        self.batch_size = config.gemini_batch_size
+        self.batch_token_budget = config.gemini_batch_token_budget
+        self._pool = ThreadPoolExecutor(max_workers=workers or config.scoring_workers, thread_name_prefix="ocr-score")
+        self._pending: Dict[Future, int] = {}
+        self._buffer: List[Tuple[Dict[str, Any], str]] = []
+        self._buffer_tokens = 0
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.deferred = 0
+
+    def _pending_count(self) -> int:
+        self._pending = {f: n for f, n in self._pending.items() if not f.done()}
+        return sum(self._pending.values()) + len(self._buffer)
+
+    def handle(self, ocr_result: Dict[str, Any], filename: str = None, saved: bool = False) -> str:
+        """
+        儲存尚未評分的 OCR 結果並排入評分，回傳 OCR JSON 路徑。
+        saved=True 表示 filename 已寫出（串流輸出的 .jsonl），ocr_result 的 pages 只需含 OCRProcessor.SCORE_PAGE_KEYS，
+        此時只追加 pending 標記，評分完成後再追加結果。
+        """
+        with self._lock:
+            accept = not self.max_pending or self._pending_count() < self.max_pending
+            if not accept:
+                self.deferred += 1
+        ocr_result["resume_score"] = {"status": "pending" if accept else "deferred"}
+        config = self.processor.config
+        if saved:
+            json_path = FileManager.write_resume_score(filename, ocr_result)
+        else:
+            json_path = FileManager.save_results(ocr_result, filename, config.output_profile, config.output_compression)
+        if accept:
+            with self._lock:
+                self._buffer.append((ocr_result, json_path))
+                self._buffer_tokens += estimate_tokens(OCRProcessor._resume_text(ocr_result.get("pages") or []))
+                if len(self._buffer) >= self.batch_size or self._buffer_tokens >= self.batch_token_budget:
+                    self._submit_buffer()
+        return json_path
+
+    def _submit_buffer(self) -> None:
+        # 呼叫端需持有 self._lock
+        if not self._buffer:
+            return
+        batch, self._buffer, self._buffer_tokens = self._buffer, [], 0
+        self._pending[self._pool.submit(self._score_and_write, batch)] = len(batch)
+
+    def flush(self) -> None:
+        """把未滿一批的項目送出評分"""
+        with self._lock:
+            self._submit_buffer()
+
+    def _score_and_write(self, batch: List[Tuple[Dict[str, Any], str]]) -> List[str]:
+        written = []
+        try:
+            if len(batch) == 1:
+                self.processor._attach_score(batch[0][0])
+            else:
+                self.processor._attach_scores([ocr_result for ocr_result, _ in batch])
+        except Exception:
+            with self._lock:
+                self.failed += len(batch)
+            raise
+        for ocr_result, json_path in batch:
+            try:
+                ocr_result["resume_score"]["status"] = "done"
+                written.append(FileManager.write_resume_score(json_path, ocr_result, self.output))
+                with self._lock:
+                    self.completed += 1
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+        return written
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._pending_count()
+
+    def close(self, wait: bool = True) -> None:
+        """wait=False 時捨棄尚未開始的評分（檔案保持 pending，可日後補評分）"""
+        if wait:
+            self.flush()
+        self._pool.shutdown(wait=wait, cancel_futures=not wait)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"completed": self.completed, "failed": self.failed, "deferred": self.deferred,
+                    "pending": self._pending_count()}
@@ -0,0 +1,294 @@
+"""
+離線 OCR 基準測試與正確率回歸檢查
+不連網：以記錄下來的 Azure 回應（OCR 快取）或已存檔的 ocr_output_*.json 重播，
+走完整條 OCRProcessor 管線並量測各階段耗時、吞吐量、記憶體峰值與 CER/WER，
+輸出機器可讀的報告，並可與先前存下的 baseline 比較。
+
+用法: python offline_benchmark.py [--assets assets] [--outputs .] [--report benchmark_report.json]
+                                  [--baseline benchmark_baseline.json] [--save-baseline]
+正確答案：assets/<name>.gt.txt（以 \\f 分頁），或 PDF 的文字層（需安裝 pdfplumber）
+重播時關閉 PDF 文字層直讀（OCR_PDF_TEXT_LAYER）：每一頁都走記錄下來的 Azure 回應，
+否則數位 PDF 會直接讀文字層，上傳/輪詢耗時為 0，CER 也等於拿文字層跟自己比較。
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import text_metrics
+from ocr_backends import AzureReadBackend
+from ocr_processor import FileManager, OCRConfig, OCRProcessor, OCRResultCache, PollingPolicy
+
+try:
+    import pdfplumber  # type: ignore
+except ImportError:
+    pdfplumber = None
+
+# 報告中依序列出的階段
+STAGES = ("preprocess", "upload", "poll", "pages", "normalize", "scoring", "structuring")
+# 與 baseline 比較時的容許範圍：耗時增加比例、CER/WER 增加量
+DEFAULT_TIME_TOLERANCE = 0.25
+DEFAULT_ERROR_TOLERANCE = 0.005
+
+
+class ReplayClient:
+    """假的 ComputerVisionClient：上傳時讀完位元組，輪詢時直接回傳預先載入的 read_results"""
+    def __init__(self):
+        self.read_results: List[Any] = []
+
+    def read_in_stream(self, stream, raw=True, **kwargs):
+        stream.read()
+        return SimpleNamespace(headers={"Operation-Location": "replay/operations/0"})
+
+    def get_read_result(self, operation_id, raw=False, **kwargs):
+        results = SimpleNamespace(read_results=list(self.read_results))
+        return SimpleNamespace(status="succeeded", analyze_result=results, headers={})
+
+
+def read_results_from_output(ocr_json: Dict[str, Any]) -> List[Any]:
+    """
+    已存檔的 OCR 輸出沒有座標，依 reading_order_lines 逐行堆疊出近似的 bounding box，
+    讓 process_page 仍能走完整流程（列群組化結果會與原始版面不同）
+    """
+    pages = []
+    for page in ocr_json.get("pages", []):
+        lines = []
+        for i, text in enumerate(page.get("reading_order_lines") or []):
+            y = 20 * i + 10
+            lines.append(SimpleNamespace(text=text, bounding_box=[10, y, 600, y, 600, y + 12, 10, y + 12]))
+        pages.append(SimpleNamespace(lines=lines, page=page.get("page_number")))
+    return pages
+
+
+def load_recording(file_path: str, config: OCRConfig, outputs: str = ".") -> Optional[Dict[str, Any]]:
+    """找出此檔案的 Azure 回應紀錄：優先 OCR 快取（原始座標），其次已存檔的 ocr_output"""
+    if os.path.isdir(config.cache_dir):
+        cache = OCRResultCache(config.cache_dir, max_entries=0, max_bytes=0, max_age=0)
+        entry = cache.get(cache.make_key(file_path, config))
+        if entry is not None:
+            return {"source": "cache", "read_results": cache.deserialize_read_results(entry.get("read_results"))}
+    base = os.path.splitext(os.path.basename(file_path))[0]
+    candidate = FileManager.find_results(base, outputs)
+    if candidate is None:
+        return None
+    return {"source": os.path.basename(candidate), "read_results": read_results_from_output(FileManager.load_results(candidate))}
+
+
+def load_ground_truth(file_path: str) -> Optional[List[str]]:
+    """逐頁的正確答案文字；沒有時回傳 None"""
+    gt_path = os.path.splitext(file_path)[0] + ".gt.txt"
+    if os.path.exists(gt_path):
+        with open(gt_path, 'r', encoding='utf-8') as f:
+            return f.read().split("\f")
+    if file_path.lower().endswith(".pdf") and pdfplumber is not None:
+        with pdfplumber.open(file_path) as pdf:
+            pages = [page.extract_text() or "" for page in pdf.pages]
+        # 文字層過少視為圖片型 PDF，沒有可用的正確答案
+        if len("".join(pages).strip()) >= 10:
+            return pages
+    return None
+
+
+def run_file(processor: OCRProcessor, client: ReplayClient, file_path: str, recording: Dict[str, Any],
+             structure: bool) -> Dict[str, Any]:
+    """重播單一檔案，回傳各階段耗時（秒）與頁數"""
+    client.read_results = recording["read_results"]
+    success, out = processor.process_file(file_path, score=False)
+    if not success:
+        return {"error": out.get("error")}
+    timings = {stage: out["timings"].get(stage, 0.0) for stage in ("preprocess", "upload", "poll", "pages")}
+
+    started = time.perf_counter()
+    out["pages"] = [processor.normalize_page_text_fields(page) for page in out["pages"]]
+    timings["normalize"] = time.perf_counter() - started
+
+    # 評分只量測本地部分（Gemini 需要連網，以空結果代替）
+    started = time.perf_counter()
+    processor._score_resume(out["pages"], None, gemini_score={})
+    timings["scoring"] = time.perf_counter() - started
+
+    timings["structuring"] = None
+    if structure:
+        started = time.perf_counter()
+        processor.structure_result(out)
+        timings["structuring"] = time.perf_counter() - started
+    return {"pages": len(out["pages"]), "timings": timings, "ocr_pages": [p.get("page_text", "") for p in out["pages"]]}
+
+
+def _structuring_available() -> bool:
+    try:
+        import resume_structurer
+        resume_structurer.get_nlp()
+        return True
+    except Exception:
+        return False
+
+
+def run_benchmark(assets: str, outputs: str = ".", repeat: int = 3, structure: bool = None) -> Dict[str, Any]:
+    config = OCRConfig()
+    config.enable_cache = False
+    config.enable_llm_cache = False
+    # 正確答案可能取自 PDF 文字層，辨識結果必須來自重播的 OCR 回應才有意義
+    config.pdf_text_layer = False
+    config.polling = PollingPolicy(initial_delay=0.0, delay_per_mb=0.0, timeout=30.0)
+    client = ReplayClient()
+    # 不受 OCR_BACKEND 影響，一律重播 Azure 回應
+    processor = OCRProcessor(config, client=client, backend=AzureReadBackend(client, config.polling))
+    if structure is None:
+        structure = _structuring_available()
+
+    files = FileManager.find_files_in_folder(assets, config.supported_extensions)
+    recordings = {}
+    skipped = []
+    for path in files:
+        recording = load_recording(path, config, outputs)
+        if recording is None:
+            skipped.append(os.path.basename(path))
+        else:
+            recordings[path] = recording
+
+    report_files: Dict[str, Any] = {}
+    # 各檔案取 repeat 次中最快的一次，降低雜訊
+    started_all = time.perf_counter()
+    for path, recording in recordings.items():
+        best = None
+        for _ in range(max(1, repeat)):
+            result = run_file(processor, client, path, recording, structure)
+            if "error" in result:
+                best = result
+                break
+            total = sum(v for v in result["timings"].values() if v)
+            if best is None or total < best["_total"]:
+                best = {**result, "_total": total}
+        name = os.path.basename(path)
+        entry: Dict[str, Any] = {"source": recording["source"]}
+        if "error" in best:
+            entry["error"] = best["error"]
+        else:
+            entry["pages"] = best["pages"]
+            entry["timings"] = {stage: (round(sec, 6) if sec is not None else None)
+                                for stage, sec in best["timings"].items()}
+            gt_pages = load_ground_truth(path)
+            if gt_pages is not None:
+                metrics = text_metrics.document_metrics(gt_pages, best["ocr_pages"])
+                entry["accuracy"] = {key: metrics[key] for key in ("cer", "wer", "char_distance", "gt_chars")}
+        report_files[name] = entry
+    elapsed = time.perf_counter() - started_all
+
+    # 記憶體峰值另外跑一輪（tracemalloc 本身會拖慢耗時量測）
+    tracemalloc.start()
+    for path, recording in recordings.items():
+        run_file(processor, client, path, recording, structure)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    totals = {stage: 0.0 for stage in STAGES}
+    pages = 0
+    for entry in report_files.values():
+        pages += entry.get("pages", 0)
+        for stage, sec in (entry.get("timings") or {}).items():
+            if sec is not None:
+                totals[stage] += sec
+    runs = max(1, repeat) * len(recordings)
+    return {
+        "generated": int(time.time()),
+        "python": sys.version.split()[0],
+        "files": report_files,
+        "skipped": skipped,
+        "summary": {
+            "files": len(recordings),
+            "pages": pages,
+            "stage_totals": {stage: round(sec, 6) for stage, sec in totals.items()},
+            "files_per_second": round(runs / max(elapsed, 1e-9), 3),
+            "peak_memory_mib": round(peak / (1024 * 1024), 3),
+            "structuring": structure,
+        },
+    }
+
+
+def compare_reports(report: Dict[str, Any], baseline: Dict[str, Any],
+                    time_tolerance: float = DEFAULT_TIME_TOLERANCE,
+                    error_tolerance: float = DEFAULT_ERROR_TOLERANCE) -> List[str]:
+    """回傳相對 baseline 的回歸項目（空清單代表沒有回歸）"""
+    regressions = []
+    base_totals = baseline.get("summary", {}).get("stage_totals", {})
+    for stage, sec in report["summary"]["stage_totals"].items():
+        base = base_totals.get(stage)
+        # 極短的階段容易受雜訊影響，低於 1ms 不比較
+        if base and max(base, sec) >= 0.001 and sec > base * (1 + time_tolerance):
+            regressions.append(f"{stage} 耗時 {base * 1000:.2f} ms -> {sec * 1000:.2f} ms")
+    base_peak = baseline.get("summary", {}).get("peak_memory_mib")
+    peak = report["summary"]["peak_memory_mib"]
+    if base_peak and peak > base_peak * (1 + time_tolerance):
+        regressions.append(f"記憶體峰值 {base_peak:.2f} MiB -> {peak:.2f} MiB")
+    for name, entry in report["files"].items():
+        base_acc = (baseline.get("files", {}).get(name) or {}).get("accuracy")
+        acc = entry.get("accuracy")
+        if not base_acc or not acc:
+            continue
+        for metric in ("cer", "wer"):
+            if acc[metric] > base_acc[metric] + error_tolerance:
+                regressions.append(f"{name} {metric.upper()} {base_acc[metric] * 100:.2f}% -> {acc[metric] * 100:.2f}%")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]):
+    summary = report["summary"]
+    print(f"=== 離線基準測試（{summary['files']} 個檔案，{summary['pages']} 頁）===")
+    for name, entry in report["files"].items():
+        if "error" in entry:
+            print(f"{name}: 失敗 {entry['error']}")
+            continue
+        stages = "  ".join(f"{stage} {sec * 1000:.2f}ms" for stage, sec in entry["timings"].items() if sec is not None)
+        acc = entry.get("accuracy")
+        acc_text = f"  CER {acc['cer'] * 100:.2f}% WER {acc['wer'] * 100:.2f}%" if acc else ""
+        print(f"{name}（{entry['source']}）: {stages}{acc_text}")
+    if report["skipped"]:
+        print(f"沒有紀錄可重播，略過: {', '.join(report['skipped'])}")
+    print("各階段累計: " + "  ".join(f"{stage} {sec * 1000:.2f}ms" for stage, sec in summary["stage_totals"].items()))
+    print(f"吞吐量: {summary['files_per_second']} 檔/秒  記憶體峰值: {summary['peak_memory_mib']} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="離線 OCR 基準測試與正確率回歸檢查")
+    parser.add_argument("--assets", default="assets")
+    parser.add_argument("--outputs", default=".", help="已存檔 ocr_output_*.json 所在的資料夾")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--report", default="benchmark_report.json")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次結果存成 baseline")
+    parser.add_argument("--no-structuring", action="store_true", help="略過履歷結構化（不載入 spaCy）")
+    parser.add_argument("--time-tolerance", type=float, default=DEFAULT_TIME_TOLERANCE)
+    parser.add_argument("--error-tolerance", type=float, default=DEFAULT_ERROR_TOLERANCE)
+    args = parser.parse_args()
+
+    report = run_benchmark(args.assets, args.outputs, args.repeat, structure=False if args.no_structuring else None)
+    print_report(report)
+    FileManager.write_json_atomic(report, args.report)
+    print(f"報告已輸出: {args.report}")
+
+    if args.save_baseline:
+        FileManager.write_json_atomic(report, args.baseline)
+        print(f"已更新 baseline: {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print("尚無 baseline，可加上 --save-baseline 建立")
+        return
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare_reports(report, baseline, args.time_tolerance, args.error_tolerance)
+    if regressions:
+        print("=== 相對 baseline 的回歸 ===")
+        for item in regressions:
+            print(f"  - {item}")
+        sys.exit(1)
+    print("與 baseline 相比沒有回歸")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,12 @@ OCR 主程式
 """
 
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from ocr_processor import OCRProcessor, OCRConfig, FileManager
+from ocr_processor import OCRProcessor, OCRConfig, FileManager, ResumeScoringStage
 from bullet_resume_parser import BulletResumeParser
-from resume_structurer import structure_resume_from_ocr_json
+from ingest_manifest import IngestManifest, FolderWatcher
 
 
 def print_file_info(file_path: str, index: int, total: int):
@@ -26,16 +28,232 @@ def print_statistics(ocr_result: dict):
     print(f"總字符數: {summary.get('total_characters', 0)}")
 
 
-def process_single_file(processor: OCRProcessor, file_path: str):
-    """處理單個檔案"""
+def structure_result(processor: OCRProcessor, result: dict):
+    """OCR_STRUCTURE_RESUME 開啟時，直接以記憶體中的 OCR 結果產生結構化履歷"""
+    if not processor.config.structure_resume:
+        return None
+    try:
+        structured = processor.structure_result(result)
+        return FileManager.save_structured_resume(structured, result.get("file_path", "ocr_output"))
+    except Exception as e:
+        print(f"結構化失敗: {e}")
+        return None
+
+
+def save_result(processor: OCRProcessor, result: dict, scorer: ResumeScoringStage = None) -> str:
+    """儲存 OCR 結果（格式依 OCR_OUTPUT_PROFILE / OCR_OUTPUT_COMPRESSION）；有背景評分階段時先存檔，評分完成後再寫回"""
+    if scorer:
+        return scorer.handle(result)
+    config = processor.config
+    return FileManager.save_results(result, profile=config.output_profile, compression=config.output_compression)
+
+
+def process_single_file_stream(processor: OCRProcessor, file_path: str, scorer: ResumeScoringStage = None,
+                               verbose: bool = True):
+    """
+    串流處理單個檔案：每處理完一頁就寫出一行 JSON Lines，回傳 (是否成功, 輸出檔名或錯誤訊息)。
+    背景評分（deferred）與結構化（OCR_STRUCTURE_RESUME）照常進行，只在記憶體中保留每頁所需的文字欄位。
+    verbose=False 時不印出逐頁進度（批次模式由呼叫端統一輸出）。
+    """
+    errors = []
+    pages = []
+    keep = set()
+    if scorer:
+        keep.update(OCRProcessor.SCORE_PAGE_KEYS)
+    if processor.config.structure_resume:
+        keep.update(("page_number", "structured_lines", "grouped_lines"))
+
+    def report(records):
+        for record in records:
+            if record["type"] == "page":
+                if verbose:
+                    print(f"  第 {record['page_number']} 頁完成（{record['total_lines']} 行）")
+                if keep:
+                    pages.append({key: record[key] for key in keep if key in record})
+            elif record["type"] == "error":
+                errors.append(record.get('error', '未知錯誤'))
+                if verbose:
+                    print(f"處理失敗: {errors[-1]}")
+            yield record
+
+    # 檔名取自輸入路徑（第一筆紀錄可能是沒有 file_path 的錯誤）
+    base = os.path.splitext(os.path.basename(file_path))[0]
+    json_filename = FileManager.write_results_jsonl(report(processor.process_file_stream(file_path)),
+                                                    f"ocr_output_{base}.jsonl")
+    if verbose:
+        print(f"\n檔案已輸出: {json_filename}")
+    if errors:
+        return False, errors[0]
+    result = {"file_path": file_path, "pages": pages}
+    structured_filename = structure_result(processor, result)
+    if structured_filename and verbose:
+        print(f"結構化履歷: {structured_filename}")
+    if scorer:
+        scorer.handle(result, json_filename, saved=True)
+    return True, json_filename
+
+
+def process_single_file(processor: OCRProcessor, file_path: str, scorer: ResumeScoringStage = None):
+    """處理單個檔案，回傳 (是否成功, 輸出檔名或錯誤訊息)"""
     print("正在處理中...")
+    if processor.config.stream_output:
+        return process_single_file_stream(processor, file_path, scorer)
     success, result = processor.process_file(file_path)
     if success and result and result["pages"]:
-        json_filename = FileManager.save_results(result)
+        structured_filename = structure_result(processor, result)
+        json_filename = save_result(processor, result, scorer)
         print(f"\n檔案已輸出: {json_filename}")
-    else:
-        error_msg = result.get('error', '未知錯誤')
-        print(f"處理失敗: {error_msg}")
+        if structured_filename:
+            print(f"結構化履歷: {structured_filename}")
+        return True, json_filename
+    error_msg = result.get('error', '未知錯誤')
+    print(f"處理失敗: {error_msg}")
+    return False, error_msg
+
+
+def _batch_results(processor: OCRProcessor, files: list, max_workers: int, scorer: ResumeScoringStage = None):
+    """processor.process_files 的結果結構化並存檔，依完成順序產生 (檔案, 是否成功, 輸出檔名或錯誤訊息, 各階段耗時)"""
+    for file_path, success, result in processor.process_files(files, max_workers):
+        if success and result and result.get("pages"):
+            structure_result(processor, result)
+            yield file_path, True, save_result(processor, result, scorer), result.get("timings") or {}
+        else:
+            yield file_path, False, (result or {}).get('error', '未知錯誤'), {}
+
+
+def _stream_batch_results(processor: OCRProcessor, files: list, max_workers: int,
+                          scorer: ResumeScoringStage = None):
+    """
+    OCR_STREAM_OUTPUT 的批次版：max_workers 個檔案同時以 process_single_file_stream 逐頁寫出 JSON Lines，
+    依完成順序產生與 _batch_results 相同格式的結果（逐頁輸出不保留各階段耗時）。
+    """
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ocr-stream") as pool:
+        futures = {pool.submit(process_single_file_stream, processor, file_path, scorer, False): file_path
+                   for file_path in files}
+        for future in as_completed(futures):
+            try:
+                success, detail = future.result()
+            except Exception as e:
+                success, detail = False, str(e)
+            yield futures[future], success, detail, {}
+
+
+def process_batch(processor: OCRProcessor, files: list, max_workers: int, scorer: ResumeScoringStage = None):
+    """
+    批次處理：同時進行多個 OCR，依完成順序輸出每個檔案的結果；回傳 [(檔案, 是否成功, 輸出檔名或錯誤訊息), ...]
+    OCR_STREAM_OUTPUT 開啟時每個檔案逐頁寫成 JSON Lines（與單檔模式相同）。
+    """
+    stream = processor.config.stream_output
+    print(f"批次模式：同時處理上限 {max_workers} 個檔案{'（逐頁串流輸出）' if stream else ''}")
+    started = time.perf_counter()
+    succeeded, failed = [], []
+    outcomes = []
+    stage_totals = {}
+    results = (_stream_batch_results if stream else _batch_results)(processor, files, max_workers, scorer)
+    for i, (file_path, success, detail, timings) in enumerate(results, 1):
+        outcomes.append((file_path, success, detail))
+        if success:
+            for stage, sec in timings.items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + sec
+            succeeded.append(file_path)
+            print(f"[{i}/{len(files)}] 成功: {file_path} -> {detail}")
+        else:
+            failed.append((file_path, detail))
+            print(f"[{i}/{len(files)}] 失敗: {file_path} ({detail})")
+    elapsed = time.perf_counter() - started
+
+    print(f"\n=== 批次統計 ===")
+    print(f"成功: {len(succeeded)}  失敗: {len(failed)}")
+    for file_path, error_msg in failed:
+        print(f"  - {file_path}: {error_msg}")
+    print(f"耗時: {elapsed:.2f} 秒，吞吐量: {len(files) / max(elapsed, 1e-9):.2f} 檔/秒")
+    if stage_totals:
+        print("各階段累計耗時: " + "  ".join(f"{stage} {sec:.2f}s" for stage, sec in stage_totals.items()))
+    if processor.cache:
+        stats = processor.cache.stats()
+        print(f"快取: 命中 {stats['hits']} / 未命中 {stats['misses']}，共 {stats['entries']} 筆")
+    return outcomes
+
+
+def process_files(processor: OCRProcessor, files: list, scorer: ResumeScoringStage = None) -> list:
+    """依 OCR_BATCH_WORKERS 逐檔或批次處理，回傳 [(檔案, 是否成功, 輸出檔名或錯誤訊息), ...]"""
+    if processor.config.batch_workers > 1:
+        return process_batch(processor, files, processor.config.batch_workers, scorer)
+    outcomes = []
+    for i, file_path in enumerate(files, 1):
+        print_file_info(file_path, i, len(files))
+        success, detail = process_single_file(processor, file_path, scorer)
+        outcomes.append((file_path, success, detail))
+        print("-" * 60)
+    return outcomes
+
+
+def ingest_once(processor: OCRProcessor, manifest: IngestManifest, folder: str,
+                scorer: ResumeScoringStage = None, full: bool = False) -> int:
+    """同步 manifest 並只處理新增或變更的檔案，回傳處理的檔案數"""
+    config = processor.config
+    started = time.perf_counter()
+    scan = manifest.scan(folder, config.supported_extensions, full=full)
+    digests = {}
+    for file_path in manifest.pending(config.ingest_settle_seconds, config.ingest_max_attempts):
+        digest = manifest.claim(file_path)
+        if digest is not None:
+            digests[file_path] = digest
+    print(f"{'完整' if full else ''}掃描 {folder}: 列舉 {scan['listed']} / 略過 {scan['skipped']} 個資料夾，"
+          f"新增 {scan['new']}、變更 {scan['changed']}、移除 {scan['removed']}，"
+          f"待處理 {len(digests)} 個檔案（{time.perf_counter() - started:.2f} 秒）")
+    if not digests:
+        return 0
+    for file_path, success, detail in process_files(processor, list(digests), scorer):
+        if success:
+            manifest.mark_done(file_path, digests[file_path], detail)
+        else:
+            manifest.mark_failed(file_path, detail)
+    return len(digests)
+
+
+def run_incremental(processor: OCRProcessor, folder: str, scorer: ResumeScoringStage = None):
+    """OCR_INGEST_MODE=incremental：處理一輪新增 / 變更的檔案；watch：持續監看資料夾直到 Ctrl+C"""
+    config = processor.config
+    manifest = IngestManifest(config.ingest_manifest_path)
+    watcher = None
+    try:
+        ingest_once(processor, manifest, folder, scorer, full=config.ingest_full_rescan)
+        if config.ingest_mode != "watch":
+            return
+        watcher = FolderWatcher(folder)
+        mode = "檔案系統事件" if watcher.uses_events else f"每 {config.watch_interval:g} 秒輪詢"
+        print(f"監看 {folder}（{mode}），按 Ctrl+C 結束")
+        while True:
+            changed = watcher.wait(config.watch_interval)
+            if changed:
+                # 事件回報的路徑可能是原地覆寫（資料夾 mtime 不變），直接重新 stat
+                manifest.refresh(changed, config.supported_extensions)
+            # 定期完整比對，找出原地覆寫（資料夾 mtime 不變）且未收到事件的檔案
+            full = manifest.full_scan_due(config.ingest_full_rescan_interval)
+            ingest_once(processor, manifest, folder, scorer, full=full)
+    except KeyboardInterrupt:
+        print("\n停止監看")
+    finally:
+        if watcher is not None:
+            watcher.close()
+        stats = manifest.stats()
+        print("manifest: " + "  ".join(f"{status} {n}" for status, n in sorted(stats.items())))
+        manifest.close()
+
+
+def finish(processor: OCRProcessor, scorer: ResumeScoringStage = None):
+    """等待背景評分完成並釋放資源"""
+    if scorer:
+        print(f"OCR 已完成，等待背景評分（剩餘 {scorer.pending()} 筆）...")
+        scorer.close(wait=True)
+        stats = scorer.stats()
+        print(f"評分完成: {stats['completed']}  失敗: {stats['failed']}  延後: {stats['deferred']}")
+    if processor.llm_cache:
+        # 整個執行期間的累計值（單筆是否命中見各評分結果的 cached 欄位）
+        stats = processor.llm_cache.counters()
+        print(f"LLM 快取: 命中 {stats['hits']} / 未命中 {stats['misses']}")
+    processor.close()
 
 
 def main():
@@ -51,6 +269,14 @@ def main():
         print(f"{assets_folder} 資料夾不存在")
         return
     
+    # OCR_SCORING_MODE=deferred 時 OCR 結果先存檔，評分於背景完成後寫回
+    scorer = ResumeScoringStage(processor) if config.scoring_mode == "deferred" else None
+
+    if config.ingest_mode in ("incremental", "watch"):
+        run_incremental(processor, assets_folder, scorer)
+        finish(processor, scorer)
+        return
+
     print(f"掃描 {assets_folder} 資料夾中的檔案...")
     
     # 尋找支援的檔案
@@ -71,11 +297,9 @@ def main():
     print("\n開始處理檔案...")
     print("=" * 60)
     
-    # 處理每個檔案
-    for i, file_path in enumerate(files_found, 1):
-        print_file_info(file_path, i, len(files_found))
-        process_single_file(processor, file_path)
-        print("-" * 60)
+    # 處理每個檔案（OCR_BATCH_WORKERS > 1 時改用批次模式）
+    process_files(processor, files_found, scorer)
+    finish(processor, scorer)
     
     print(f"\n處理完成！總共處理了 {len(files_found)} 個檔案")
     
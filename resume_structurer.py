@@ -1,9 +1,38 @@
 import json
-import spacy
-nlp = spacy.load("zh_core_web_sm")
+import os
+import re
+import threading
+from typing import Any, Dict, Iterable, Iterator, List
+
+from keyword_matcher import KeywordMatcher
+
+# spaCy 模型延遲到第一次需要 NER 時才載入（import 本模組不再付出載入成本）
+SPACY_MODEL = os.getenv("RESUME_SPACY_MODEL", "zh_core_web_sm")
+# 只執行 NER 需要的元件，其餘（tagger、parser 等）停用
+_NER_PIPES = ("tok2vec", "transformer", "ner")
+# structure_resumes 的 nlp.pipe 參數
+NLP_BATCH_SIZE = max(1, int(os.getenv("RESUME_NLP_BATCH_SIZE", "64")))
+NLP_N_PROCESS = max(1, int(os.getenv("RESUME_NLP_PROCESSES", "1")))
+
+_nlp = None
+_nlp_lock = threading.Lock()
+
+
+def get_nlp():
+    """載入（僅一次）並回傳只保留 NER 相關元件的 spaCy pipeline"""
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+                nlp = spacy.load(SPACY_MODEL)
+                nlp.select_pipes(enable=[name for name in nlp.pipe_names if name in _NER_PIPES])
+                _nlp = nlp
+    return _nlp
+
 
 def extract_entities(text):
-    doc = nlp(text)
+    doc = get_nlp()(text)
     entities = [(ent.text, ent.label_) for ent in doc.ents]
     return entities
 
@@ -53,141 +82,283 @@ def extract_resume_fields(ocr_json):
     return result
 
 
-def structure_resume_from_ocr_json(ocr_json):
+# 關鍵字定義（欄位 -> key 中可能出現的字詞，順序即套用順序）
+KEYWORDS = {
+    'name': ['姓名', '中文姓名', 'name'],
+    'phone': ['手機', '電話', 'phone', 'tel'],
+    'email': ['Email', 'E-mail', 'email', 'mail'],
+    'address': ['通訊地址', '居住地', '地址', 'address'],
+    'birth_date': ['出生日期', '生日', 'birth', '出生'],
+    'education': ['最高學歷', '學歷', '學校', '科系', 'education', 'degree'],
+    'job_title': ['應徵職務', '職稱', 'job', 'title', '申請職位'],
+    'gender': ['性別', 'gender'],
+    'age': ['年齡', 'age'],
+    'language': ['語言能力', '語言', 'language'],
+    'license': ['駕照', 'license'],
+    'certificate': ['證照', 'certificate', '專業證照'],
+    'available_time': ['可配合時段', '時段', '時間'],
+    'self_intro': ['自傳', '簡介', '自我介紹'],
+    'work_experience': ['工作經歷', '工作或社團經歷', '經歷', 'experience'],
+    'skills': ['技能', '專長', '能力'],
+    'computer_skills': ['電腦能力', '電腦技能', 'computer', 'Excel', 'Word'],
+}
+DAYS = ['週一', '週二', '週三', '週四', '週五', '週六', '週日']
+# 可有多筆值的欄位（空值略過）
+_LIST_FIELDS = {'language', 'certificate', 'skills', 'computer_skills'}
+# 表格類別 -> 輸出欄位（skills 另外處理，只取每列第一格）
+_TABLE_FIELDS = [
+    ('work_experience', 'work_experience_table'),
+    ('language', 'languages_table'),
+    ('computer_skills', 'computer_skills_table'),
+    ('certificate', 'certificates_table'),
+]
+
+# 欄位與星期共用同一個 trie，每個 key 掃描一次即可得知所有命中的欄位/星期
+# text_blocks（舊版格式）沿用原本的子字串比對，輸出與原實作相同
+_FIELD_ORDER = {field: i for i, field in enumerate(KEYWORDS)}
+_DAY_ORDER = {day: i for i, day in enumerate(DAYS)}
+_KEY_MATCHER = KeywordMatcher(
+    [(kw, ('field', field)) for field, kws in KEYWORDS.items() for kw in kws]
+    + [(day, ('day', day)) for day in DAYS]
+)
+# structured_lines 的標籤另外比對：英文關鍵字需位於單字邊界（'age' 不會命中 'language'、'page'），
+# 並接受 OCR 行常見的大寫寫法
+_LABEL_KEYWORDS = {'phone': ['Phone']}
+_LABEL_MATCHER = KeywordMatcher(
+    [(kw, ('field', field)) for field, kws in KEYWORDS.items() for kw in kws + _LABEL_KEYWORDS.get(field, [])]
+    + [(day, ('day', day)) for day in DAYS],
+    word_boundary=True,
+)
+
+# 超過此長度的 key 視為一般文字（句子），不當作欄位標籤
+MAX_LABEL_CHARS = 16
+# 標籤與 value 前後可忽略的項目符號、引號與空白
+_LABEL_STRIP = ' \t·•‧-–—*\'"|'
+# 標籤前後的分隔（標籤須是獨立的詞，不能是句子的一部分）
+_LABEL_BEFORE = ' \t·•‧|/'
+_LABEL_AFTER = ' \t:：'
+# value 以這些標點開頭：關鍵字位於句子中間，不是標籤
+_CLAUSE_PUNCT = ',，。、;；'
+# 只由標籤與這些連接詞組成的 value 是標題（「技能與專長」），不是欄位值
+_HEADING_JOINERS = _LABEL_STRIP + '與和及&/、'
+# 可以是整段文字的欄位；其他欄位的 value 含句號時視為句子而非欄位值
+_PROSE_FIELDS = {'self_intro', 'work_experience'}
+_RE_EMAIL = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+_RE_PHONE = re.compile(r'\+?\(?\d[\d\-\s()]{6,}\d')
+# 電話號碼的位數範圍（E.164 最多 15 位），排除日期與長串編號；年份區間（2020 - 2023）也不是電話
+_PHONE_DIGITS = (8, 15)
+_RE_YEAR_RANGE = re.compile(r'(?:19|20)\d{2}\s*[-~–]\s*(?:19|20)\d{2}')
+
+
+def _label_hits(text: str) -> List[Any]:
+    """text 中的關鍵字 (start, end, keyword)，去掉被較長關鍵字包含的符合（'語言能力' 不再同時命中 '能力'）"""
+    hits = _LABEL_MATCHER.find_all(text)
+    return [h for h in hits
+            if not any(o[0] <= h[0] and h[1] <= o[1] and o[1] - o[0] > h[1] - h[0] for o in hits)]
+
+
+def _leading_label(line: str) -> Any:
+    """line 若以標籤開頭（之後為空白、冒號或行尾），回傳 (標籤, 其後文字)；否則 None"""
+    text = line.strip(_LABEL_STRIP)
+    best = None
+    for start, end, keyword in _LABEL_MATCHER.iter_matches(text):
+        if start > 0:
+            break
+        if end == len(text) or text[end] in _LABEL_AFTER:
+            best = (keyword, text[end:].strip(_LABEL_STRIP + ':：'))
+    return best
+
+
+def _page_items(page) -> Iterator[Any]:
     """
-    新版結構化函式，將 OCR JSON 直接轉成 resume dict，支援 key-value 配對
+    逐一產生頁面中的 (key, value, 是否來自 OCR 行)。
+    支援兩種格式：舊版 text_blocks（content 內含 key/value），
+    以及 OCRProcessor.process_page 輸出的 structured_lines（「key: value」或單獨一行）。
+    沒有分隔的行只有在以標籤開頭時才當作 key/value（例如「駕照 重型機車駕照」、單獨的「可配合時段」），
+    其餘是一般文字，以 ('', line) 產生：只進 NER 全文，不對應任何欄位。
+    text_blocks 的 key/value 已經配對好，維持原本的萃取規則；OCR 行才套用標籤與 value 的清理規則。
     """
-    page = ocr_json['pages'][0]
-    blocks = page.get('text_blocks', [])
-    tables = page.get('tables', [])
-    resume = {}
-    # 關鍵字定義
-    keywords = {
-        'name': ['姓名', '中文姓名', 'name'],
-        'phone': ['手機', '電話', 'phone', 'tel'],
-        'email': ['Email', 'E-mail', 'email', 'mail'],
-        'address': ['通訊地址', '居住地', '地址', 'address'],
-        'birth_date': ['出生日期', '生日', 'birth', '出生'],
-        'education': ['最高學歷', '學歷', '學校', '科系', 'education', 'degree'],
-        'job_title': ['應徵職務', '職稱', 'job', 'title', '申請職位'],
-        'gender': ['性別', 'gender'],
-        'age': ['年齡', 'age'],
-        'language': ['語言能力', '語言', 'language'],
-        'license': ['駕照', 'license'],
-        'certificate': ['證照', 'certificate', '專業證照'],
-        'available_time': ['可配合時段', '時段', '時間'],
-        'self_intro': ['自傳', '簡介', '自我介紹'],
-        'work_experience': ['工作經歷', '工作或社團經歷', '經歷', 'experience'],
-        'skills': ['技能', '專長', '能力'],
-        'computer_skills': ['電腦能力', '電腦技能', 'computer', 'Excel', 'Word'],
-    }
-
-    # NLP 分析重點
+    if 'text_blocks' in page:
+        for block in page.get('text_blocks', []):
+            for item in block.get('content', []):
+                yield item.get('key', ''), item.get('value', ''), False
+        return
+    for line in page.get('structured_lines') or page.get('grouped_lines') or []:
+        key, sep, value = line.partition(': ')
+        if sep:
+            yield key, value, True
+            continue
+        label = _leading_label(line)
+        key, value = label if label is not None else ('', line)
+        yield key, value, True
+
+
+def _key_tags(key: str, from_lines: bool = True) -> Any:
+    """
+    key 命中的 (欄位, 星期)。
+    OCR 行的 key 以標籤規則比對，太長（句子）時不對應任何欄位；text_blocks 的 key 只要含關鍵字即命中。
+    """
+    if not from_lines:
+        tags = _KEY_MATCHER.tags(key)
+    elif len(key.strip()) > MAX_LABEL_CHARS:
+        return [], []
+    else:
+        tags = set()
+        for _, _, keyword in _label_hits(key):
+            tags.update(_LABEL_MATCHER.keywords[keyword])
+    fields = sorted((name for kind, name in tags if kind == 'field'), key=_FIELD_ORDER.__getitem__)
+    days = sorted((name for kind, name in tags if kind == 'day'), key=_DAY_ORDER.__getitem__)
+    return fields, days
+
+
+def _field_value(field: str, value: str) -> Any:
+    """
+    清理 field 標籤後的 value；回傳 None 代表這一項不是此欄位的值（關鍵字出現在句中、或 value 是一段句子）。
+    value 在同一列下一個其他欄位的標籤處截斷（「Y小編 ·應徵職務 ...」、表頭列「時間 工作概述」），
+    開頭重複的同欄位標籤（「Email yy@...」）會被略過，只剩標籤與連接詞的 value（「與專長」）視為標題；
+    email / phone 只取符合格式的部分，找不到時不算此欄位。
+    """
+    value = value.strip(_LABEL_STRIP)
+    if not value:
+        return ''
+    if value[0] in _CLAUSE_PUNCT:
+        return None
+    cut = len(value)
+    skip = 0
+    same = []
+    for start, end, keyword in _label_hits(value):
+        if ('field', field) in _LABEL_MATCHER.keywords[keyword]:
+            same.append((start, end))
+            if start == skip:
+                skip = end
+            continue
+        if start > 0 and value[start - 1] not in _LABEL_BEFORE:
+            continue
+        if end < len(value) and value[end] not in _LABEL_AFTER:
+            continue
+        cut = start
+        break
+    rest = ''.join(value[a:b] for a, b in zip([0] + [e for _, e in same], [s for s, _ in same] + [cut]))
+    if not rest.strip(_HEADING_JOINERS):
+        return ''
+    value = value[skip:cut].strip(_LABEL_STRIP + ':：')
+    if field == 'email':
+        m = _RE_EMAIL.search(value)
+        return m.group() if m else None
+    if field == 'phone':
+        for m in _RE_PHONE.finditer(value):
+            number = m.group().strip()
+            digits = sum(ch.isdigit() for ch in number)
+            if _PHONE_DIGITS[0] <= digits <= _PHONE_DIGITS[1] and not _RE_YEAR_RANGE.fullmatch(number):
+                return number
+        return None
+    if field not in _PROSE_FIELDS and '。' in value:
+        return None
+    return value
+
+
+def _index_resume(ocr_json) -> Dict[str, Any]:
+    """
+    單次走訪所有頁面的 key/value 與 tables，建立後續萃取需要的索引：
+    items（value, 命中欄位, 命中星期, 是否來自 OCR 行）、表格類別 -> 列、NER 用全文。
+    """
+    items = []
     all_text = []
-    for block in blocks:
-        for item in block.get('content', []):
-            key = item.get('key', '')
-            value = item.get('value', '')
+    rows_by_category: Dict[Any, List[Any]] = {}
+    for page in ocr_json.get('pages', []):
+        for key, value, from_lines in _page_items(page):
             if key:
                 all_text.append(key)
             if value:
                 all_text.append(value)
-    for table in tables:
-        for row in table.get('data', []):
-            all_text.extend(row)
-    full_text = '\n'.join(all_text)
-    doc = nlp(full_text)
-    key_points = []
-    for ent in doc.ents:
-        key_points.append({'text': ent.text, 'label': ent.label_})
-
-    # 基本資料萃取（用 key 來判斷）
-    for block in blocks:
-        for item in block.get('content', []):
-            key = item.get('key', '')
-            value = item.get('value', '')
-            for field, kw_list in keywords.items():
-                if any(kw in key for kw in kw_list):
-                    # 多欄位支援（如多個語言、證照等）
-                    if field in ['language', 'certificate', 'skills', 'computer_skills']:
-                        if value:
-                            resume.setdefault(field, []).append(value)
-                    elif field == 'work_experience':
-                        resume.setdefault(field, []).append(value)
-                    else:
-                        resume[field] = value
+            fields, days = _key_tags(key, from_lines) if key else ([], [])
+            if fields or days:
+                items.append((value, fields, days, from_lines))
+        for table in page.get('tables', []):
+            rows = table.get('data', [])
+            all_text.extend(cell for row in rows for cell in row)
+            rows_by_category.setdefault(table.get('category'), []).extend(rows)
+    return {'items': items, 'tables': rows_by_category, 'text': '\n'.join(all_text)}
+
+
+def _resume_full_text(ocr_json) -> str:
+    """NER 分析用的全文：text_blocks 的 key/value 與表格內容"""
+    return _index_resume(ocr_json)['text']
+
+
+def structure_resume_from_ocr_json(ocr_json):
+    """
+    新版結構化函式，將 OCR JSON 直接轉成 resume dict，支援 key-value 配對。
+    可直接傳入 OCRProcessor.process_file 的結果（記憶體中的 dict），涵蓋所有頁面。
+    """
+    index = _index_resume(ocr_json)
+    return _build_resume(index, get_nlp()(index['text']))
+
+
+def structure_resumes(ocr_jsons: Iterable[Dict[str, Any]], batch_size: int = None,
+                      n_process: int = None) -> Iterator[Dict[str, Any]]:
+    """
+    批次版 structure_resume_from_ocr_json：以 nlp.pipe 一次處理多份履歷的 NER，
+    n_process > 1 時使用多個行程。依輸入順序逐一產生 resume dict。
+    """
+    nlp = get_nlp()
+    pairs = ((index['text'], index) for index in map(_index_resume, ocr_jsons))
+    for doc, index in nlp.pipe(pairs, as_tuples=True,
+                               batch_size=batch_size or NLP_BATCH_SIZE,
+                               n_process=n_process or NLP_N_PROCESS):
+        yield _build_resume(index, doc)
+
+
+def _build_resume(index, doc):
+    """依 _index_resume 的索引萃取欄位，並附上 doc 的 NER 結果"""
+    resume = {}
+    available_times = {}
+    intros = []
+
+    # 基本資料萃取（用 key 來判斷）、可配合時段、自傳/自我介紹
+    # OCR 行：value 經 _field_value 清理，沒有值的標籤只建立空欄位，不會覆蓋先前已取得的值；
+    # text_blocks：value 原樣保留，後出現的覆蓋先前的值（與原本的輸出相同）
+    for raw_value, fields, days, from_lines in index['items']:
+        for field in fields:
+            value = _field_value(field, raw_value) if from_lines else raw_value
+            if value is None:
+                continue
+            keep = bool(value) or not from_lines
+            # 多欄位支援（如多個語言、證照等）
+            if field in _LIST_FIELDS:
+                if value:
+                    resume.setdefault(field, []).append(value)
+            elif field == 'work_experience':
+                if keep:
+                    resume.setdefault(field, []).append(value)
+            elif keep or field not in resume:
+                resume[field] = value
+            if field == 'self_intro' and keep:
+                intros.append(value)
+        for day in days:
+            value = raw_value.strip(_LABEL_STRIP) if from_lines else raw_value
+            if value or not from_lines or day not in available_times:
+                available_times[day] = value
 
     # 技能（表格）
-    skills = []
-    for table in tables:
-        if table.get('category') == 'skills':
-            for row in table.get('data', []):
-                if row and row[0]:
-                    skills.append(row[0])
+    tables = index['tables']
+    skills = [row[0] for row in tables.get('skills', []) if row and row[0]]
     if skills:
         resume.setdefault('skills', []).extend(skills)
 
-    # 工作經歷（表格）
-    work_exp = []
-    for table in tables:
-        if table.get('category') == 'work_experience':
-            for row in table.get('data', []):
-                work_exp.append(row)
-    if work_exp:
-        resume['work_experience_table'] = work_exp
-
-    # 語言能力（表格）
-    languages = []
-    for table in tables:
-        if table.get('category') == 'language':
-            for row in table.get('data', []):
-                languages.append(row)
-    if languages:
-        resume['languages_table'] = languages
-
-    # 電腦技能（表格）
-    computer_skills = []
-    for table in tables:
-        if table.get('category') == 'computer_skills':
-            for row in table.get('data', []):
-                computer_skills.append(row)
-    if computer_skills:
-        resume['computer_skills_table'] = computer_skills
-
-    # 證照（表格）
-    certificates = []
-    for table in tables:
-        if table.get('category') == 'certificate':
-            for row in table.get('data', []):
-                certificates.append(row)
-    if certificates:
-        resume['certificates_table'] = certificates
-
-    # 可配合時段（表格）
-    available_times = {}
-    days = ['週一', '週二', '週三', '週四', '週五', '週六', '週日']
-    for block in blocks:
-        for item in block.get('content', []):
-            key = item.get('key', '')
-            value = item.get('value', '')
-            for day in days:
-                if day in key:
-                    available_times[day] = value
+    # 工作經歷、語言能力、電腦技能、證照（表格）
+    for category, out_field in _TABLE_FIELDS:
+        rows = tables.get(category)
+        if rows:
+            resume[out_field] = list(rows)
+
     if available_times:
         resume['available_times'] = available_times
-
-    # 自傳/自我介紹
-    intros = []
-    for block in blocks:
-        for item in block.get('content', []):
-            key = item.get('key', '')
-            value = item.get('value', '')
-            if any(kw in key for kw in keywords['self_intro']):
-                intros.append(value)
     if intros:
         resume['self_intro'] = '\n'.join(intros)
 
     # 加入 NLP 分析重點
+    key_points = [{'text': ent.text, 'label': ent.label_} for ent in doc.ents]
     if key_points:
         resume['key_points'] = key_points
 
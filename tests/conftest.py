@@ -0,0 +1,66 @@
+"""測試共用的設定與假 Azure client（不連網、不讀取本機環境變數中的快取 / 前處理設定）"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from ocr_processor import OCRConfig, PollingPolicy
+
+
+class FakeVisionClient:
+    """
+    假的 ComputerVisionClient：上傳後 delay 秒完成，結果為一行「檔案內容」文字。
+    記錄同時進行中的 Read 數量峰值；內容以 b"fail" 開頭的檔案回傳 failed。
+    """
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.uploads = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def read_in_stream(self, stream, raw=True, **kwargs):
+        data = stream.read()
+        with self._lock:
+            self.uploads += 1
+            op_id = str(self.uploads)
+            self._operations[op_id] = (data, time.monotonic() + self.delay)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return SimpleNamespace(headers={"Operation-Location": f"https://fake/operations/{op_id}"})
+
+    def get_read_result(self, operation_id, raw=False, **kwargs):
+        data, ready_at = self._operations[operation_id]
+        if time.monotonic() < ready_at:
+            return SimpleNamespace(status="running")
+        with self._lock:
+            if self._operations.pop(operation_id, None) is not None:
+                self.in_flight -= 1
+        if data.startswith(b"fail"):
+            return SimpleNamespace(status="failed")
+        text = data.decode("utf-8", "replace").strip()
+        line = SimpleNamespace(text=text, bounding_box=[10, 10, 200, 10, 200, 30, 10, 30])
+        page = SimpleNamespace(page=1, lines=[line])
+        return SimpleNamespace(status="succeeded", analyze_result=SimpleNamespace(read_results=[page]))
+
+
+@pytest.fixture
+def ocr_config(tmp_path):
+    config = OCRConfig()
+    config.ocr_backend = "azure"
+    config.enable_cache = False
+    config.enable_llm_cache = False
+    config.enable_preprocess = False
+    config.pdf_text_layer = False
+    config.scoring_mode = "off"
+    config.cache_dir = str(tmp_path / "ocr_cache")
+    config.llm_cache_dir = str(tmp_path / "llm_cache")
+    config.polling = PollingPolicy(initial_delay=0.01, delay_per_mb=0.0, backoff=1.0, max_delay=0.01, timeout=10.0)
+    return config
+
+
+@pytest.fixture
+def fake_vision_client():
+    return FakeVisionClient(delay=0.05)
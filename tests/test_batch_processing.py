@@ -0,0 +1,37 @@
+"""OCRProcessor.process_files 的批次並行：以假 client 驗證並行上限與單檔失敗不影響其他檔案"""
+from ocr_processor import OCRProcessor
+
+
+def make_files(tmp_path, contents):
+    paths = []
+    for i, content in enumerate(contents):
+        path = tmp_path / f"resume_{i}.png"
+        path.write_bytes(content)
+        paths.append(str(path))
+    return paths
+
+
+def test_process_files_caps_concurrent_reads(tmp_path, ocr_config, fake_vision_client):
+    paths = make_files(tmp_path, [f"履歷 {i}".encode() for i in range(8)])
+    processor = OCRProcessor(ocr_config, client=fake_vision_client)
+    results = {path: (success, result) for path, success, result in processor.process_files(paths, max_workers=3)}
+    assert set(results) == set(paths)
+    assert all(success for success, _ in results.values())
+    assert results[paths[5]][1]["pages"][0]["page_text"] == "履歷 5"
+    assert fake_vision_client.uploads == 8
+    assert 1 < fake_vision_client.max_in_flight <= 3
+
+
+def test_process_files_single_worker_is_sequential(tmp_path, ocr_config, fake_vision_client):
+    paths = make_files(tmp_path, [b"a", b"b", b"c"])
+    processor = OCRProcessor(ocr_config, client=fake_vision_client)
+    assert len(list(processor.process_files(paths, max_workers=1))) == 3
+    assert fake_vision_client.max_in_flight == 1
+
+
+def test_process_files_isolates_failures(tmp_path, ocr_config, fake_vision_client):
+    paths = make_files(tmp_path, [b"ok 1", b"fail", b"ok 2"])
+    paths.append(str(tmp_path / "notes.txt"))
+    processor = OCRProcessor(ocr_config, client=fake_vision_client)
+    status = {path: success for path, success, _ in processor.process_files(paths, max_workers=2)}
+    assert status == {paths[0]: True, paths[1]: False, paths[2]: True, paths[3]: False}
@@ -0,0 +1,73 @@
+"""DiskCache：寫入時不每次掃描目錄，超出上限才淘汰到上限的一定比例；TTL 以 created 計"""
+import json
+import os
+import time
+
+from ocr_processor import DiskCache
+
+
+def _count_scans(cache, monkeypatch):
+    scans = []
+    original = cache._entries
+
+    def counting():
+        scans.append(1)
+        return original()
+
+    monkeypatch.setattr(cache, "_entries", counting)
+    return scans
+
+
+def test_put_scans_only_when_over_limit(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_entries=10)
+    scans = _count_scans(cache, monkeypatch)
+    for i in range(10):
+        cache.put(f"k{i}", {"value": i})
+    # 只有第一次寫入掃描目錄以建立筆數估計
+    assert len(scans) == 1
+    cache.put("k10", {"value": 10})
+    assert len(scans) == 2
+    assert len(os.listdir(tmp_path)) == 9
+    # 淘汰後留有空間，下一次寫入不再掃描
+    cache.put("k11", {"value": 11})
+    assert len(scans) == 2
+
+
+def test_eviction_keeps_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_entries=3)
+    for i in range(3):
+        cache.put(f"k{i}", {"value": i})
+        os.utime(os.path.join(tmp_path, f"k{i}.json"), (1000 + i, 1000 + i))
+    cache.put("k3", {"value": 3})
+    assert not cache.contains("k0")
+    assert cache.contains("k3")
+
+
+def test_overwrite_does_not_grow_count(tmp_path, monkeypatch):
+    cache = DiskCache(str(tmp_path), max_entries=2)
+    scans = _count_scans(cache, monkeypatch)
+    for _ in range(5):
+        cache.put("same", {"value": 1})
+    assert len(scans) == 1
+    assert cache.get("same")["value"] == 1
+
+
+def test_ttl_uses_created_even_when_read(tmp_path):
+    cache = DiskCache(str(tmp_path), max_age=60)
+    cache.put("old", {"created": time.time() - 50, "value": 1})
+    cache.put("new", {"value": 2})
+    # 讀取會更新 mtime（LRU），但不會延長 TTL
+    assert cache.get("old")["value"] == 1
+    cache.max_age = 30
+    cache.evict()
+    assert not cache.contains("old")
+    assert cache.contains("new")
+    assert cache.get("old") is None
+
+
+def test_ttl_reads_created_from_legacy_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), max_age=30)
+    with open(tmp_path / "legacy.json", "w", encoding="utf-8") as f:
+        json.dump({"result": {"score": 1}, "created": time.time() - 50}, f)
+    cache.evict()
+    assert not cache.contains("legacy")
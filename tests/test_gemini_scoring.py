@@ -0,0 +1,109 @@
+"""Gemini 評分：注入假 client 驗證共用 client、429/503 重試與行程共用的 rate limiter"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from ocr_processor import OCRProcessor, TokenBucket, get_gemini_rate_limiter
+
+
+class FakeGenaiClient:
+    """依序回傳 responses 中的項目：Exception 會被拋出，字串當成回應文字"""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+        self._lock = threading.Lock()
+        self.models = SimpleNamespace(generate_content=self.generate_content)
+
+    def generate_content(self, model, contents, config):
+        with self._lock:
+            self.calls.append((model, contents, config))
+            item = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        if isinstance(item, Exception):
+            raise item
+        return SimpleNamespace(text=item)
+
+
+@pytest.fixture
+def scoring_config(ocr_config):
+    # 每個測試用不同的 RPM，避免共用到其他測試的 limiter 狀態
+    ocr_config.gemini_rpm = 60000.0 + id(ocr_config) % 1000
+    ocr_config.gemini_tpm = 0.0
+    ocr_config.gemini_max_retries = 3
+    return ocr_config
+
+
+def test_transient_error_pauses_shared_limiter_and_retries(scoring_config):
+    client = FakeGenaiClient([RuntimeError("429 RESOURCE_EXHAUSTED, retry in 0.02s"),
+                              '{"score": 80, "reason": "內容完整"}'])
+    processor = OCRProcessor(scoring_config, client=None, genai_client=client)
+    result = processor._gemini_score_resume("王小明 工作經歷 五年")
+    assert result["score"] == 80
+    assert len(client.calls) == 2
+    assert client.calls[0][0] == scoring_config.gemini_model
+    limiter = get_gemini_rate_limiter(scoring_config.gemini_rpm, scoring_config.gemini_tpm)
+    assert limiter.requests.paused_until > 0
+
+
+def test_non_transient_error_is_not_retried(scoring_config):
+    client = FakeGenaiClient([ValueError("400 INVALID_ARGUMENT")])
+    processor = OCRProcessor(scoring_config, client=None, genai_client=client)
+    result = processor._gemini_score_resume("履歷")
+    assert result["error"] is True
+    assert len(client.calls) == 1
+
+
+def test_retries_are_bounded(scoring_config):
+    scoring_config.gemini_max_retries = 2
+    client = FakeGenaiClient([RuntimeError("503 UNAVAILABLE")])
+    processor = OCRProcessor(scoring_config, client=None, genai_client=client)
+    result = processor._gemini_score_resume("履歷")
+    assert result["error"] is True
+    assert len(client.calls) == 2
+
+
+def test_threads_share_one_client(scoring_config):
+    client = FakeGenaiClient(['{"score": 70, "reason": "ok"}'])
+    processor = OCRProcessor(scoring_config, client=None, genai_client=client)
+    threads = [threading.Thread(target=processor._gemini_score_resume, args=(f"履歷 {i}",)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert processor._get_genai_client() is client
+    assert len(client.calls) == 6
+
+
+def test_rate_limiter_is_shared_per_quota():
+    assert get_gemini_rate_limiter(123, 0) is get_gemini_rate_limiter(123.0, 0.0)
+    assert get_gemini_rate_limiter(123, 0) is not get_gemini_rate_limiter(124, 0)
+
+
+def test_token_bucket_waits_after_burst():
+    bucket = TokenBucket(per_minute=60, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    # 第三個 token 需等約 1 秒（每分鐘 60 個）
+    assert 0.9 < bucket.reserve() <= 1.0
+    bucket.pause(5)
+    assert bucket.reserve() >= 4.9
+
+
+def test_resume_score_reports_llm_cache_per_call(scoring_config):
+    scoring_config.enable_llm_cache = True
+    client = FakeGenaiClient(['{"score": 70, "reason": "ok"}'])
+    processor = OCRProcessor(scoring_config, client=None, genai_client=client)
+    pages = [{"formatted_text": "姓名: 王小明\n工作經歷: 五年", "total_lines": 2}]
+    first = processor._score_resume(pages)
+    second = processor._score_resume(pages)
+    assert first["llm_cache"] == {"enabled": True, "text": "miss", "vision": None}
+    assert second["llm_cache"] == {"enabled": True, "text": "hit", "vision": None}
+    assert len(client.calls) == 1
+    assert processor.llm_cache.counters()["hits"] == 1
+
+
+def test_resume_score_reports_disabled_llm_cache(scoring_config):
+    client = FakeGenaiClient(['{"score": 70, "reason": "ok"}'])
+    processor = OCRProcessor(scoring_config, client=None, genai_client=client)
+    result = processor._score_resume([{"formatted_text": "履歷", "total_lines": 1}])
+    assert result["llm_cache"] == {"enabled": False, "text": None, "vision": None}
@@ -0,0 +1,161 @@
+"""增量匯入：IngestManifest 的變更偵測（含原地覆寫）與 watch 迴圈的定期完整比對"""
+import os
+import time
+
+import pytest
+
+import quickstart
+from ingest_manifest import IngestManifest
+from ocr_processor import OCRProcessor
+
+EXTS = [".png", ".pdf"]
+
+
+@pytest.fixture
+def manifest(tmp_path):
+    m = IngestManifest(str(tmp_path / "manifest.sqlite3"))
+    yield m
+    m.close()
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+def overwrite_in_place(path, data):
+    """同一個 inode 重寫內容（cp 到既有檔案的行為），資料夾 mtime 不變"""
+    before = os.stat(path)
+    with open(path, "r+b") as f:
+        f.write(data)
+        f.truncate()
+    # 確保 mtime 與先前不同（部分檔案系統的時間解析度較粗），且不在未來（pending 會略過仍在寫入的檔案）
+    os.utime(path, ns=(before.st_atime_ns, before.st_mtime_ns - 1_000_000_000))
+
+
+def settle(manifest):
+    for path in manifest.pending():
+        manifest.mark_done(path, manifest.claim(path))
+
+
+def test_scan_detects_new_changed_and_removed(tmp_path, manifest):
+    root = tmp_path / "assets"
+    a = write(root / "a.png", b"a")
+    write(root / "sub" / "b.pdf", b"b")
+    write(root / "notes.txt", b"x")
+    assert manifest.scan(str(root), EXTS)["new"] == 2
+    settle(manifest)
+
+    stats = manifest.scan(str(root), EXTS)
+    assert (stats["listed"], stats["new"], stats["changed"]) == (0, 0, 0)
+
+    os.remove(a)
+    write(root / "sub" / "c.png", b"c")
+    stats = manifest.scan(str(root), EXTS)
+    assert (stats["new"], stats["removed"]) == (1, 1)
+    assert manifest.pending() == [str(root / "sub" / "c.png")]
+
+
+def test_overwrite_in_listed_directory_is_detected(tmp_path, manifest):
+    root = tmp_path / "assets"
+    a = write(root / "a.png", b"old")
+    manifest.scan(str(root), EXTS)
+    settle(manifest)
+    inode = os.stat(a).st_ino
+    overwrite_in_place(a, b"new content")
+    # 同一資料夾另有新檔案，資料夾會重新列舉；a.png 雖然 inode 相同也必須 stat
+    write(root / "b.png", b"b")
+    assert os.stat(a).st_ino == inode
+    stats = manifest.scan(str(root), EXTS)
+    assert (stats["new"], stats["changed"]) == (1, 1)
+    assert a in manifest.pending()
+
+
+def test_overwrite_in_unchanged_directory_needs_full_scan(tmp_path, manifest):
+    root = tmp_path / "assets"
+    a = write(root / "a.png", b"old")
+    manifest.scan(str(root), EXTS)
+    settle(manifest)
+    assert manifest.full_scan_due(300)
+    overwrite_in_place(a, b"new content")
+    assert manifest.scan(str(root), EXTS)["changed"] == 0
+    assert manifest.scan(str(root), EXTS, full=True)["changed"] == 1
+    assert not manifest.full_scan_due(300)
+    assert not manifest.full_scan_due(0)
+    assert manifest.last_full_scan() <= time.time()
+
+
+def test_claim_skips_unchanged_content(tmp_path, manifest):
+    root = tmp_path / "assets"
+    a = write(root / "a.png", b"same")
+    manifest.scan(str(root), EXTS)
+    settle(manifest)
+    overwrite_in_place(a, b"same")
+    manifest.scan(str(root), EXTS, full=True)
+    assert manifest.pending() == [a]
+    assert manifest.claim(a) is None
+    assert manifest.pending() == []
+
+
+def test_one_shot_incremental_does_not_rescan(tmp_path, monkeypatch, ocr_config, fake_vision_client):
+    monkeypatch.chdir(tmp_path)
+    ocr_config.ingest_settle_seconds = 0
+    ocr_config.ingest_mode = "incremental"
+    ocr_config.ingest_full_rescan_interval = 0.001
+    ocr_config.ingest_manifest_path = str(tmp_path / "m.sqlite3")
+    processor = OCRProcessor(ocr_config, client=fake_vision_client)
+    try:
+        folder = tmp_path / "assets"
+        a = write(folder / "a.png", b"first")
+        quickstart.run_incremental(processor, str(folder))
+        overwrite_in_place(a, b"second")
+        time.sleep(0.01)
+        # 已超過完整比對間隔，但一次性的執行不完整比對（啟動成本固定）
+        quickstart.run_incremental(processor, str(folder))
+        assert fake_vision_client.uploads == 1
+    finally:
+        processor.close()
+
+
+class _FakeWatcher:
+    """不回報任何事件的監看器，wait 呼叫 rounds 次後以 KeyboardInterrupt 結束 watch 迴圈"""
+    uses_events = False
+
+    def __init__(self, folder, rounds):
+        self.rounds = rounds
+
+    def wait(self, timeout):
+        self.rounds -= 1
+        if self.rounds < 0:
+            raise KeyboardInterrupt
+        time.sleep(0.01)
+        return []
+
+    def close(self):
+        pass
+
+
+def test_watch_loop_rescans_periodically(tmp_path, monkeypatch, ocr_config, fake_vision_client):
+    monkeypatch.chdir(tmp_path)
+    ocr_config.ingest_settle_seconds = 0
+    ocr_config.ingest_mode = "watch"
+    ocr_config.ingest_manifest_path = str(tmp_path / "m.sqlite3")
+    processor = OCRProcessor(ocr_config, client=fake_vision_client)
+    try:
+        folder = tmp_path / "assets"
+        a = write(folder / "a.png", b"first")
+        monkeypatch.setattr(quickstart, "FolderWatcher", lambda folder: _FakeWatcher(folder, 2))
+        ocr_config.ingest_full_rescan_interval = 300
+        quickstart.run_incremental(processor, str(folder))
+        assert fake_vision_client.uploads == 1
+
+        overwrite_in_place(a, b"second")
+        # 尚未到完整比對的時間：資料夾 mtime 沒變，看不到原地覆寫
+        quickstart.run_incremental(processor, str(folder))
+        assert fake_vision_client.uploads == 1
+        ocr_config.ingest_full_rescan_interval = 0.001
+        quickstart.run_incremental(processor, str(folder))
+        assert fake_vision_client.uploads == 2
+    finally:
+        processor.close()
@@ -0,0 +1,77 @@
+"""FileManager 的輸出格式：各 profile / 壓縮寫出後讀回須與原結果相同，讀取端（結構化、CER 評估）也要能讀"""
+import json
+import os
+
+import pytest
+
+import resume_structurer
+from ocr_processor import FileManager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE = os.path.join(ROOT, "ocr_output_8c00e5b121248d30e6ba0846e8701808d8713d35.json")
+
+FORMATS = [("full", "none"), ("full", "gzip"), ("compact", "none"), ("compact", "gzip"),
+           ("compact", "zstd"), ("msgpack", "none"), ("msgpack", "zstd")]
+
+
+@pytest.fixture
+def sample():
+    with open(SAMPLE, encoding="utf-8") as f:
+        data = json.load(f)
+    # 內附的輸出是在 Windows 上產生的，換成本機路徑讓預設檔名可預期
+    data["file_path"] = os.path.join("assets", "resume.jpg")
+    return data
+
+
+def require(profile, compression):
+    if profile == "msgpack":
+        pytest.importorskip("msgpack")
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+
+
+@pytest.mark.parametrize("profile,compression", FORMATS)
+def test_round_trip(tmp_path, monkeypatch, sample, profile, compression):
+    require(profile, compression)
+    monkeypatch.chdir(tmp_path)
+    path = FileManager.save_results(sample, profile=profile, compression=compression)
+    assert FileManager.output_format(path)[1:] == (profile, compression)
+    assert FileManager.load_results(path) == sample
+    assert FileManager.find_results("resume") == os.path.join(".", path)
+
+
+def test_compact_restores_structured_lines(sample):
+    # grouped_lines 與 reading_order_lines 相同的頁面，compact 會省略 grouped/structured_lines
+    page = {"page_number": 1, "reading_order_lines": ["姓名: 王小明", "手機: 0912345678"],
+            "grouped_lines": ["姓名: 王小明", "手機: 0912345678"],
+            "structured_lines": ["姓名: 王小明", "手機: 0912345678"],
+            "page_text": "姓名: 王小明\n手機: 0912345678", "total_lines": 2}
+    data = FileManager.encode_results({"file_path": "a.png", "pages": [page]}, "compact")
+    assert "structured_lines" not in json.loads(data)["pages"][0]
+    assert FileManager.decode_results(data, "compact")["pages"][0] == page
+
+
+def test_jsonl_pages_are_expanded(tmp_path):
+    page = {"page_number": 1, "reading_order_lines": ["a", "b"]}
+    records = [{"type": "header", "file_path": "x.pdf", "total_pages": 1}, {"type": "page", **page},
+               {"type": "footer", "timings": {}}]
+    path = FileManager.write_results_jsonl(records, str(tmp_path / "ocr_output_x.jsonl"))
+    loaded = FileManager.load_results(path)["pages"][0]
+    assert loaded["structured_lines"] == ["a", "b"] and loaded["page_text"] == "a\nb"
+
+
+def test_structurer_reads_compact_output(tmp_path, monkeypatch, sample):
+    monkeypatch.setattr(resume_structurer, "structure_resume_from_ocr_json",
+                        lambda ocr_json: {"lines": sum(len(p["structured_lines"]) for p in ocr_json["pages"])})
+    path = FileManager.save_results(sample, str(tmp_path / "ocr_output_x.compact.json.gz"))
+    out = FileManager.convert_to_structured_with_resume_structurer(path, str(tmp_path / "structured.json"))
+    with open(out, encoding="utf-8") as f:
+        assert json.load(f)["lines"] == sum(len(p["structured_lines"]) for p in sample["pages"])
+
+
+def test_error_rate_reads_compact_output(tmp_path, sample):
+    pytest.importorskip("pdfplumber")
+    pytest.importorskip("bs4")
+    import error_rate
+    path = FileManager.save_results(sample, str(tmp_path / "ocr_output_x.compact.json.gz"))
+    assert error_rate.extract_ocr_pages(path) == [p["page_text"] for p in sample["pages"]]
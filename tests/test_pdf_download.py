@@ -0,0 +1,175 @@
+"""error_rate 的 PDF 下載：以本機 ThreadingHTTPServer 驗證條件式請求、續傳、416 與爬蟲流程"""
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("pdfplumber")
+requests = pytest.importorskip("requests")
+
+import error_rate  # noqa: E402
+
+LAST_MODIFIED = "Mon, 05 Oct 2026 08:00:00 GMT"
+
+
+class PdfServer:
+    """
+    提供 /list、/dataset/<n>（各含一個 PDF 連結）與 /files/<name>.pdf。
+    PDF 支援 ETag / If-None-Match、Range / If-Range；always_416 時所有 Range 請求都回 416。
+    """
+    def __init__(self):
+        self.files = {}
+        self.requests = []
+        self.always_416 = False
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server.requests.append((self.path, dict(self.headers)))
+                if self.path == "/list":
+                    links = "".join(f'<a href="/dataset/{i}">d{i}</a>' for i in range(len(server.files)))
+                    return self._send(200, f"<html>{links}</html>".encode(), "text/html")
+                if self.path.startswith("/dataset/"):
+                    name = sorted(server.files)[int(self.path.rsplit("/", 1)[1])]
+                    return self._send(200, f'<a href="/files/{name}">pdf</a>'.encode(), "text/html")
+                name = self.path.rsplit("/", 1)[1]
+                if name not in server.files:
+                    return self._send(404, b"")
+                data = server.files[name]
+                etag = '"%s"' % hashlib.md5(data).hexdigest()
+                headers = {"ETag": etag, "Last-Modified": LAST_MODIFIED}
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, None, headers=headers)
+                range_header = self.headers.get("Range")
+                if range_header and server.always_416:
+                    return self._send(416, b"")
+                if range_header and self.headers.get("If-Range") == etag:
+                    start = int(range_header.split("=")[1].rstrip("-"))
+                    if start >= len(data):
+                        return self._send(416, b"")
+                    headers["Content-Range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+                    return self._send(206, data[start:], headers=headers)
+                return self._send(200, data, headers=headers)
+
+            def _send(self, status, body, content_type="application/pdf", headers=None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                if body is not None:
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+
+    def range_requests(self):
+        return [headers.get("Range") for path, headers in self.requests if headers.get("Range")]
+
+
+@pytest.fixture
+def pdf_server():
+    server = PdfServer()
+    server.thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+@pytest.fixture
+def session():
+    with error_rate.make_session(pool_size=4, retries=0) as s:
+        yield s
+
+
+def fetch(session, server, dest, name="a.pdf"):
+    pdf = {"url": f"{server.url}/files/{name}", "filename": str(dest / name), "source": "test"}
+    return error_rate.download_pdf(session, pdf, error_rate.PdfSources(str(dest)), chunk_size=1024)
+
+
+def test_download_then_not_modified_then_changed(pdf_server, session, tmp_path):
+    pdf_server.files["a.pdf"] = b"%PDF-1.4 first" * 500
+    assert fetch(session, pdf_server, tmp_path) == "downloaded"
+    assert (tmp_path / "a.pdf").read_bytes() == pdf_server.files["a.pdf"]
+    assert not (tmp_path / "a.pdf.part").exists()
+    record = json.loads((tmp_path / error_rate.SOURCES_FILE).read_text(encoding="utf-8"))[0]
+    assert record["complete"] is True and record["etag"] and record["last_modified"] == LAST_MODIFIED
+
+    assert fetch(session, pdf_server, tmp_path) == "not_modified"
+
+    pdf_server.files["a.pdf"] = b"%PDF-1.4 second" * 500
+    assert fetch(session, pdf_server, tmp_path) == "downloaded"
+    assert (tmp_path / "a.pdf").read_bytes() == pdf_server.files["a.pdf"]
+
+
+def test_resume_partial_download(pdf_server, session, tmp_path):
+    data = pdf_server.files["a.pdf"] = os.urandom(5000)
+    etag = '"%s"' % hashlib.md5(data).hexdigest()
+    error_rate.PdfSources(str(tmp_path)).update(f"{pdf_server.url}/files/a.pdf", etag=etag, complete=False)
+    (tmp_path / "a.pdf.part").write_bytes(data[:1234])
+    assert fetch(session, pdf_server, tmp_path) == "resumed"
+    assert pdf_server.range_requests() == ["bytes=1234-"]
+    assert (tmp_path / "a.pdf").read_bytes() == data
+
+
+def test_changed_file_restarts_instead_of_resuming(pdf_server, session, tmp_path):
+    pdf_server.files["a.pdf"] = b"new content" * 300
+    error_rate.PdfSources(str(tmp_path)).update(f"{pdf_server.url}/files/a.pdf", etag='"stale"', complete=False)
+    (tmp_path / "a.pdf.part").write_bytes(b"old content")
+    assert fetch(session, pdf_server, tmp_path) == "downloaded"
+    assert (tmp_path / "a.pdf").read_bytes() == pdf_server.files["a.pdf"]
+
+
+def test_416_discards_part_and_retries_once(pdf_server, session, tmp_path):
+    data = pdf_server.files["a.pdf"] = b"%PDF short"
+    etag = '"%s"' % hashlib.md5(data).hexdigest()
+    error_rate.PdfSources(str(tmp_path)).update(f"{pdf_server.url}/files/a.pdf", etag=etag, complete=False)
+    # .part 比伺服器上的檔案還長：Range 超出範圍 -> 416
+    (tmp_path / "a.pdf.part").write_bytes(b"x" * 100)
+    assert fetch(session, pdf_server, tmp_path) == "downloaded"
+    assert (tmp_path / "a.pdf").read_bytes() == data
+
+
+def test_416_without_part_file(pdf_server, session, tmp_path, monkeypatch):
+    # 沒有 .part 仍收到 416（伺服器行為異常）：不可因 os.remove 找不到檔案而失敗，且只重試一次
+    pdf_server.files["a.pdf"] = b"%PDF data"
+    calls = []
+
+    class Response:
+        status_code = 416
+        headers = {}
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def raise_for_status(self):
+            raise requests.HTTPError("416")
+
+    monkeypatch.setattr(session, "get", lambda *a, **kw: calls.append(kw) or Response())
+    with pytest.raises(requests.HTTPError):
+        fetch(session, pdf_server, tmp_path)
+    assert len(calls) == 2
+
+
+def test_crawl_gov_pdfs(pdf_server, tmp_path):
+    for name in ("a.pdf", "b.pdf", "c.pdf"):
+        pdf_server.files[name] = f"%PDF {name}".encode() * 200
+    pdfs = error_rate.crawl_gov_pdfs(f"{pdf_server.url}/list", str(tmp_path), max_files=2, workers=2)
+    assert [os.path.basename(p["filename"]) for p in pdfs] == ["a.pdf", "b.pdf"]
+    assert {p["status"] for p in pdfs} == {"downloaded"}
+    assert (tmp_path / "b.pdf").read_bytes() == pdf_server.files["b.pdf"]
+    again = error_rate.crawl_gov_pdfs(f"{pdf_server.url}/list", str(tmp_path), max_files=2, workers=2)
+    assert {p["status"] for p in again} == {"not_modified"}
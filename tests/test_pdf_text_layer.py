@@ -0,0 +1,71 @@
+"""PDF 文字層：座標與 Azure 的 PDF 結果同為 inch，混用兩種來源的 PDF 以相同尺度群組化"""
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import ocr_backends
+from ocr_processor import OCRProcessor
+from tests.conftest import FakeVisionClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDF = os.path.join(ROOT, "assets", "1.pdf")
+
+pytestmark = pytest.mark.skipif(ocr_backends.pdfplumber is None, reason="未安裝 pdfplumber")
+
+
+def _line(text, top, left=1.0, right=3.0, height=0.15):
+    return SimpleNamespace(text=text, bounding_box=[left, top, right, top, right, top + height, left, top + height])
+
+
+class InchVisionClient(FakeVisionClient):
+    """模擬 Azure 對 PDF 的回應：座標單位為 inch"""
+    def get_read_result(self, operation_id, raw=False, **kwargs):
+        with self._lock:
+            if self._operations.pop(operation_id, None) is not None:
+                self.in_flight -= 1
+        lines = [_line("姓名", 1.0, 1.0, 1.5), _line("王小明", 1.01, 2.0, 3.0), _line("手機 0912345678", 1.4)]
+        page = SimpleNamespace(page=2, unit="inch", width=8.27, height=11.69, lines=lines)
+        return SimpleNamespace(status="succeeded", analyze_result=SimpleNamespace(read_results=[page]))
+
+
+def test_text_layer_is_in_inches():
+    page, chars = ocr_backends.pdf_text_layer(PDF)[0]
+    assert page["unit"] == "inch"
+    assert 5 < page["width"] < 20
+    assert all(0 <= l["bounding_box"][0] <= page["width"] for l in page["lines"])
+
+
+def test_row_tolerance_follows_page_unit(ocr_config):
+    processor = OCRProcessor(ocr_config, client=None)
+    assert processor._row_tolerance(SimpleNamespace(unit="pixel")) == ocr_config.y_tolerance
+    inch = processor._row_tolerance(SimpleNamespace(unit="inch"))
+    assert inch == ocr_config.y_tolerance / ocr_config.y_tolerance_dpi
+    # 快取還原的 SDK 列舉字串
+    assert processor._row_tolerance(SimpleNamespace(unit="TextRecognitionResultDimensionUnit.inch")) == inch
+
+
+def test_mixed_source_pdf(monkeypatch, ocr_config):
+    # 第 1 頁有文字層，第 2 頁視為掃描頁交給 OCR
+    counts = ocr_backends.pdf_text_char_counts(PDF)
+    monkeypatch.setattr(ocr_backends, "pdf_text_char_counts", lambda path: [counts[0], 0])
+    ocr_config.pdf_text_layer = True
+    client = InchVisionClient()
+    processor = OCRProcessor(ocr_config, client=client)
+    try:
+        ok, out = processor.process_file(PDF, score=False)
+    finally:
+        processor.close()
+    assert ok
+    assert [r["source"] for r in out["routing"]] == ["text_layer", "ocr"]
+    text_page, ocr_page = out["pages"]
+    # OCR 頁：同一列的「姓名」與「王小明」合併，下一列的手機獨立
+    assert ocr_page["grouped_lines"] == ["姓名 王小明", "手機 0912345678"]
+    # 文字層頁：與換算成 300 DPI 像素、以 y_tolerance 群組的結果相同
+    layer = ocr_backends.pdf_text_layer(PDF)[0][0]
+    scale = ocr_config.y_tolerance_dpi
+    pixels = {**layer, "unit": "pixel",
+              "lines": [{**l, "bounding_box": [v * scale for v in l["bounding_box"]]} for l in layer["lines"]]}
+    expected = processor.process_page(ocr_backends.pages_to_read_results([pixels])[0], 1)
+    assert text_page["grouped_lines"] == expected["grouped_lines"]
+    assert len(text_page["grouped_lines"]) > 10
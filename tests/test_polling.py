@@ -0,0 +1,37 @@
+"""Azure Read 輪詢策略：Retry-After 下限與 timeout=0 不限制"""
+
+from ocr_backends import AzureReadBackend
+from ocr_processor import PollingPolicy
+
+
+def test_retry_after_zero_keeps_backoff():
+    policy = PollingPolicy(initial_delay=0.5, backoff=2.0, max_delay=5.0)
+    assert policy.next_delay(0.5, retry_after=0.0) == 1.0
+    assert policy.next_delay(0.5, retry_after=0.01) == 1.0
+
+
+def test_longer_retry_after_is_respected():
+    policy = PollingPolicy(initial_delay=0.5, backoff=2.0, max_delay=5.0)
+    assert policy.next_delay(0.5, retry_after=8.0) == 8.0
+    ignoring = PollingPolicy(initial_delay=0.5, backoff=2.0, max_delay=5.0, respect_retry_after=False)
+    assert ignoring.next_delay(0.5, retry_after=8.0) == 1.0
+
+
+def test_zero_timeout_waits_until_done(fake_vision_client):
+    policy = PollingPolicy(initial_delay=0.01, delay_per_mb=0.0, backoff=1.0, max_delay=0.01, timeout=0)
+    backend = AzureReadBackend(fake_vision_client, policy)
+    pages, meta = backend.read("resume.txt", data=b"hello")
+    assert "error" not in meta
+    assert pages[0].lines[0].text == "hello"
+    assert meta["polling"]["polls"] > 1
+    assert not meta["polling"]["timed_out"]
+
+
+def test_positive_timeout_still_expires(fake_vision_client):
+    fake_vision_client.delay = 5.0
+    policy = PollingPolicy(initial_delay=0.01, delay_per_mb=0.0, backoff=1.0, max_delay=0.01, timeout=0.05)
+    backend = AzureReadBackend(fake_vision_client, policy)
+    pages, meta = backend.read("resume.txt", data=b"hello")
+    assert pages is None
+    assert meta["polling"]["timed_out"]
+    assert "逾時" in meta["error"]
@@ -0,0 +1,50 @@
+"""影像前處理：預設維持 full/fixed，auto 編碼不讓上傳量超過原本的預設"""
+import os
+
+import pytest
+
+import ocr_processor
+from ocr_processor import OCRConfig, preprocess_image
+
+ASSETS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+
+pytestmark = pytest.mark.skipif(ocr_processor.cv2 is None, reason="未安裝 opencv-python")
+
+
+def test_default_profile_is_legacy(monkeypatch):
+    monkeypatch.delenv("OCR_PREPROCESS_PROFILE", raising=False)
+    monkeypatch.delenv("OCR_PREPROCESS_ENCODE", raising=False)
+    settings = OCRConfig().preprocess
+    assert settings["profile"] == "full"
+    assert settings["encode"] == "fixed"
+
+
+@pytest.mark.parametrize("name", ["9660cd698cca3ac3.png", "food_service_resume_sample.png"])
+def test_auto_never_uploads_more_than_full(name):
+    path = os.path.join(ASSETS, name)
+    base = {**OCRConfig().preprocess, "save_image": False}
+    legacy, _ = preprocess_image(path, {**base, "profile": "full", "encode": "fixed"})
+    data, info = preprocess_image(path, {**base, "profile": "auto", "encode": "auto"})
+    assert data is not None
+    assert len(data) <= len(legacy) < os.path.getsize(path)
+    assert info["bytes"] == len(data)
+    assert info["profile"] in ocr_processor.PREPROCESS_PROFILES + ("gray",)
+
+
+def test_explicit_none_keeps_smaller_original():
+    path = os.path.join(ASSETS, "dd7df4cfc15d7a615ee112596477761f.jpg")
+    base = {**OCRConfig().preprocess, "save_image": False}
+    data, info = preprocess_image(path, {**base, "profile": "none", "encode": "auto"})
+    # 灰階重新編碼不比原 JPEG 小，維持上傳原檔
+    assert data is None
+    assert info["profile"] == "none"
+
+
+def test_grayscale_reencode_is_labelled():
+    path = os.path.join(ASSETS, "9660cd698cca3ac3.png")
+    base = {**OCRConfig().preprocess, "save_image": False}
+    data, info = preprocess_image(path, {**base, "profile": "none", "encode": "auto"})
+    # 灰階重新編碼比原 PNG 小：上傳的不是原檔，profile 不可標成 none
+    assert data is not None
+    assert info["profile"] == "gray"
+    assert info["bytes"] < info["original_bytes"]
@@ -0,0 +1,162 @@
+"""resume_structurer 的欄位萃取：以專案內附的 ocr_output_*.json 做回歸檢查（不需要 spaCy 模型）"""
+import glob
+import json
+import os
+import re
+from types import SimpleNamespace
+
+import pytest
+
+import resume_structurer as rs
+from keyword_matcher import KeywordMatcher
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OUTPUTS = sorted(glob.glob(os.path.join(ROOT, "ocr_output_*.json")))
+NO_ENTITIES = SimpleNamespace(ents=[])
+
+
+def structure(ocr_json):
+    return rs._build_resume(rs._index_resume(ocr_json), NO_ENTITIES)
+
+
+def load(name):
+    with open(os.path.join(ROOT, name), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def page(*lines):
+    return {"pages": [{"structured_lines": list(lines)}]}
+
+
+@pytest.mark.parametrize("path", OUTPUTS, ids=os.path.basename)
+def test_bundled_outputs_have_no_sentence_fields(path):
+    with open(path, encoding="utf-8") as f:
+        resume = structure(json.load(f))
+    for field, value in resume.items():
+        values = value if isinstance(value, list) else [value]
+        for v in values:
+            if not isinstance(v, str):
+                continue
+            # 不應出現只有標點、或以句中標點開頭的片段
+            assert not v or v[0] not in rs._CLAUSE_PUNCT, (field, v)
+            if field not in rs._PROSE_FIELDS:
+                assert "。" not in v, (field, v)
+    if "email" in resume:
+        assert re.fullmatch(r"[\w.+-]+@[\w.-]+", resume["email"])
+
+
+@pytest.mark.parametrize("name", ["ocr_output_1.json", "ocr_output_2.json"])
+def test_free_text_does_not_create_fields(name):
+    # 英文段落中的 'age'（language、page...）與沒有標籤的句子都不是欄位
+    assert "age" not in structure(load(name))
+
+
+def test_bundled_food_service_resume():
+    resume = structure(load("ocr_output_8c00e5b121248d30e6ba0846e8701808d8713d35.json"))
+    assert resume["name"] == "Y小編"
+    assert resume["phone"] == "0922222222"
+    assert resume["email"] == "yy@kmail.tw"
+    assert resume["address"] == "台北市大安區沒有路一段123號"
+    # 表頭列「職稱 時間 工作概述」只有標籤沒有值
+    assert resume["job_title"] == ""
+    assert "skills" not in resume
+    assert resume["license"] == "重型機車駕照"
+
+
+def test_year_range_is_not_a_phone():
+    resume = structure(load("ocr_output_dd7df4cfc15d7a615ee112596477761f.json"))
+    assert resume["phone"] == "+01 2345 6789 02"
+
+
+def test_empty_label_does_not_overwrite_value():
+    resume = structure(page("姓名: 王小明", "姓名", "手機: 0912345678", "電話: ", "可配合時段"))
+    assert resume["name"] == "王小明"
+    assert resume["phone"] == "0912345678"
+    assert resume["available_time"] == ""
+
+
+def test_unlabeled_lines_are_text_only():
+    index = rs._index_resume(page("I manage a team of engineers", "language: English, Japanese"))
+    assert [fields for _, fields, _, _ in index["items"]] == [["language"]]
+    assert "I manage a team of engineers" in index["text"]
+
+
+def test_nested_keyword_counts_once():
+    # '語言能力' 不再同時命中 '能力'（skills）
+    assert rs._key_tags("語言能力") == (["language"], [])
+
+
+def _original_structure(ocr_json):
+    """加入 structured_lines 支援之前的 structure_resume_from_ocr_json（NER 結果為空），作為 text_blocks 的對照"""
+    page = ocr_json['pages'][0]
+    blocks = page.get('text_blocks', [])
+    tables = page.get('tables', [])
+    resume = {}
+    items = [(item.get('key', ''), item.get('value', '')) for block in blocks for item in block.get('content', [])]
+    for key, value in items:
+        for field, kw_list in rs.KEYWORDS.items():
+            if any(kw in key for kw in kw_list):
+                if field in ['language', 'certificate', 'skills', 'computer_skills']:
+                    if value:
+                        resume.setdefault(field, []).append(value)
+                elif field == 'work_experience':
+                    resume.setdefault(field, []).append(value)
+                else:
+                    resume[field] = value
+    skills = [row[0] for table in tables if table.get('category') == 'skills'
+              for row in table.get('data', []) if row and row[0]]
+    if skills:
+        resume.setdefault('skills', []).extend(skills)
+    for category, out_field in rs._TABLE_FIELDS:
+        rows = [row for table in tables if table.get('category') == category for row in table.get('data', [])]
+        if rows:
+            resume[out_field] = rows
+    available_times = {}
+    for key, value in items:
+        for day in rs.DAYS:
+            if day in key:
+                available_times[day] = value
+    if available_times:
+        resume['available_times'] = available_times
+    intros = [value for key, value in items if any(kw in key for kw in rs.KEYWORDS['self_intro'])]
+    if intros:
+        resume['self_intro'] = '\n'.join(intros)
+    return resume
+
+
+def _text_blocks(pairs, tables=()):
+    return {"pages": [{"text_blocks": [{"content": [{"key": k, "value": v} for k, v in pairs]}],
+                       "tables": list(tables)}]}
+
+
+def test_text_blocks_match_original_implementation():
+    doc = _text_blocks([
+        ("專長與技能", "Python"), ("Email 信箱", "聯絡請寄 yy@kmail.tw。"), ("年齡 age", "30"),
+        ("工作經歷", ""), ("工作經歷", "2020 - 2023 門市人員"), ("自傳", ""), ("自傳", "我是一個人。很好"),
+        ("地址", "台北市 電話 02"), ("Phone", "0912345678"), ("language skills", "English"),
+        ("週一", "上午"), ("週一", ""), ("姓名", "王小明"), ("姓名", ""),
+    ], tables=[{"category": "skills", "data": [["Excel", "熟練"]]},
+               {"category": "language", "data": [["英文", "中等"]]}])
+    resume = structure(doc)
+    assert resume == _original_structure(doc)
+    assert resume["self_intro"] == "\n我是一個人。很好"
+    assert resume["address"] == "台北市 電話 02"
+    assert resume["available_times"] == {"週一": ""}
+
+
+@pytest.mark.parametrize("path", OUTPUTS, ids=os.path.basename)
+def test_bundled_lines_as_text_blocks_match_original(path):
+    # 把內附輸出的「key: value」行改成舊版 text_blocks，兩種實作的結果應相同
+    with open(path, encoding="utf-8") as f:
+        page = json.load(f)["pages"][0]
+    pairs = [line.partition(": ")[::2] for line in page.get("structured_lines") or []]
+    doc = _text_blocks(pairs, page.get("tables", []))
+    assert structure(doc) == _original_structure(doc)
+
+
+def test_keyword_matcher_word_boundary():
+    matcher = KeywordMatcher([("age", "age"), ("年齡", "age")], word_boundary=True)
+    assert matcher.tags("language page") == set()
+    assert matcher.tags("Age: 30".lower()) == {"age"}
+    assert matcher.tags("年齡30") == {"age"}
+    assert KeywordMatcher([("age", "age")]).tags("language") == {"age"}
@@ -0,0 +1,81 @@
+"""串流輸出（OCR_STREAM_OUTPUT）與背景評分、結構化的整合，以假 client 執行"""
+import os
+
+import pytest
+
+import quickstart
+import resume_structurer
+from ocr_processor import FileManager, OCRProcessor, ResumeScoringStage
+
+
+@pytest.fixture
+def stream_processor(tmp_path, monkeypatch, ocr_config, fake_vision_client):
+    monkeypatch.chdir(tmp_path)
+    ocr_config.stream_output = True
+    processor = OCRProcessor(ocr_config, client=fake_vision_client)
+    yield processor
+    processor.close()
+
+
+def test_stream_with_deferred_scoring(tmp_path, stream_processor, monkeypatch):
+    stream_processor.config.scoring_mode = "deferred"
+    scored = []
+
+    def fake_score(pages, file_path=None, gemini_score=None):
+        scored.append(pages)
+        return {"score": 42}
+
+    monkeypatch.setattr(stream_processor, "_score_resume", fake_score)
+    path = tmp_path / "resume.png"
+    path.write_bytes("姓名: 王小明".encode())
+    scorer = ResumeScoringStage(stream_processor)
+    success, filename = quickstart.process_single_file(stream_processor, str(path), scorer)
+    scorer.close(wait=True)
+
+    assert success and filename == "ocr_output_resume.jsonl"
+    assert scorer.stats()["completed"] == 1
+    # 評分只拿到每頁所需的欄位
+    assert set(scored[0][0]) == set(OCRProcessor.SCORE_PAGE_KEYS)
+    result = FileManager.load_results(filename)
+    assert result["resume_score"]["score"] == 42
+    assert result["resume_score"]["status"] == "done"
+    assert result["pages"][0]["page_text"] == "姓名: 王小明"
+    assert "timings" in result
+
+
+def test_stream_error_output_is_named_after_input(stream_processor):
+    success, error = quickstart.process_single_file(stream_processor, "missing_resume.png")
+    assert not success and "missing_resume.png" in error
+    assert os.path.exists("ocr_output_missing_resume.jsonl")
+    assert not os.path.exists("ocr_output_ocr_output.jsonl")
+
+
+def test_stream_structures_resume(tmp_path, stream_processor, monkeypatch):
+    stream_processor.config.structure_resume = True
+    seen = []
+
+    def fake_structure(ocr_json):
+        seen.append(ocr_json)
+        return {"name": "王小明"}
+
+    monkeypatch.setattr(resume_structurer, "structure_resume_from_ocr_json", fake_structure)
+    path = tmp_path / "cv.png"
+    path.write_bytes("姓名: 王小明".encode())
+    success, _ = quickstart.process_single_file(stream_processor, str(path))
+    assert success
+    assert seen[0]["pages"][0]["structured_lines"] == ["姓名: 王小明"]
+    assert os.path.exists("resume_structured_cv.json")
+
+
+def test_batch_mode_streams_each_file(tmp_path, stream_processor):
+    stream_processor.config.batch_workers = 3
+    paths = []
+    for name in ("a", "b", "c"):
+        path = tmp_path / f"{name}.png"
+        path.write_bytes(f"姓名: {name}".encode())
+        paths.append(str(path))
+    outcomes = quickstart.process_files(stream_processor, paths)
+    assert sorted(detail for _, success, detail in outcomes if success) == [
+        "ocr_output_a.jsonl", "ocr_output_b.jsonl", "ocr_output_c.jsonl"]
+    assert FileManager.load_results("ocr_output_b.jsonl")["pages"][0]["page_text"] == "姓名: b"
+    assert not any(name.endswith(".json") for name in os.listdir(tmp_path))
@@ -0,0 +1,42 @@
+"""TesseractBackend：多個執行緒同時第一次讀 PDF 時只建立一個行程池"""
+import threading
+import time
+
+import ocr_backends
+from ocr_backends import TesseractBackend
+
+
+class SlowPool:
+    """建立時稍作停頓，放大同時建立的時間窗"""
+    created = []
+
+    def __init__(self, max_workers):
+        time.sleep(0.02)
+        SlowPool.created.append(self)
+        self.shut_down = False
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_executor_is_created_once_across_threads(monkeypatch):
+    SlowPool.created = []
+    monkeypatch.setattr(ocr_backends, "ProcessPoolExecutor", SlowPool)
+    backend = TesseractBackend(workers=2)
+    barrier = threading.Barrier(8)
+    pools = []
+
+    def worker():
+        barrier.wait()
+        pools.append(backend._executor())
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(SlowPool.created) == 1
+    assert all(pool is SlowPool.created[0] for pool in pools)
+    backend.close()
+    assert SlowPool.created[0].shut_down
+    assert backend._pool is None
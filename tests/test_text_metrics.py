@@ -0,0 +1,87 @@
+"""text_metrics.levenshtein 與教科書 DP 的隨機比對，以及 CER/WER 與逐頁對齊"""
+import random
+
+import pytest
+
+import text_metrics
+
+# 含 BMP 外字元（emoji、CJK 擴充 B 區），確認以 code point 而非 UTF-16 單位計算
+ALPHABETS = ["ab", "abcde", "的一是在不了有人", "a😀𠀀b𝔘"]
+
+
+def plain_distance(a, b):
+    """不依賴 text_metrics 的 O(m*n) 動態規劃"""
+    rows = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) + 1):
+        rows[i][0] = i
+    for j in range(len(b) + 1):
+        rows[0][j] = j
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            rows[i][j] = min(rows[i - 1][j] + 1, rows[i][j - 1] + 1,
+                             rows[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+    return rows[-1][-1]
+
+
+def random_text(rng, max_len):
+    alphabet = rng.choice(ALPHABETS)
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, max_len)))
+
+
+@pytest.mark.parametrize("max_len", [8, 70, 200])
+def test_levenshtein_matches_plain_dp(max_len):
+    # 70、200 讓 pattern 超過 64 字元（一個機器字組）
+    rng = random.Random(max_len)
+    for _ in range(300 if max_len < 100 else 60):
+        a, b = random_text(rng, max_len), random_text(rng, max_len)
+        assert text_metrics.levenshtein(a, b) == plain_distance(a, b), (a, b)
+
+
+def test_levenshtein_max_distance():
+    rng = random.Random(7)
+    for _ in range(400):
+        a, b = random_text(rng, 90), random_text(rng, 90)
+        expected = plain_distance(a, b)
+        limit = rng.randint(0, expected + 3)
+        got = text_metrics.levenshtein(a, b, max_distance=limit)
+        assert got == (expected if expected <= limit else limit + 1), (a, b, limit)
+
+
+def test_levenshtein_edge_cases():
+    assert text_metrics.levenshtein("", "") == 0
+    assert text_metrics.levenshtein("", "abc") == 3
+    assert text_metrics.levenshtein("履歷表", "") == 3
+    assert text_metrics.levenshtein("", "abc", max_distance=1) == 2
+    assert text_metrics.levenshtein("😀", "😁") == 1
+    assert text_metrics.levenshtein("a" * 65, "a" * 64 + "b") == 1
+    assert text_metrics.levenshtein("x" + "a" * 130, "a" * 130 + "x") == 2
+
+
+def test_levenshtein_on_token_lists():
+    rng = random.Random(3)
+    words = ["OCR", "履歷", "Python", "😀", "資料"]
+    for _ in range(200):
+        a = [rng.choice(words) for _ in range(rng.randint(0, 80))]
+        b = [rng.choice(words) for _ in range(rng.randint(0, 80))]
+        assert text_metrics.levenshtein(a, b) == plain_distance(a, b)
+
+
+def test_reference_distance_agrees():
+    rng = random.Random(11)
+    for _ in range(100):
+        a, b = random_text(rng, 40), random_text(rng, 40)
+        assert text_metrics.reference_distance(a, b) == plain_distance(a, b)
+
+
+def test_cer_and_wer():
+    assert text_metrics.cer("履歷表", "履厲表") == (1 / 3, 1, 3)
+    assert text_metrics.wer("a b c d", "a x c") == (0.5, 2, 4)
+    assert text_metrics.cer("", "") == (0.0, 0, 0)
+
+
+def test_document_metrics_aligns_missing_page():
+    gt = ["第一頁 內容", "第二頁 內容", "第三頁 內容"]
+    ocr = ["第一頁 內容", "第三頁 內容"]
+    metrics = text_metrics.document_metrics(gt, ocr)
+    assert metrics["char_distance"] == len(gt[1])
+    assert [(p["gt_page"], p["ocr_page"]) for p in metrics["pages"]] == [(0, 0), (1, None), (2, 1)]